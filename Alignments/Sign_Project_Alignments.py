@@ -1,401 +1,214 @@
+"""
+Sign Project Alignments
+
+Richard Brice, PE
+WSDOT Bridge and Structures Office
+
+Builds the horizontal alignments of the sign project from a table (Sign_Project_Alignments.csv) instead of hand coding
+each segment. Each row of the table is a segment
+Alignment - name of the alignment, the rows of an alignment are in stationing order
+Description, Prefix, X, Y - description, line prefix (C for C Line), and coordinates of the start of the alignment, given
+    on the first row of the alignment
+Type - LINE, CIRCULARARC, or CLOTHOID
+StartStation, StartPoint, EndStation, EndPoint - stations and point types (AP, PC, PT, ...) of the ends of the segment.
+    The segment length is EndStation - StartStation
+Bearing - quadrant bearing at the start of the segment, such as S 89 04 44.0 E. When blank, the segment is tangent to the
+    end of the previous segment
+StartRadius, EndRadius - radius of curvature, positive for a curve to the left and negative for a curve to the right.
+    Blank or 0 is a tangent. The end radius of a CIRCULARARC is its start radius
+
+The start point and direction of every segment, in every alignment, are computed together by chain_segments. The
+change in direction of a segment is its length times the average curvature, and the direction at the start of each
+segment is a cumulative sum of the changes that restarts at each given bearing. The chord of each segment is closed form
+for lines and arcs and Gauss-Legendre quadrature for clothoids, and the start points are a cumulative sum of the chords
+that restarts at each alignment. The end points computed by the geometry kernel are compared with the chained end points.
+
+python Sign_Project_Alignments.py --tables Sign_Project_Alignments.csv --output Alignments.ifc
+"""
+
+import argparse
+import csv
 import math
+import os
 import ifcopenshell
 import ifcopenshell.api.alignment
-import ifcopenshell.api.unit
 import ifcopenshell.api.cogo
+import ifcopenshell.api.context
+import ifcopenshell.api.unit
+import ifcopenshell.guid
+import ifcopenshell.util.unit
 import numpy as np
 
-from ifcopenshell import ifcopenshell_wrapper
-
-def print_segment_end_points(file:ifcopenshell.file,curve):
+FOLDER = os.path.dirname(os.path.abspath(__file__))
+SEGMENT_TYPES = ["LINE","CIRCULARARC","CLOTHOID"]
+
+# Gauss-Legendre quadrature on [0,1] for the chords of clothoids
+GAUSS_NODES, GAUSS_WEIGHTS = np.polynomial.legendre.leggauss(10)
+GAUSS_NODES = (GAUSS_NODES + 1.)/2.
+GAUSS_WEIGHTS = GAUSS_WEIGHTS/2.
+
+
+def station_text(station):
+    # 10130.9 -> 101+30.90
+    hundreds = int(round(station,2)//100)
+    return f"{hundreds}+{station - 100*hundreds:05.2f}"
+
+
+def _number(value,default=0.):
+    value = value.strip() if value else ""
+    return float(value) if value else default
+
+
+def _curvature(radius):
+    # 0 is an infinite radius
+    return np.divide(1.,radius,out=np.zeros_like(radius),where=radius != 0.)
+
+
+def read_alignments(file_paths):
+    # returns a list of alignments, each a dictionary with its name, description, prefix, start point, and segment rows
+    alignments = {}
+    for file_path in file_paths:
+        with open(file_path,mode='r',newline='',encoding='utf-8-sig') as f:
+            for row in csv.DictReader(f):
+                name = row["Alignment"].strip()
+                if not name:
+                    continue
+                alignment = alignments.get(name)
+                if alignment is None:
+                    alignment = alignments[name] = {
+                        "name":name,
+                        "description":row["Description"].strip(),
+                        "prefix":row["Prefix"].strip() or name.split()[0],
+                        "x":_number(row["X"]),
+                        "y":_number(row["Y"]),
+                        "segments":[],
+                    }
+                segment_type = row["Type"].strip().upper()
+                if segment_type not in SEGMENT_TYPES:
+                    raise ValueError(f"{name} segment type {row['Type']} is not one of {SEGMENT_TYPES}")
+                start_station = _number(row["StartStation"])
+                end_station = _number(row["EndStation"])
+                if end_station <= start_station:
+                    raise ValueError(f"{name} segment at {station_text(start_station)} ends at {station_text(end_station)}")
+                segments = alignment["segments"]
+                if segments and not math.isclose(segments[-1]["end_station"],start_station,abs_tol=0.005):
+                    print(f"Warning: {name} segment at {station_text(start_station)} does not start at the end of the previous segment ({station_text(segments[-1]['end_station'])})")
+                start_radius = _number(row["StartRadius"])
+                end_radius = start_radius if segment_type == "CIRCULARARC" else _number(row["EndRadius"])
+                segments.append({
+                    "type":segment_type,
+                    "start_station":start_station,
+                    "start_point":row["StartPoint"].strip(),
+                    "end_station":end_station,
+                    "end_point":row["EndPoint"].strip(),
+                    "bearing":row["Bearing"].strip(),
+                    "start_radius":0. if segment_type == "LINE" else start_radius,
+                    "end_radius":0. if segment_type == "LINE" else end_radius,
+                })
+    return list(alignments.values())
+
+
+def chain_segments(group,length,bearing,start_radius,end_radius,x,y):
+    # group - alignment index of each segment, the segments of an alignment are consecutive
+    # bearing - direction (radians) at the start of each segment, NaN when tangent to the previous segment
+    # x, y - start point of each alignment
+    # returns the start point and direction and the end point and direction of each segment
+    count = len(length)
+    index = np.arange(count)
+    first = np.ones(count,dtype=bool)
+    first[1:] = group[1:] != group[:-1]
+    given = ~np.isnan(bearing)
+    if np.any(first & ~given):
+        raise ValueError("the first segment of an alignment must have a bearing")
+
+    start_curvature = _curvature(start_radius)
+    end_curvature = _curvature(end_radius)
+    turn = length*(start_curvature + end_curvature)/2.
+    turned = np.cumsum(turn) - turn
+    since = np.maximum.accumulate(np.where(given,index,0))
+    start_direction = np.mod(bearing[since] + turned - turned[since],2.*np.pi)
+
+    # chords of lines and arcs, 2R sin(turn/2) at half the turn
+    chord = length*np.sinc(turn/(2.*np.pi))
+    dx = chord*np.cos(start_direction + turn/2.)
+    dy = chord*np.sin(start_direction + turn/2.)
+    spiral = start_curvature != end_curvature
+    if np.any(spiral):
+        s = length[spiral,None]*GAUSS_NODES
+        k0 = start_curvature[spiral,None]
+        k1 = end_curvature[spiral,None]
+        theta = start_direction[spiral,None] + k0*s + (k1 - k0)*s*s/(2.*length[spiral,None])
+        dx[spiral] = length[spiral]*(np.cos(theta) @ GAUSS_WEIGHTS)
+        dy[spiral] = length[spiral]*(np.sin(theta) @ GAUSS_WEIGHTS)
+
+    start = np.maximum.accumulate(np.where(first,index,0))
+    before_x = np.cumsum(dx) - dx
+    before_y = np.cumsum(dy) - dy
+    start_x = x[group] + before_x - before_x[start]
+    start_y = y[group] + before_y - before_y[start]
+    return start_x, start_y, start_direction, start_x + dx, start_y + dy, np.mod(start_direction + turn,2.*np.pi)
+
+
+def build_alignments(file,alignments,tolerance=0.01):
+    # adds the alignments to file, returns the IfcAlignments
     unit_scale = ifcopenshell.util.unit.calculate_unit_scale(file)
-    s = ifcopenshell.geom.settings()
-    for segment in curve.Segments:
-        function_item = ifcopenshell_wrapper.map_shape(s, segment.wrapped_data)
-        evaluator = ifcopenshell_wrapper.function_item_evaluator(s, function_item)
-        start = np.array(evaluator.evaluate(function_item.start()))
-        end = np.array(evaluator.evaluate(function_item.end()))
-        sx = float(start[0,3])/unit_scale
-        sy = float(start[1,3])/unit_scale
-        ex = float(end[0,3])/unit_scale
-        ey = float(end[1,3])/unit_scale
-        print(segment)
-        print(f"S ({sx},{sy})")
-        print(f"E ({ex},{ey})")
-
-def SR104(file:ifcopenshell.file):
-    unit_scale = ifcopenshell.util.unit.calculate_unit_scale(file)
-
-    alignment = ifcopenshell.api.alignment.create(file,"C Line",start_station=10000.)
-    alignment.Description = "SR 104 (205th)"
-
-    layout = ifcopenshell.api.alignment.get_horizontal_layout(alignment)
-
-    # C 100+00 to C 101+30.90 AP
-    segment1 = file.createIfcAlignmentHorizontalSegment(
-        StartPoint=file.createIfcCartesianPoint(Coordinates=((0.,0.))), # Actual coordinate unknown
-        StartDirection=math.radians(ifcopenshell.api.cogo.bearing2dd("S 89 04 44.0 E")),
-        StartRadiusOfCurvature=0.0,
-        EndRadiusOfCurvature=0.0,
-        SegmentLength=10130.90-10000.0,
-        PredefinedType = "LINE"
-    )
-
-    end = ifcopenshell.api.alignment.create_layout_segment(file,layout,segment1)
-    layout.IsNestedBy[0].RelatedObjects[0].Description = "C 100+00 to C 101+30.90 AP"
-
-    x = float(end[0,3])/unit_scale
-    y = float(end[1,3])/unit_scale
-
-    # C 101+30.90 AP to C 110+97.92 AP
-    segment2 = file.createIfcAlignmentHorizontalSegment(
-        StartPoint=file.createIfcCartesianPoint(Coordinates=((x,y))),
-        StartDirection=math.radians(ifcopenshell.api.cogo.bearing2dd("S 88 41 52 E")),
-        StartRadiusOfCurvature=0.0,
-        EndRadiusOfCurvature=0.0,
-        SegmentLength=11097.92 - 10130.90,
-        PredefinedType = "LINE"
-    )
-
-    end = ifcopenshell.api.alignment.create_layout_segment(file,layout,segment2)
-    layout.IsNestedBy[0].RelatedObjects[1].Description = "C 101+30.90 AP to C 110+97.92 AP"
-
-    x = float(end[0,3])/unit_scale
-    y = float(end[1,3])/unit_scale
-
-    # C 110+97.92 AP to C 118+97.92 AP
-    segment3 = file.createIfcAlignmentHorizontalSegment(
-        StartPoint=file.createIfcCartesianPoint(Coordinates=((x,y))),
-        StartDirection=math.radians(ifcopenshell.api.cogo.bearing2dd("S 89 43 44.7 E")),
-        StartRadiusOfCurvature=0.0,
-        EndRadiusOfCurvature=0.0,
-        SegmentLength=11897.92 - 11097.92,
-        PredefinedType = "LINE"
-    )
-
-    end = ifcopenshell.api.alignment.create_layout_segment(file,layout,segment3)
-    layout.IsNestedBy[0].RelatedObjects[2].Description = "C 110+97.92 AP to C 118+97.92 AP"
-
-    x = float(end[0,3])/unit_scale
-    y = float(end[1,3])/unit_scale
-
-    # C 118+97.92 AP to C 129+16.76 PC
-    segment4 = file.createIfcAlignmentHorizontalSegment(
-        StartPoint=file.createIfcCartesianPoint(Coordinates=((x,y))),
-        StartDirection=math.radians(ifcopenshell.api.cogo.bearing2dd("S 87 47 11 E")),
-        StartRadiusOfCurvature=0.0,
-        EndRadiusOfCurvature=0.0,
-        SegmentLength=12916.76-11897.92,
-        PredefinedType = "LINE"
-    )
-
-    end = ifcopenshell.api.alignment.create_layout_segment(file,layout,segment4)
-    layout.IsNestedBy[0].RelatedObjects[3].Description = "C 118+97.92 AP to C 129+16.76 PC"
-
-    x = float(end[0,3])/unit_scale
-    y = float(end[1,3])/unit_scale
-    dx = float(end[0,0])
-    dy = float(end[1,0])
-    dir = math.atan2(dy,dx)
-
-    # C 129+16.76 PC to C 130+62.84 PT
-    segment5 = file.createIfcAlignmentHorizontalSegment(
-        StartPoint=file.createIfcCartesianPoint(Coordinates=((x,y))),
-        StartDirection=dir,
-        StartRadiusOfCurvature= -1375.10,
-        EndRadiusOfCurvature= -1375.10,
-        SegmentLength=13062.84 - 12916.76,
-        PredefinedType = "CIRCULARARC"
-    )
-
-    end = ifcopenshell.api.alignment.create_layout_segment(file,layout,segment5)
-    layout.IsNestedBy[0].RelatedObjects[4].Description = "C 129+16.76 PC to C 130+62.84 PT"
-
-    x = float(end[0,3])/unit_scale
-    y = float(end[1,3])/unit_scale
-    dx = float(end[0,0])
-    dy = float(end[1,0])
-    dir = math.atan2(dy,dx)
-
-
-    # C 130+62.84 PT to C 131+93.61 PC
-    segment6 = file.createIfcAlignmentHorizontalSegment(
-        StartPoint=file.createIfcCartesianPoint(Coordinates=((x,y))),
-        StartDirection=dir,
-        StartRadiusOfCurvature=0.0,
-        EndRadiusOfCurvature=0.0,
-        SegmentLength=13193.61 - 12916.76,
-        PredefinedType = "LINE"
-    )
-
-    end = ifcopenshell.api.alignment.create_layout_segment(file,layout,segment6)
-    layout.IsNestedBy[0].RelatedObjects[5].Description = "C 130+62.84 PT to C 131+93.61 PC"
-
-    x = float(end[0,3])/unit_scale
-    y = float(end[1,3])/unit_scale
-    dx = float(end[0,0])
-    dy = float(end[1,0])
-    dir = math.atan2(dy,dx)
-
-    # C 131+93.61 PC to C 133+42.33 PT
-    segment7 = file.createIfcAlignmentHorizontalSegment(
-        StartPoint=file.createIfcCartesianPoint(Coordinates=((x,y))),
-        StartDirection=dir,
-        StartRadiusOfCurvature=1399.95,
-        EndRadiusOfCurvature=1399.95,
-        SegmentLength=13342.33 - 13193.61,
-        PredefinedType = "CIRCULARARC"
-    )
-
-    end = ifcopenshell.api.alignment.create_layout_segment(file,layout,segment7)
-    layout.IsNestedBy[0].RelatedObjects[6].Description = "C 131+93.61 PC to C 133+42.33 PT"
-
-    x = float(end[0,3])/unit_scale
-    y = float(end[1,3])/unit_scale
-    dx = float(end[0,0])
-    dy = float(end[1,0])
-    dir = math.atan2(dy,dx)
-
-    # C 133+42.33 PT to C 141+06.12 AP
-    segment8 = file.createIfcAlignmentHorizontalSegment(
-        StartPoint=file.createIfcCartesianPoint(Coordinates=((x,y))),
-        StartDirection=dir,
-        StartRadiusOfCurvature=0,
-        EndRadiusOfCurvature=0,
-        SegmentLength=14106.12 - 13342.33,
-        PredefinedType = "LINE"
-    )
-
-    end = ifcopenshell.api.alignment.create_layout_segment(file,layout,segment8)
-    layout.IsNestedBy[0].RelatedObjects[7].Description = "C 133+42.33 PT to C 141+06.12 AP"
-
-    x = float(end[0,3])/unit_scale
-    y = float(end[1,3])/unit_scale
-
-    # C 141+06.12 AP to C 144+66.90 PC
-    segment9 = file.createIfcAlignmentHorizontalSegment(
-        StartPoint=file.createIfcCartesianPoint(Coordinates=((x,y))),
-        StartDirection=math.radians(ifcopenshell.api.cogo.bearing2dd("S 87 53 41 E")),
-        StartRadiusOfCurvature=0,
-        EndRadiusOfCurvature=0,
-        SegmentLength=14466.90 - 14106.12,
-        PredefinedType = "LINE"
-    )
-
-    end = ifcopenshell.api.alignment.create_layout_segment(file,layout,segment9)
-    layout.IsNestedBy[0].RelatedObjects[8].Description = "C 141+06.12 AP to C 144+66.90 PC"
-
-    x = float(end[0,3])/unit_scale
-    y = float(end[1,3])/unit_scale
-    dx = float(end[0,0])
-    dy = float(end[1,0])
-    dir = math.atan2(dy,dx)
-
-    # C 144+66.90 PC to C 146+33.95 PT
-    segment10 = file.createIfcAlignmentHorizontalSegment(
-        StartPoint=file.createIfcCartesianPoint(Coordinates=((x,y))),
-        StartDirection=dir,
-        StartRadiusOfCurvature=1399.99,
-        EndRadiusOfCurvature=1399.99,
-        SegmentLength=14633.95 - 14466.90,
-        PredefinedType = "CIRCULARARC"
-    )
-
-    end = ifcopenshell.api.alignment.create_layout_segment(file,layout,segment10)
-    layout.IsNestedBy[0].RelatedObjects[9].Description = "C 144+66.90 PC to C 146+33.95 PT"
-
-    x = float(end[0,3])/unit_scale
-    y = float(end[1,3])/unit_scale
-    dx = float(end[0,0])
-    dy = float(end[1,0])
-    dir = math.atan2(dy,dx)
-
-    # C 146+33.95 PT to C 147+94.29 PC
-    segment11 = file.createIfcAlignmentHorizontalSegment(
-        StartPoint=file.createIfcCartesianPoint(Coordinates=((x,y))),
-        StartDirection=dir,
-        StartRadiusOfCurvature=0,
-        EndRadiusOfCurvature=0,
-        SegmentLength=14794.29 - 14633.95,
-        PredefinedType = "LINE"
-    )
-
-    end = ifcopenshell.api.alignment.create_layout_segment(file,layout,segment11)
-    layout.IsNestedBy[0].RelatedObjects[10].Description = "C 146+33.95 PT to C 147+94.29 PC"
-
-    x = float(end[0,3])/unit_scale
-    y = float(end[1,3])/unit_scale
-    dx = float(end[0,0])
-    dy = float(end[1,0])
-    dir = math.atan2(dy,dx)
-
-    # C 147+94.29 PC to C 149+61.35 PT
-    segment12 = file.createIfcAlignmentHorizontalSegment(
-        StartPoint=file.createIfcCartesianPoint(Coordinates=((x,y))),
-        StartDirection=dir,
-        StartRadiusOfCurvature=1400.07,
-        EndRadiusOfCurvature=1400.07,
-        SegmentLength=14961.36 - 14794.29,
-        PredefinedType = "CIRCULARARC"
-    )
-
-    end = ifcopenshell.api.alignment.create_layout_segment(file,layout,segment12)
-    layout.IsNestedBy[0].RelatedObjects[11].Description = "C 147+94.29 PC to C 149+61.35 PT"
-
-    x = float(end[0,3])/unit_scale
-    y = float(end[1,3])/unit_scale
-    dx = float(end[0,0])
-    dy = float(end[1,0])
-    dir = math.atan2(dy,dx)
-
-    # C 149+61.35 PT to C 154+30.09 AP
-    segment13 = file.createIfcAlignmentHorizontalSegment(
-        StartPoint=file.createIfcCartesianPoint(Coordinates=((x,y))),
-        StartDirection=dir,
-        StartRadiusOfCurvature=0,
-        EndRadiusOfCurvature=0,
-        SegmentLength=15430.09 - 14961.36,
-        PredefinedType = "LINE"
-    )
-
-    end = ifcopenshell.api.alignment.create_layout_segment(file,layout,segment13)
-    layout.IsNestedBy[0].RelatedObjects[12].Description = "C 149+61.35 PT to C 154+30.09 AP"
-
-    x = float(end[0,3])/unit_scale
-    y = float(end[1,3])/unit_scale
-    dx = float(end[0,0])
-    dy = float(end[1,0])
-    dir = math.atan2(dy,dx)
-
-    # C 154+30.09 AP to C 170+82.61 AP
-    segment14 = file.createIfcAlignmentHorizontalSegment(
-        StartPoint=file.createIfcCartesianPoint(Coordinates=((x,y))),
-        StartDirection=math.radians(ifcopenshell.api.cogo.bearing2dd("S 88 19 24 E")),
-        StartRadiusOfCurvature=0,
-        EndRadiusOfCurvature=0,
-        SegmentLength= 17082.61 - 15430.09,
-        PredefinedType = "LINE"
-    )
-
-    end = ifcopenshell.api.alignment.create_layout_segment(file,layout,segment14)
-    layout.IsNestedBy[0].RelatedObjects[13].Description = "C 154+30.09 AP to C 170+82.61 AP"
-
-    x = float(end[0,3])/unit_scale
-    y = float(end[1,3])/unit_scale
-    dx = float(end[0,0])
-    dy = float(end[1,0])
-    dir = math.atan2(dy,dx)
-
-    # C 170+82.61 AP to C 176+55.21 PC
-    segment15 = file.createIfcAlignmentHorizontalSegment(
-        StartPoint=file.createIfcCartesianPoint(Coordinates=((x,y))),
-        StartDirection=math.radians(ifcopenshell.api.cogo.bearing2dd("S 88 19 24 E")),
-        StartRadiusOfCurvature=0,
-        EndRadiusOfCurvature=0,
-        SegmentLength= 17655.21 - 17082.61,
-        PredefinedType = "LINE"
-    )
-
-    end = ifcopenshell.api.alignment.create_layout_segment(file,layout,segment15)
-    layout.IsNestedBy[0].RelatedObjects[14].Description = "C 170+82.61 AP to C 176+55.21 PC"
-
-    x = float(end[0,3])/unit_scale
-    y = float(end[1,3])/unit_scale
-    dx = float(end[0,0])
-    dy = float(end[1,0])
-    dir = math.atan2(dy,dx)
-
-    # C 176+55.21 PC to C 183+96.46 PT
-    segment16 = file.createIfcAlignmentHorizontalSegment(
-        StartPoint=file.createIfcCartesianPoint(Coordinates=((x,y))),
-        StartDirection=dir,
-        StartRadiusOfCurvature=-954.93,
-        EndRadiusOfCurvature=-954.93,
-        SegmentLength= 18396.46 - 17655.21,
-        PredefinedType = "CIRCULARARC"
-    )
-
-    end = ifcopenshell.api.alignment.create_layout_segment(file,layout,segment16)
-    layout.IsNestedBy[0].RelatedObjects[15].Description = "C 176+55.21 PC to C 183+96.46 PT"
-
-    x = float(end[0,3])/unit_scale
-    y = float(end[1,3])/unit_scale
-    dx = float(end[0,0])
-    dy = float(end[1,0])
-    dir = math.atan2(dy,dx)
-
-    # C 183+96.46 PT to C 211+77.00
-    segment17 = file.createIfcAlignmentHorizontalSegment(
-        StartPoint=file.createIfcCartesianPoint(Coordinates=((x,y))),
-        StartDirection=dir,
-        StartRadiusOfCurvature=0,
-        EndRadiusOfCurvature=0,
-        SegmentLength= 21177.00 - 18396.46,
-        PredefinedType = "LINE"
-    )
-
-    end = ifcopenshell.api.alignment.create_layout_segment(file,layout,segment17)
-    layout.IsNestedBy[0].RelatedObjects[16].Description = "C 183+96.46 PT to C 211+77.00"
-
-    x = float(end[0,3])/unit_scale
-    y = float(end[1,3])/unit_scale
-    dx = float(end[0,0])
-    dy = float(end[1,0])
-    dir = math.atan2(dy,dx)
-
-
-    ifcopenshell.api.alignment.name_segments("C H",layout)
-    #ifcopenshell.api.alignment.create_segment_representations(file,alignment)
-    #curve = ifcopenshell.api.alignment.get_curve(alignment)
-    #print_segment_end_points(file,curve)
-    #ifcopenshell.api.alignment.util.print_composite_curve_deep(curve)
-
-
-
-def SR99(file : ifcopenshell.file):
-    unit_scale = ifcopenshell.util.unit.calculate_unit_scale(file)
-
-    alignment = ifcopenshell.api.alignment.create(file,"D Line",start_station=9800.)
-    alignment.Description = "SR 99"
-
-    layout = ifcopenshell.api.alignment.get_horizontal_layout(alignment)
-
-    segment1 = file.createIfcAlignmentHorizontalSegment(
-        StartPoint=file.createIfcCartesianPoint(Coordinates=((0.,0.))),
-        StartDirection=math.radians(ifcopenshell.api.cogo.bearing2dd("N 4 11 W")),
-        StartRadiusOfCurvature=0.0,
-        EndRadiusOfCurvature=0.0,
-        SegmentLength=10109.99-9800.,
-        PredefinedType = "LINE"
-    )
-
-    end = ifcopenshell.api.alignment.create_layout_segment(file,layout,segment1)
-
-    x = float(end[0,3])/unit_scale
-    y = float(end[1,3])/unit_scale
-    dx = float(end[0,0])
-    dy = float(end[1,0])
-    dir = math.atan2(dy,dx)
-    segment2 = file.createIfcAlignmentHorizontalSegment(
-        StartPoint=file.createIfcCartesianPoint((x,y)),
-        StartDirection=dir,
-        StartRadiusOfCurvature=-1800.,
-        EndRadiusOfCurvature=-1800.,
-        SegmentLength=1103.09,
-        PredefinedType="CIRCULARARC"
-    )
-    end = ifcopenshell.api.alignment.create_layout_segment(file,layout,segment2)
-
-    ifcopenshell.api.alignment.name_segments("D H",layout)
-
+    segments = [segment for alignment in alignments for segment in alignment["segments"]]
+    group = np.repeat(np.arange(len(alignments)),[len(alignment["segments"]) for alignment in alignments])
+    length = np.array([segment["end_station"] - segment["start_station"] for segment in segments])
+    bearing = np.array([math.radians(ifcopenshell.api.cogo.bearing2dd(segment["bearing"])) if segment["bearing"] else np.nan for segment in segments])
+    start_radius = np.array([segment["start_radius"] for segment in segments])
+    end_radius = np.array([segment["end_radius"] for segment in segments])
+    x = np.array([alignment["x"] for alignment in alignments])
+    y = np.array([alignment["y"] for alignment in alignments])
+    start_x, start_y, start_direction, end_x, end_y, end_direction = chain_segments(group,length,bearing,start_radius,end_radius,x,y)
+
+    ifc_alignments = []
+    i = 0
+    for alignment in alignments:
+        ifc_alignment = ifcopenshell.api.alignment.create(file,alignment["name"])
+        ifc_alignment.Description = alignment["description"]
+        layout = ifcopenshell.api.alignment.get_horizontal_layout(ifc_alignment)
+        prefix = alignment["prefix"]
+        start_station = alignment["segments"][0]["start_station"]
+        ifcopenshell.api.alignment.add_stationing_referent(file,station_text(start_station),ifc_alignment,0.,start_station)
+
+        deviation = 0.
+        for segment in alignment["segments"]:
+            design_parameters = file.createIfcAlignmentHorizontalSegment(
+                StartPoint=file.createIfcCartesianPoint(Coordinates=(float(start_x[i]),float(start_y[i]))),
+                StartDirection=float(start_direction[i]),
+                StartRadiusOfCurvature=segment["start_radius"],
+                EndRadiusOfCurvature=segment["end_radius"],
+                SegmentLength=float(length[i]),
+                PredefinedType=segment["type"]
+            )
+            end = ifcopenshell.api.alignment.create_layout_segment(file,layout,design_parameters)
+            layout.IsNestedBy[0].RelatedObjects[-2].Description = f"{prefix} {station_text(segment['start_station'])} {segment['start_point']}".rstrip() + f" to {prefix} {station_text(segment['end_station'])} {segment['end_point']}".rstrip()
+            if end is not None:
+                deviation = max(deviation,math.hypot(float(end[0,3])/unit_scale - end_x[i],float(end[1,3])/unit_scale - end_y[i]))
+            i += 1
+
+        ifcopenshell.api.alignment.name_segments(f"{prefix} H",layout)
+        # IfcReferents at the key points (P.O.B., P.C., P.T., ...) of the layout
+        ifcopenshell.api.alignment.update_key_point_referents(file,layout)
+        end_station = alignment["segments"][-1]["end_station"]
+        print(f"{alignment['name']}: {len(alignment['segments'])} segments, {station_text(start_station)} to {station_text(end_station)}")
+        if tolerance < deviation:
+            print(f"Warning: {alignment['name']} end points from the geometry kernel are up to {deviation:.4f} from the chained end points")
+        ifc_alignments.append(ifc_alignment)
+    return ifc_alignments
+
+
+def main(tables=None,output=None):
+    tables = tables if tables else [os.path.join(FOLDER,"Sign_Project_Alignments.csv")]
+    output = output if output else os.path.join(FOLDER,"Alignments.ifc")
 
-def main():
     file = ifcopenshell.file(schema="IFC4X3_ADD2")
-    project = file.createIfcProject(GlobalId=ifcopenshell.guid.new(),Name="ADCMS Sign Project")
+    file.createIfcProject(GlobalId=ifcopenshell.guid.new(),Name="ADCMS Sign Project")
     length = ifcopenshell.api.unit.add_conversion_based_unit(file,name="foot")
     ifcopenshell.api.unit.assign_unit(file,units=[length])
     geometric_representation_context = ifcopenshell.api.context.add_context(file, context_type="Model")
-    axis_model_representation_subcontext = ifcopenshell.api.context.add_context(
+    ifcopenshell.api.context.add_context(
         file,
         context_type="Model",
         context_identifier="Axis",
@@ -403,12 +216,15 @@ def main():
         parent=geometric_representation_context,
     )
 
-    SR104(file)
-    SR99(file)
+    build_alignments(file,read_alignments(tables))
 
-    ifcopenshell.file.write(file,"C:/Users/bricer/OneDrive - Washington State Department of Transportation/BIM for Infrastructure/Signs/Alignments/Alignments.ifc")
-    #ifcopenshell.file.write(file,"C:/Users/rickb/OneDrive - Washington State Department of Transportation/BIM for Infrastructure/Signs/Alignments/Alignments.ifc")
+    file.write(output)
+    print(f"{output} written")
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Build the sign project alignments from a table of segments")
+    parser.add_argument("--tables",nargs="+",default=None,help="CSV tables of alignment segments (default Sign_Project_Alignments.csv)")
+    parser.add_argument("--output",default=None,help="IFC file (default Alignments.ifc in this folder)")
+    args = parser.parse_args()
+    main(args.tables,args.output)
@@ -0,0 +1,222 @@
+"""
+Script to build all of the sign models
+
+Richard Brice, PE
+WSDOT Bridge and Structures Office
+
+The models depend on each other. MUTCD_Sign_Library.ifc is used to build All_Way_Stop.ifc and Signs.ifc, and its
+foot variant MUTCD_Sign_Library_foot.ifc is used to build Test_Corridor_Signs.ifc and Signs_with_Linear_Placement.ifc.
+This script declares those dependencies and
+1) hashes the inputs of each build (data files, upstream models, the build script, and the local modules it imports)
+2) skips builds whose inputs haven't changed since the last build and whose outputs are still as they were built
+3) runs builds that don't depend on each other at the same time
+
+IFC files are hashed without the file header (timestamps) and GlobalIds. The sign library has the same GlobalIds in
+every build, the other models create new GlobalIds but are only rebuilt if their content actually changed.
+
+The hashes are kept in .build_cache.json
+
+Usage:
+python Build_All.py [targets] [--force] [--jobs N] [--dry-run]
+"""
+
+import argparse
+import concurrent.futures
+import hashlib
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+import ifcopenshell.ifcopenshell_wrapper
+
+
+CACHE_FILE = ".build_cache.json"
+
+# name -> (script and arguments, inputs, outputs)
+# the upstream builds are found by matching inputs to outputs
+BUILDS = {
+    "library":("Build_Sign_Library.py",["MUTCD_Sign_Definitions.csv","MUTCD_Variable_Sign_Definitions.csv"],["MUTCD_Sign_Library.ifc","MUTCD_Sign_Library_foot.ifc","MUTCD_Sign_Library_metre.ifc"]),
+    "corridor":("Build_Test_Corridor_Signs.py",["Sign_Face.csv","MUTCD_Sign_Library_foot.ifc","Data Dictionary/wsdotsigns_0.5.json"],["Test_Corridor_Signs.ifc"]),
+    "corridor_tiles":("Build_Test_Corridor_Signs.py --tile-size 5280",["Sign_Face.csv","MUTCD_Sign_Library_foot.ifc","Data Dictionary/wsdotsigns_0.5.json"],["Test_Corridor_Tiles/manifest.json"]),
+    "linear":("Build_signs_with_Linear_Placement.py",["MUTCD_Sign_Library_foot.ifc"],["Signs_with_Linear_Placement.ifc"]),
+    "all_way_stop":("Build_All_Way_Stop_Model.py",["MUTCD_Sign_Library.ifc","All_Way_Stop_Locations.csv"],["All_Way_Stop.ifc"]),
+    "sign":("Build_Sign_Model.py",["MUTCD_Sign_Library.ifc"],["Signs.ifc"]),
+    "bsdd":("Build_Sign_with_bSDD_Classification.py",["Data Dictionary/wsdotsigns_0.5.json"],["bSDD_Classified_Sign.ifc"]),
+}
+
+IMPORT_PATTERN = re.compile(r"^\s*(?:from\s+([A-Za-z_][A-Za-z0-9_]*)\s+import|import\s+([A-Za-z_][A-Za-z0-9_]*))",re.MULTILINE)
+# a 22 character string as the first attribute of an entity instance, a GlobalId if the entity is an IfcRoot
+GLOBALID_PATTERN = re.compile(rb"(=\s*(IFC\w+)\s*\(\s*)'[0-9A-Za-z_$]{22}'")
+
+
+def _root_entities(declaration):
+    # upper case names of declaration and its subtypes, as they are written in STEP files
+    names = {declaration.name().upper().encode()}
+    for subtype in declaration.subtypes():
+        names |= _root_entities(subtype)
+    return names
+
+
+ROOT_ENTITIES = set()
+for schema in ("IFC2X3","IFC4","IFC4X3"):
+    ROOT_ENTITIES |= _root_entities(ifcopenshell.ifcopenshell_wrapper.schema_by_name(schema).declaration_by_name("IfcRoot"))
+
+
+def _blank_global_id(match):
+    # only the GlobalIds are blanked, a 22 character Name of a property or label is content
+    return match.group(1) + b"''" if match.group(2) in ROOT_ENTITIES else match.group(0)
+
+
+def local_modules(script,found=None):
+    # the script and all the modules in this folder that it imports, directly or indirectly
+    found = found if found is not None else []
+    if script in found:
+        return found
+    found.append(script)
+    with open(script,mode='r',encoding='utf-8') as f:
+        code = f.read()
+    for match in IMPORT_PATTERN.finditer(code):
+        module = f"{match.group(1) or match.group(2)}.py"
+        if os.path.exists(module):
+            local_modules(module,found)
+    return found
+
+
+def file_digest(file_path):
+    # IFC files are compared without the header and GlobalIds so a rebuild with the same content has the same hash
+    with open(file_path,mode='rb') as f:
+        data = f.read()
+    if file_path.lower().endswith(".ifc"):
+        data = data[data.find(b"DATA;"):]
+        data = GLOBALID_PATTERN.sub(_blank_global_id,data)
+    return hashlib.sha256(data).hexdigest()
+
+
+def input_digest(name):
+    script, inputs, outputs = BUILDS[name]
+    digest = hashlib.sha256(script.encode())
+    for file_path in local_modules(script.split()[0]) + inputs:
+        digest.update(file_path.encode())
+        digest.update(file_digest(file_path).encode() if os.path.exists(file_path) else b"missing")
+    return digest.hexdigest()
+
+
+def upstream(name):
+    script, inputs, outputs = BUILDS[name]
+    return [other for other, (other_script,other_inputs,other_outputs) in BUILDS.items() if other != name and set(inputs) & set(other_outputs)]
+
+
+def build_order(targets):
+    # targets and everything they depend on, in dependency order
+    order = []
+    def visit(name,path):
+        if name in path:
+            raise ValueError(f"circular dependency {' -> '.join(path + [name])}")
+        if name in order:
+            return
+        for other in upstream(name):
+            visit(other,path + [name])
+        order.append(name)
+    for name in targets:
+        visit(name,[])
+    return order
+
+
+def load_cache():
+    if os.path.exists(CACHE_FILE):
+        with open(CACHE_FILE,mode='r',encoding='utf-8') as f:
+            return json.load(f)
+    return {}
+
+
+def save_cache(cache):
+    with open(CACHE_FILE,mode='w',encoding='utf-8') as f:
+        json.dump(cache,f,indent=1,sort_keys=True)
+
+
+def is_up_to_date(name,cache):
+    entry = cache.get(name)
+    if entry is None or entry["inputs"] != input_digest(name):
+        return False
+    for output in BUILDS[name][2]:
+        if not os.path.exists(output) or entry["outputs"].get(output) != file_digest(output):
+            return False
+    return True
+
+
+def run_build(name):
+    script = BUILDS[name][0]
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable] + script.split(),capture_output=True,text=True)
+    return result.returncode, result.stdout + result.stderr, time.perf_counter() - start
+
+
+def build(targets=None,force=False,jobs=None,dry_run=False):
+    targets = targets if targets else list(BUILDS.keys())
+    for name in targets:
+        if name not in BUILDS:
+            raise ValueError(f"unknown build {name}, expected one of {', '.join(BUILDS.keys())}")
+
+    order = build_order(targets)
+    cache = load_cache()
+    status = {} # name -> "built", "up to date", "failed", or "skipped"
+    running = {} # future -> name
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=jobs if jobs else os.cpu_count()) as executor:
+        while len(status) < len(order):
+            # start every build whose upstream builds are finished
+            for name in order:
+                if name in status or name in running.values():
+                    continue
+                dependencies = [other for other in upstream(name) if other in order]
+                if any(status.get(other) in ("failed","skipped") for other in dependencies):
+                    print(f"{name}: skipped, upstream build failed")
+                    status[name] = "skipped"
+                    continue
+                if not all(other in status for other in dependencies):
+                    continue
+                if not force and is_up_to_date(name,cache):
+                    print(f"{name}: up to date")
+                    status[name] = "up to date"
+                    continue
+                if dry_run:
+                    print(f"{name}: would build {BUILDS[name][0]}")
+                    status[name] = "built"
+                    continue
+                print(f"{name}: building {BUILDS[name][0]}")
+                running[executor.submit(run_build,name)] = name
+
+            if not running:
+                continue
+
+            done, pending = concurrent.futures.wait(running,return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                returncode, output, elapsed = future.result()
+                missing = [output_file for output_file in BUILDS[name][2] if not os.path.exists(output_file)]
+                if returncode != 0 or missing:
+                    print(f"{name}: failed after {elapsed:.1f} s")
+                    print(output[-2000:])
+                    status[name] = "failed"
+                    cache.pop(name,None)
+                else:
+                    print(f"{name}: built in {elapsed:.1f} s")
+                    status[name] = "built"
+                    cache[name] = {"inputs":input_digest(name),"outputs":{output_file:file_digest(output_file) for output_file in BUILDS[name][2]}}
+                    save_cache(cache)
+
+    return status
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the sign models")
+    parser.add_argument("targets",nargs="*",help=f"builds to run ({', '.join(BUILDS.keys())}), default is all")
+    parser.add_argument("--force",action="store_true",help="rebuild even if up to date")
+    parser.add_argument("--jobs",type=int,default=None,help="number of builds to run at the same time")
+    parser.add_argument("--dry-run",action="store_true",help="list the builds that would run")
+    args = parser.parse_args()
+
+    status = build(args.targets,args.force,args.jobs,args.dry_run)
+    sys.exit(1 if "failed" in status.values() else 0)
@@ -3,6 +3,7 @@ import ifcopenshell.api.context
 import ifcopenshell.api.unit
 import ifcopenshell.api.georeference
 import math
+from sign_styles import SignFaceStyles
 
 # create IFC model
 model = ifcopenshell.file(schema="IFC4X3")
@@ -46,49 +47,6 @@ indicies = [(1,2,3),(3,4,1),(4,5,1)]
 sign_panel = model.createIfcTriangulatedFaceSet(Coordinates=points,CoordIndex=indicies)
 shape_representation = model.createIfcShapeRepresentation(ContextOfItems=body_model_context,RepresentationIdentifier="Body",RepresentationType="Tessellation",Items=[sign_panel])
 
-# define the sign face image
-image_texture = model.createIfcImageTexture(
-    RepeatS = False,
-    RepeatT = False,
-    Mode = "DIFFUSE",
-    URLReference = r".\R03-08L Advance Intersection Lane Control (2 lanes) 30x30.png"
-)
-
-#texture_vertex_list = model.createIfcTextureVertexList(TexCoordsList=[(0.,0.),(0.5,0.),(1.,0.),(1.,1.),(0.,1.)])
-#texture_vertex_list = model.createIfcTextureVertexList(TexCoordsList=[(0.5,0.),(1.,0.),(1.,1.),(0.,1.),(0.,0.)])
-
-#indexed_triangule_texture_map = model.createIfcIndexedTriangleTextureMap(
-#    Maps=[image_texture],
-#    MappedTo=sign_panel,
-#    TexCoords=texture_vertex_list,
-#    TexCoordIndex=((1,2,3),(3,4,1),(4,5,1))
-#    #TexCoordIndex=((2,3,4),(4,5,2),(5,1,2))
-#)
-
-#shading = model.createIfcSurfaceStyleShading(
-#    SurfaceColour = model.createIfcColourRgb(Red=0.,Green=0.,Blue=0.)
-#)
-shading = model.createIfcSurfaceStyleRendering(
-    SurfaceColour = model.createIfcColourRgb(Red=0.,Green=0.,Blue=0.),
-    ReflectanceMethod="NOTDEFINED"
-)
-
-surface_with_texture = model.createIfcSurfaceStyleWithTextures(
-    Textures=[image_texture]
-)
-
-texture_coordinate_generator = model.createIfcTextureCoordinateGenerator([image_texture],'COORD')
-    
-surface_style = model.createIfcSurfaceStyle(
-    Side="POSITIVE",
-    Styles=[shading,surface_with_texture]
-)
-
-styled_item = model.createIfcStyledItem(
-    Item=sign_panel,
-    Styles=[surface_style]
-)
-
 # the geometric representation is reusable and is placed in an IfcRepresentationMap. Use (0,0,0) as a simple origin
 origin =  model.createIfcAxis2Placement3D(Location=model.createIfcCartesianPoint((0.,0.,0.)))
 rep_map = model.createIfcRepresentationMap(MappingOrigin=origin,MappedRepresentation=shape_representation)
@@ -96,6 +54,10 @@ rep_map = model.createIfcRepresentationMap(MappingOrigin=origin,MappedRepresenta
 # create the IfcSignType
 sign_type = model.createIfcSignType(GlobalId=ifcopenshell.guid.new(),Name="U Turn Only",PredefinedType="PICTORAL",Tag="R3-8L",RepresentationMaps=[rep_map])
 
+# style the sign face at the type level. the texture and surface style are shared by every IfcSign of this type through the mapped representation
+sign_face_styles = SignFaceStyles(model)
+sign_face_styles.style_sign_type(sign_type,mutcd=sign_type.Tag,url=r".\R03-08L Advance Intersection Lane Control (2 lanes) 30x30.png")
+
 # relate type declaration with project
 rel_declares = model.createIfcRelDeclares(GlobalId=ifcopenshell.guid.new(),RelatingContext=project,RelatedDefinitions=[sign_type])
 
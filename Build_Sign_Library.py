@@ -4,11 +4,28 @@ Script to build a library of MUTCD signs
 Richard Brice, PE
 WSDOT Bridge and Structures Office
 
-Two IfcProjectLibrary entities are created. One library defines signs of unit dimensions (1x1x1).
-From this signs of any size and thickness can be created by scaling the geometric representation with IfcCartesianTransformationOperator3DnonUniform
-setting the Scale, Scale1, and Scale2 parameters equal to the X,Y,Z dimensions of the sign (Z is thickness)
+One IfcProjectLibrary is created with one parametric IfcSignType per MUTCD designation. The geometry of each type is a
+sign panel of unit dimensions (1x1x1). Signs of any size and thickness are created by scaling the geometric representation
+with IfcCartesianTransformationOperator3DnonUniform setting the Scale, Scale2, and Scale3 parameters equal to the X,Y,Z
+dimensions of the sign (Z is thickness).
 
-The second library has signs of actual dimensions per MUTCD with a unit thickness.
+The allowed sizes for each application (Single Lane, Multi-Lane, etc.), the shape, and the rule for converting a MUTCD
+size to the bounding box of the sign panel are properties of the type (MUTCD_SignType property set). Previously every
+size was its own sign type. See sign_library.py for finding types and mapping them at a given size.
+
+Each sign type has a representation map for each level of detail, the Body swept solid, a Box bounding box, and a
+Body-Fallback triangulated face set, each in its own representation subcontext (see sign_lod.py).
+
+--faces <folder> styles the sign types that have a face image, <folder>/<MUTCD code>.png, with a shared texture and
+surface style (see sign_styles.py).
+
+Signs with variable dimensions (guide signs whose size depends on the legend) are read from
+MUTCD_Variable_Sign_Definitions.csv. They don't have allowed sizes.
+
+The library is built in each length unit, MUTCD_Sign_Library.ifc (inch), MUTCD_Sign_Library_foot.ifc, and
+MUTCD_Sign_Library_metre.ifc (--units selects them). The unit sign panel is 1 unit of the library so builders add the
+types of the variant in their model unit without converting units (see sign_library.py). GlobalIds are derived from the
+MUTCD designations rather than generated, so a sign type has the same GlobalId in every variant and every build.
 
 Future Work:
 1) Predefine materials in the library
@@ -17,47 +34,21 @@ Future Work:
 4) Add type-level bSDD classification
 """
 
-import math
 import ifcopenshell
 import ifcopenshell.api.unit
 import ifcopenshell.api.context
 
-import math
+import argparse
 import csv
+import uuid
+from sign_library import LIBRARY_UNITS, PSET_NAME, SIZE_PROPERTIES, library_file_name
+from sign_properties import PropertyWriter
+from sign_lod import add_contexts
+from sign_shapes import SIZE_RULES, SignShapes
+from sign_storage import FORMATS, format_file_name, write_model
+from sign_styles import SignFaceStyles, sign_face_url
 
 
-def generate_polygon(width,height,sides,start_angle):
-    angle_step = 2*math.pi/sides
-    X = 0.5*width/math.cos(math.pi/sides)
-    Y = 0.5*height/math.cos(math.pi/sides)
-    points = [
-        (
-            X*math.cos(start_angle + i*angle_step),
-            Y*math.sin(start_angle + i*angle_step)
-        )
-        for i in range(sides)
-    ]
-
-    return points
-    
-
-def create_sign_representation(name,model,context,width,height,sides,start_angle):
-    coords = generate_polygon(width,height,sides,start_angle)
-    points = model.createIfcCartesianPointList2D(CoordList=coords)
-    indicies = [(i,i+1) for i in range(1,sides)]
-    indicies.append((sides,1))
-    segments=[]
-    for i in indicies:
-        segments.append(model.createIfcLineIndex(i))
-
-    curve = model.createIfcIndexedPolyCurve(Points=points,Segments=segments)
-    profile = model.createIfcArbitraryClosedProfileDef(ProfileName=name, ProfileType="AREA",OuterCurve=curve)
-    solid = model.createIfcExtrudedAreaSolid(SweptArea=profile,ExtrudedDirection=model.createIfcDirection((0.,0.,1.)),Depth=1.)
-
-    shape_representation = model.createIfcShapeRepresentation(ContextOfItems=context,RepresentationIdentifier="Body",RepresentationType="SweptSolid",Items=[solid])
-
-    return shape_representation
-
 # Define the expected fieldnames
 FIELDNAMES = [
     "Sign", "Designation", "Section",
@@ -65,113 +56,121 @@ FIELDNAMES = [
     "Minimum", "Oversized", "Shape"
 ]
 
-def read_csv(file_path):
+# GlobalIds of the library are name based UUIDs in this namespace
+GLOBALID_NAMESPACE = uuid.uuid5(uuid.NAMESPACE_URL,"MUTCD_Sign_Library")
+
+
+def global_id(*key):
+    # ("IfcSignType","R1-1") -> the same GlobalId in every build
+    return ifcopenshell.guid.compress(uuid.uuid5(GLOBALID_NAMESPACE,"/".join(key)).hex)
+
+
+def read_csv(file_path,variable_file_path=None,file_name="MUTCD_Sign_Library.ifc",unit="inch",faces=None):
+    # unit is the length unit of the library, a key of LIBRARY_UNITS
+    # faces is a folder of sign face images named <MUTCD code>.png, or None
     # start the model
     model = ifcopenshell.file(schema="IFC4X3")
 
     # create a project
-    project = model.createIfcProject(GlobalId=ifcopenshell.guid.new(),Name="MUTCD Sign Definition Libraries")
+    project = model.createIfcProject(GlobalId=global_id("IfcProject"),Name="MUTCD Sign Definition Libraries")
 
     # set up system of units (must be done after IfcProject is created)
-    length_unit = ifcopenshell.api.unit.add_conversion_based_unit(model,name="inch")
-    area_unit = ifcopenshell.api.unit.add_conversion_based_unit(model,name="square inch")
+    length_name, area_name = LIBRARY_UNITS[unit][:2]
+    if length_name:
+        length_unit = ifcopenshell.api.unit.add_conversion_based_unit(model,name=length_name)
+        area_unit = ifcopenshell.api.unit.add_conversion_based_unit(model,name=area_name)
+    else:
+        length_unit = ifcopenshell.api.unit.add_si_unit(model,unit_type="LENGTHUNIT")
+        area_unit = ifcopenshell.api.unit.add_si_unit(model,unit_type="AREAUNIT")
     ifcopenshell.api.unit.assign_unit(model,units=[length_unit,area_unit])
 
     # create the representation context
     geometric_representation_context = ifcopenshell.api.context.add_context(model,context_type="Model")
-    body_model_context = ifcopenshell.api.context.add_context(model,context_type="Model",context_identifier="Body",target_view="MODEL_VIEW",parent=geometric_representation_context)
+    # one subcontext for each level of detail
+    contexts = add_contexts(model,geometric_representation_context)
 
-    # create the libraries
-    project_library1 = model.createIfcProjectLibrary(GlobalId=ifcopenshell.guid.new(),Name="Unit Signs",RepresentationContexts=[body_model_context])
-    project_library2 = model.createIfcProjectLibrary(GlobalId=ifcopenshell.guid.new(),Name="Signs",RepresentationContexts=[body_model_context])
+    # create the library
+    project_library = model.createIfcProjectLibrary(GlobalId=global_id("IfcProjectLibrary"),Name="MUTCD Signs",RepresentationContexts=list(contexts.values()))
 
     # project declares library
-    model.createIfcRelDeclares(GlobalId=ifcopenshell.guid.new(),RelatingContext=project,RelatedDefinitions=[project_library1,project_library2])
+    model.createIfcRelDeclares(GlobalId=global_id("IfcRelDeclares","IfcProject"),RelatingContext=project,RelatedDefinitions=[project_library])
 
     # align the origin of the mapping with the center of the sign at (0,0,0)
     mapping_origin =  model.createIfcAxis2Placement3D(Location=model.createIfcCartesianPoint((0.,0.,0.)))
 
-    unit_sign_types = []
+    # the sign panel is 1 x 1 x 1 in library units, it is the same in every variant
+    # unit sign panel profiles are shared by all the sign types with the same shape
+    shapes = SignShapes(model,depth=1.)
+    property_writer = PropertyWriter(model)
+    face_styles = SignFaceStyles(model)
+    styled_types = 0
+    rep_maps = {}
+    designations = {} # MUTCD designation -> number of sign types with the designation, for the GlobalIds of repeats
+
     sign_types = []
-    
-    try:
-        with open(file_path, mode='r', newline='', encoding='utf-8') as csvfile:
-            next(csvfile)
-            reader = csv.DictReader(csvfile, fieldnames=FIELDNAMES)
-            
-            print("Reading CSV contents:\n")
-            for idx, row in enumerate(reader):
-                description = row["Sign"]
-                
-                if isinstance(description,list):
-                    description = " ".join(str(v) for v in description)
-                    
-                mutcd = row["Designation"].split()
-                
-                if isinstance(mutcd,list):
-                    mutcd = " ".join(str(v) for v in mutcd)
-                    
-                print(f"{idx}: {description}, {mutcd}")
-                sizes={row["Single Lane"].strip(),row["Multi-Lane"].strip(),row["Expressway"].strip(),row["Freeway"].strip(),row["Minimum"].strip(),row["Oversized"].strip()}
-                sizes=set(filter(lambda x: x.strip(), sizes))
-                for size in sizes:
-                    parts = size.split()
-                    w = int(parts[0])
-                    h = int(parts[2])
-                    if row["Shape"] == "O":
-                        rep = create_sign_representation(mutcd,model,body_model_context,1,1,8,math.pi/8)
-                        rep_map = model.createIfcRepresentationMap(MappingOrigin=mapping_origin,MappedRepresentation=rep)
-                        unit_sign_types.append(model.createIfcSignType(GlobalId=ifcopenshell.guid.new(),Name=mutcd,Description=description,PredefinedType="PICTORAL",RepresentationMaps=[rep_map]))
-
-                        rep = create_sign_representation(mutcd,model,body_model_context,w,w,8,math.pi/8)
-                        rep_map = model.createIfcRepresentationMap(MappingOrigin=mapping_origin,MappedRepresentation=rep)
-                        sign_types.append(model.createIfcSignType(GlobalId=ifcopenshell.guid.new(),Name=mutcd,Description=f"{description} ({w}x{w})",PredefinedType="PICTORAL",RepresentationMaps=[rep_map]))
-                    elif row["Shape"] == "R":
-                        rep = create_sign_representation(mutcd,model,body_model_context,1,1,4,math.pi/4)
-                        rep_map = model.createIfcRepresentationMap(MappingOrigin=mapping_origin,MappedRepresentation=rep)
-                        unit_sign_types.append(model.createIfcSignType(GlobalId=ifcopenshell.guid.new(),Name=mutcd,Description=description,PredefinedType="PICTORAL",RepresentationMaps=[rep_map]))
-
-                        rep = create_sign_representation(mutcd,model,body_model_context,w,h,4,math.pi/4)
-                        rep_map = model.createIfcRepresentationMap(MappingOrigin=mapping_origin,MappedRepresentation=rep)
-                        sign_types.append(model.createIfcSignType(GlobalId=ifcopenshell.guid.new(),Name=mutcd,Description=f"{description} ({w}x{h})",PredefinedType="PICTORAL",RepresentationMaps=[rep_map]))
-                    elif row["Shape"] == "D":
-                        rep = create_sign_representation(mutcd,model,body_model_context,1,1,4,0.)
-                        rep_map = model.createIfcRepresentationMap(MappingOrigin=mapping_origin,MappedRepresentation=rep)
-                        unit_sign_types.append(model.createIfcSignType(GlobalId=ifcopenshell.guid.new(),Name=mutcd,Description=description,PredefinedType="PICTORAL",RepresentationMaps=[rep_map]))
-
-                        rep = create_sign_representation(mutcd,model,body_model_context,w,h,4,0.)
-                        rep_map = model.createIfcRepresentationMap(MappingOrigin=mapping_origin,MappedRepresentation=rep)
-                        sign_types.append(model.createIfcSignType(GlobalId=ifcopenshell.guid.new(),Name=mutcd,Description=f"{description} ({w}x{h})",PredefinedType="PICTORAL",RepresentationMaps=[rep_map]))
-                    elif row["Shape"] == "T":
-                        z = int(parts[4])
-                        rep = create_sign_representation(mutcd,model,body_model_context,1,1,3,math.pi/6)
-                        rep_map = model.createIfcRepresentationMap(MappingOrigin=mapping_origin,MappedRepresentation=rep)
-                        unit_sign_types.append(model.createIfcSignType(GlobalId=ifcopenshell.guid.new(),Name=mutcd,Description=description,PredefinedType="PICTORAL",RepresentationMaps=[rep_map]))
-
-                        rep = create_sign_representation(mutcd,model,body_model_context,w,h,3,math.pi/6)
-                        rep_map = model.createIfcRepresentationMap(MappingOrigin=mapping_origin,MappedRepresentation=rep)
-                        sign_types.append(model.createIfcSignType(GlobalId=ifcopenshell.guid.new(),Name=mutcd,Description=f"{description} ({w}x{h}x{z})",PredefinedType="PICTORAL",RepresentationMaps=[rep_map]))
-                    elif row["Shape"] == "P":
-                        z = int(parts[4])
-                        rep = create_sign_representation(mutcd,model,body_model_context,1,1,3,0.)
-                        rep_map = model.createIfcRepresentationMap(MappingOrigin=mapping_origin,MappedRepresentation=rep)
-                        unit_sign_types.append(model.createIfcSignType(GlobalId=ifcopenshell.guid.new(),Name=mutcd,Description=description,PredefinedType="PICTORAL",RepresentationMaps=[rep_map]))
-
-                        rep = create_sign_representation(mutcd,model,body_model_context,w,h,3,0.)
-                        rep_map = model.createIfcRepresentationMap(MappingOrigin=mapping_origin,MappedRepresentation=rep)
-                        sign_types.append(model.createIfcSignType(GlobalId=ifcopenshell.guid.new(),Name=mutcd,Description=f"{description} ({w}x{h}x{z})",PredefinedType="PICTORAL",RepresentationMaps=[rep_map]))
-
-    except FileNotFoundError:
-        print(f"Error: File '{file_path}' not found.")
-    except Exception as e:
-        print(f"An error occurred: {e}")
-
-    model.createIfcRelDeclares(GlobalId=ifcopenshell.guid.new(),RelatingContext=project_library1,RelatedDefinitions=unit_sign_types)
-    model.createIfcRelDeclares(GlobalId=ifcopenshell.guid.new(),RelatingContext=project_library2,RelatedDefinitions=sign_types)
-
-    model.write("MUTCD_Sign_Library.ifc")
+
+    for path in [file_path] + ([variable_file_path] if variable_file_path else []):
+        try:
+            with open(path, mode='r', newline='', encoding='utf-8') as csvfile:
+                next(csvfile)
+                reader = csv.DictReader(csvfile, fieldnames=FIELDNAMES)
+
+                print(f"Reading {path} contents:\n")
+                for idx, row in enumerate(reader):
+                    description = row["Sign"]
+                    mutcd = " ".join(row["Designation"].split())
+                    shape = row["Shape"].strip()
+
+                    print(f"{idx}: {description}, {mutcd}")
+
+                    # one representation map per shape and level of detail, shared by all the sign types with that shape
+                    shape_maps = rep_maps.get(shape)
+                    if shape_maps is None:
+                        shape_maps = [model.createIfcRepresentationMap(MappingOrigin=mapping_origin,MappedRepresentation=rep) for rep in shapes.representations(shape,contexts,shape,1.,1.)]
+                        rep_maps[shape] = shape_maps
+
+                    # a designation that is repeated in the definitions gets a GlobalId for each repeat
+                    repeat = designations.get(mutcd,0)
+                    designations[mutcd] = repeat + 1
+                    key = ("IfcSignType",mutcd) + ((str(repeat),) if repeat else ())
+                    sign_type = model.createIfcSignType(GlobalId=global_id(*key),Name=mutcd,Description=description,PredefinedType="PICTORAL",RepresentationMaps=shape_maps)
+                    sign_types.append(sign_type)
+
+                    # sizes are kept as they are written in the MUTCD, e.g. "36 x 36"
+                    sizes = {name:row[column].strip() for column, name in SIZE_PROPERTIES.items() if row[column].strip()}
+                    properties = {"Section":row["Section"].strip(),"Shape":shape}
+                    properties.update(sizes)
+                    properties["VariableDimensions"] = not sizes
+                    properties["SizeRule"] = SIZE_RULES.get(shape)
+                    property_writer.add_type_psets(sign_type,PSET_NAME,properties)
+                    for pset in sign_type.HasPropertySets:
+                        pset.GlobalId = global_id(*key,pset.Name)
+
+                    # the sign face texture and style are on the type geometry, shared by every sign of the type
+                    url = sign_face_url(faces,mutcd)
+                    if url and face_styles.style_sign_type(sign_type,url):
+                        styled_types += 1
+
+        except FileNotFoundError:
+            print(f"Error: File '{path}' not found.")
+        except Exception as e:
+            print(f"An error occurred: {e}")
+
+    if faces:
+        print(f"{styled_types} sign types styled with face images from {faces}")
+
+    model.createIfcRelDeclares(GlobalId=global_id("IfcRelDeclares","IfcProjectLibrary"),RelatingContext=project_library,RelatedDefinitions=sign_types)
+
+    write_model(model,file_name)
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the MUTCD sign library")
+    parser.add_argument("--format",choices=list(FORMATS.keys()),default="ifc",help="storage format of the library (see sign_storage.py)")
+    parser.add_argument("--units",nargs="+",choices=list(LIBRARY_UNITS.keys()),default=list(LIBRARY_UNITS.keys()),help="length units of the library variants to build")
+    parser.add_argument("--faces",default=None,help="folder of sign face images named <MUTCD code>.png")
+    args = parser.parse_args()
+
     file_path = "MUTCD_Sign_Definitions.csv"
-    read_csv(file_path)
+    for unit in args.units:
+        read_csv(file_path,"MUTCD_Variable_Sign_Definitions.csv",library_file_name(unit,format_file_name("MUTCD_Sign_Library.ifc",args.format)),unit,args.faces)
     print("Done")
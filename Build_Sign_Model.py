@@ -2,23 +2,16 @@ import ifcopenshell
 import ifcopenshell.api.context
 import ifcopenshell.api.unit
 import ifcopenshell.api.classification
+from sign_library import SignLibrary
 
-library_file = ifcopenshell.open("MUTCD_Sign_Library.ifc")
-libraries = library_file.by_type("IfcProjectLibrary")
+library = SignLibrary("MUTCD_Sign_Library.ifc")
 
-library_type = 1 # 0 = unit signs, 1 = explicit signs
 mutcd_code = "R1-2" # Yield
 size = "60x60x60"
 
-sign_type=None
-
-library = libraries[library_type]
-for type in library.Declares[0].RelatedDefinitions:
-    if type.Name == mutcd_code and size in type.Description:
-        sign_type = type
-        break
-
-#sign_type = library.Declares[0].RelatedDefinitions[0]
+# the library sign types are parametric - the size of the sign is applied when the type geometry is mapped
+sign_type = library.find(mutcd_code)
+width, height = library.bounding_size(mutcd_code,size)
 
 
 # create IFC model
@@ -71,7 +64,7 @@ ifcopenshell.api.classification.add_reference(model,products=[sign_type],classif
 
 # create geometric representation of the sign by mapping the IfcSignType representation
 #mapping_target = model.createIfcCartesianTransformationOperator3DnonUniform(LocalOrigin=model.createIfcCartesianPoint((0.,0.,0.)),Scale=36.0,Scale2=36.0,Scale3=0.5)
-mapping_target = model.createIfcCartesianTransformationOperator3DnonUniform(LocalOrigin=model.createIfcCartesianPoint((0.,0.,0.)),Scale3=0.5)
+mapping_target = model.createIfcCartesianTransformationOperator3DnonUniform(LocalOrigin=model.createIfcCartesianPoint((0.,0.,0.)),Scale=width,Scale2=height,Scale3=0.5)
 mapped_item = model.createIfcMappedItem(MappingSource=sign_type.RepresentationMaps[0],MappingTarget=mapping_target)
 rep = model.createIfcShapeRepresentation(ContextOfItems=body_model_context,RepresentationIdentifier="Body",RepresentationType="MappedRepresentation",Items=[mapped_item])
 product_rep = model.createIfcProductDefinitionShape(Representations=[rep])
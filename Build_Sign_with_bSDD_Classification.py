@@ -7,9 +7,14 @@ WSDOT Bridge and Structures Office
 import ifcopenshell
 import ifcopenshell.api.context
 import ifcopenshell.api.unit
-import ifcopenshell.api.classification
+from sign_properties import PropertyWriter
+from bsdd_cache import BsddDictionary, BulkClassifier
+from sign_dictionary import CompiledDictionary
 
-sign_dd_version = "0.5"
+# class and property URIs come from an offline snapshot of the WSDOT sign data dictionary (see bsdd_cache.py)
+sign_dd = BsddDictionary.load("Data Dictionary/wsdotsigns_0.5.json")
+# the property set template and property validators of the SIGN class (see sign_dictionary.py)
+sign_properties = CompiledDictionary(sign_dd,"SIGN")
 
 # create IFC model
 model = ifcopenshell.file(schema="IFC4X3")
@@ -28,10 +33,7 @@ geometric_representation_context = ifcopenshell.api.context.add_context(model,co
 body_model_context = ifcopenshell.api.context.add_context(model,context_type="Model",context_identifier="Body",target_view="MODEL_VIEW",parent=geometric_representation_context)
 
 # add the wsdotsigns classification system to the model
-wsdot_signs = ifcopenshell.api.classification.add_classification(model,classification="wsdotsigns")
-wsdot_signs.Source = "wsdot_test_dict" # classification is from the wsdot_test_dict bSDD
-wsdot_signs.Edition="0.1.0"
-wsdot_signs.Specification=f"https://search.bsdd.buildingsmart.org/uri/wsdot/wsdotsigns/{sign_dd_version}"# location of the bSDD
+wsdot_signs = BulkClassifier(model,sign_dd,source="wsdot_test_dict") # classification is from the wsdot_test_dict bSDD
 
 #
 # create IfcSignType that acts as a predefined cell
@@ -53,19 +55,19 @@ rep_map = model.createIfcRepresentationMap(MappingOrigin=origin,MappedRepresenta
 sign_type = model.createIfcSignType(GlobalId=ifcopenshell.guid.new(),Description="desc_goes_here",PredefinedType="PICTORAL",Name="mutcd_code_goes_here",RepresentationMaps=[rep_map])
 
 # add properties to the sign type that are common for all instances of this type
-sign_base_quantities = ifcopenshell.api.pset.add_pset(model,product=sign_type,name="Qset_SignBaseQuantities")
-ifcopenshell.api.pset.edit_pset(model,pset=sign_base_quantities,properties={"Height":36.0,"Width":36.0})
+# the property writer creates property sets in bulk. for a single sign this is the same as ifcopenshell.api.pset.add_pset/edit_pset
+property_writer = PropertyWriter(model)
+property_writer.add_type_psets(sign_type,"Qset_SignBaseQuantities",{"Height":36.0,"Width":36.0})
+property_writer.add_type_psets(sign_type,"Qset_PictorialSignQuantities",{"Area":1296.0,"SignArea":1296.0})
 
-pictorial_sign_quantities = ifcopenshell.api.pset.add_pset(model,product=sign_type,name="Qset_PictorialSignQuantities")
-ifcopenshell.api.pset.edit_pset(model,pset=pictorial_sign_quantities,properties={"Area":1296.0,"SignArea":1296.0})
 
-
-# relate type declaration with project
-rel_declares = model.createIfcRelDeclares(GlobalId=ifcopenshell.guid.new(),RelatingContext=project,RelatedDefinitions=[sign_type])
+# relate type declaration and the WSDOT_Sign property set template with project
+rel_declares = model.createIfcRelDeclares(GlobalId=ifcopenshell.guid.new(),RelatingContext=project,RelatedDefinitions=[sign_type,sign_properties.add_templates(model)])
 
 # classify the IfcSignType as a SIGN
-guide_sign = model.createIfcClassificationReference(Location=f"https://identifier.buildingsmart.org/uri/wsdot/wsdotsigns/{sign_dd_version}/class/SIGN",Identification="SIGN")
-ifcopenshell.api.classification.add_reference(model,products=[sign_type],classification=wsdot_signs,reference=guide_sign)
+# one IfcClassificationReference and IfcRelAssociatesClassification is created per class no matter how many objects are classified
+wsdot_signs.classify([sign_type],"SIGN")
+wsdot_signs.flush()
 
 #
 # create a single IfcSign that is based on the IfcSignType definition
@@ -91,10 +93,12 @@ sign = model.createIfcSign(GlobalId=ifcopenshell.guid.new(),Name="Sign_1",Object
 rel = model.createIfcRelDefinesByType(GlobalId=ifcopenshell.guid.new(),RelatedObjects=[sign],RelatingType=sign_type)
 
 # add properties to the sign that are specific to this instance
-location_set = ifcopenshell.api.pset.add_pset(model,product=sign,name="Location")
-ifcopenshell.api.pset.edit_pset(model,pset=location_set,properties={"Facing":"North","SideOfRoad":"R"})
-location_set.HasProperties[0].Specification=f"https://identifier.buildingsmart.org/uri/wsdot/wsdotsigns/{sign_dd_version}/prop/Facing"
-location_set.HasProperties[1].Specification=f"https://identifier.buildingsmart.org/uri/wsdot/wsdotsigns/{sign_dd_version}/prop/SideOfRoad"
+# property values are given as columns, one value per sign, so the same call works for thousands of signs
+# property names are the property codes from the data dictionary. the values are checked against the data dictionary
+# and written to the WSDOT_Sign property set with the data dictionary measure types and property URIs
+sign_properties.add_psets(property_writer,[sign],{"sign_facing":["North"],"sign_side_of_rd":["R"],"sign_ht":[36],"sign_width":[36],"sign_inst_date":["2025-05-12"]})
+property_writer.flush()
+sign_properties.relate_templates(property_writer)
 
 # add sign to spatial structure of the model
 ifcopenshell.api.spatial.assign_container(model,relating_structure=site,products=[sign])
@@ -3,13 +3,63 @@ Script to build sign model for ADCMS grant project test corridor.
 
 Richard Brice, PE
 WSDOT Bridge and Structures Office
+
+By default all of the signs are written to Test_Corridor_Signs.ifc. A statewide model in a single file would be too
+large for viewers that have to load everything, so the signs can also be written as tiles of a state plane grid
+
+python Build_Test_Corridor_Signs.py --tile-size 5280
+
+writes one IFC file per tile to Test_Corridor_Tiles along with manifest.json. The manifest has the bounds of each tile,
+the extent and number of signs in it, and the sign types it uses, so a viewer or analysis tool can load only the tiles
+around a location (see find_tiles). --tiles column,row rebuilds selected tiles and updates their manifest entries.
+
+The library is opened on a worker thread while the sign records are read, and finished tiles are written in the
+background while the next tile is built (sign_pipeline.py). The time of each phase and the saving compared to running
+the phases one after the other are reported. --sequential runs the phases one after the other for comparison.
+
+--format ifczip or --format rocksdb writes the model (or tiles) in another storage format and --library selects the
+library file, e.g. MUTCD_Sign_Library.rdb (see sign_storage.py).
+
+The model is in feet, so the signs are built from the foot variant of the library (MUTCD_Sign_Library_foot.ifc for
+--library MUTCD_Sign_Library.ifc) when it has been built and the sign types are copied without converting units.
+
+--tsms SR104TSMSSigns.svc.xlsx joins the TSMS sign inventory to the signs and adds the inventory attributes of the
+matched signs as the WSDOT_TSMS property set (see sign_tsms.py). --tsms-distance is the match distance in feet.
+
+Each sign has a mapped representation for the Body and Box levels of detail of its type, in their own representation
+subcontexts so viewers can draw boxes for distant signs (see sign_lod.py). --fallback adds the Body-Fallback triangulated
+panels. It is opt-in because the ifcopenshell geometry iterator (and IfcConvert) processes Body-Fallback along with
+Body, giving two shapes per sign.
+
+--faces <folder> styles the sign types that have a face image, <folder>/<MUTCD code>.png, with a shared texture and
+surface style (see sign_styles.py).
+
+--dedup merges duplicate detections of the same sign (same MUTCD code within --dedup-distance feet and --dedup-angle
+degrees of orientation) into one record before the signs are modeled (see sign_dedup.py).
 """
 import ifcopenshell
 import ifcopenshell.api.unit
 import ifcopenshell.api.context
 import ifcopenshell.api.spatial
-import csv
+from sign_properties import PropertyWriter
+from sign_relationships import RelationshipWriter
+from sign_records import SignRecordStore
+from sign_library import SignLibrary, SignTypeMapper, library_variant
+from sign_lod import DEFAULT_LEVELS, LEVELS_OF_DETAIL, add_contexts
+from sign_styles import SignFaceStyles, sign_face_url
+from sign_shapes import SignShapes, shape_for_mutcd
+from sign_pipeline import BackgroundWriter, PhaseTimes, load_in_background, result
+from sign_storage import FORMATS, format_file_name, open_model, write_model
+from sign_dedup import find_duplicates, merge_duplicates
+from sign_tsms import PROPERTY_NAMES as TSMS_PROPERTY_NAMES, PSET_NAME as TSMS_PSET_NAME, join_tsms
+from bsdd_cache import BsddDictionary, BulkClassifier
+import argparse
+import json
 import math
+import numpy as np
+import os
+import shutil
+import time
 from collections import defaultdict
 from collections import Counter
 
@@ -23,62 +73,35 @@ from collections import Counter
 #mutcd_code_not_supported_types=[]
 
 
-def find_sign_type(mutcd_code,size,library):
-    for type in library.Declares[0].RelatedDefinitions:
-        size_in_desc = True if len(size) == 0 or size in type.Description else False
-        if type.Name == mutcd_code and size_in_desc:
-            return type
-
-#    mutcd_code_not_supported_types.append(mutcd_code)    
-    return None
-    
-
-def generate_polygon(width,height,sides,start_angle):
-    angle_step = 2*math.pi/sides
-    X = 0.5*width/math.cos(math.pi/sides)
-    Y = 0.5*height/math.cos(math.pi/sides)
-    points = [
-        (
-            X*math.cos(start_angle + i*angle_step),
-            Y*math.sin(start_angle + i*angle_step)
-        )
-        for i in range(sides)
-    ]
-
-    return points
-    
-
-def create_sign_representation(name,model,context,width,height,sides,start_angle):
-    coords = generate_polygon(width,height,sides,start_angle)
-    points = model.createIfcCartesianPointList2D(CoordList=coords)
-    indicies = [(i,i+1) for i in range(1,sides)]
-    indicies.append((sides,1))
-    segments=[]
-    for i in indicies:
-        segments.append(model.createIfcLineIndex(i))
-
-    curve = model.createIfcIndexedPolyCurve(Points=points,Segments=segments)
-    profile = model.createIfcArbitraryClosedProfileDef(ProfileName=name, ProfileType="AREA",OuterCurve=curve)
-    solid = model.createIfcExtrudedAreaSolid(SweptArea=profile,ExtrudedDirection=model.createIfcDirection((0.,0.,1.)),Depth=1./12.)
-
-    shape_representation = model.createIfcShapeRepresentation(ContextOfItems=context,RepresentationIdentifier="Body",RepresentationType="SweptSolid",Items=[solid])
-
-    return shape_representation
-
-
-def build_signs():
+def build_signs(records=None,file_name="Test_Corridor_Signs.ifc",library_file=None,site_name="Test Site",writer=None,times=None,sequential=False,dictionary=None,tsms=None,fallback=False,faces=None):
+    # library_file is a SignLibrary, an open library, a Future from load_in_background, or the file name of the library
+    # (None for MUTCD_Sign_Library.ifc, the foot variant is used if it exists). the format of the model is given by the
+    # extension of file_name
+    # dictionary is the BsddDictionary used to classify the signs, None loads the WSDOT sign data dictionary
+    # writer is a BackgroundWriter, or None to write the model before returning
+    # tsms is the TSMS inventory attributes of the signs by OBJECTID (TsmsJoin.matches), or None
+    # fallback adds the Body-Fallback level of detail to the signs
+    # faces is a folder of sign face images named <MUTCD code>.png to style the sign types with, or None
     sign_file = "Sign_Face.csv"
-    
-    # get the sign type for the library
-    library_file = ifcopenshell.open("MUTCD_Sign_Library.ifc")
-    libraries = library_file.by_type("IfcProjectLibrary")
-
-    # for this example, use the unit signs library so the geometry can be properly scaled for feet units
-    library_type = 1 # 0 = unit signs, 1 = explicit signs
+    report = times is None
+    times = PhaseTimes() if report else times
+    start = time.perf_counter()
+    waiting = 0.
+
+    # the library is opened on a worker thread while the sign records are read
+    if library_file is None or isinstance(library_file,str):
+        library_name = library_variant("foot",library_file if library_file else "MUTCD_Sign_Library.ifc")
+        if sequential:
+            with times.phase("Load library"):
+                library_file = open_model(library_name)
+        else:
+            library_file = load_in_background(open_model,library_name,times=times)
 
     signs_found = 0
     signs_not_found = 0
     signs_modeled = 0
+    # the error that stopped the build, the model is written with the signs modeled before it
+    error = None
 
     model = ifcopenshell.file(schema="IFC4X3")
     project = model.createIfcProject(GlobalId=ifcopenshell.guid.new(),Name="WSDOT ADCMS Grant Test Corridor Sign Model")
@@ -86,106 +109,355 @@ def build_signs():
     length_unit = ifcopenshell.api.unit.add_conversion_based_unit(model,name="foot")
     ifcopenshell.api.unit.assign_unit(model,units=[length_unit])
         
-    site = model.createIfcSite(GlobalId=ifcopenshell.guid.new(),Name="Test Site")
+    site = model.createIfcSite(GlobalId=ifcopenshell.guid.new(),Name=site_name)
     ifcopenshell.api.aggregate.assign_object(model,relating_object=project,products=[site])
 
     # set up geometric representation context
     geometric_representation_context = ifcopenshell.api.context.add_context(model,context_type="Model")
-    body_model_context = ifcopenshell.api.context.add_context(model,context_type="Model",context_identifier="Body",target_view="MODEL_VIEW",parent=geometric_representation_context)
+    # one subcontext for each level of detail
+    contexts = add_contexts(model,geometric_representation_context,LEVELS_OF_DETAIL if fallback else DEFAULT_LEVELS)
 
 
     # map IfcSignType geometry to a local origin of (0,0,0)
     mapping_target = model.createIfcCartesianTransformationOperator3D(LocalOrigin=model.createIfcCartesianPoint((0.,0.,0.)))
     mapping_origin = model.createIfcAxis2Placement3D(Location=model.createIfcCartesianPoint((0.,0.,0.)))
+
+    # sign panels are 1 inch thick
+    shapes = SignShapes(model,depth=1./12.)
     
     try:
-        FIELDNAMES = [
-        "OBJECTID","X","Y","Z","Layer","Text","MUTCD","Width","Height","Condition","Orientation"
-        ]
-
         sign_types = defaultdict(list)
-        
-        with open(sign_file,mode='r',newline='',encoding='utf-8') as csvfile:
-            next(csvfile)
-            reader = csv.DictReader(csvfile,fieldnames=FIELDNAMES)
-            for idx, row in enumerate(reader):
-                object_id = row["OBJECTID"]
-                text = row["Text"]
-                mutcd = row["MUTCD"]
-
-                description = f"{object_id} {text}"
-
-                print(f"{description} {mutcd}")
-
-                # note, matching based on mutcd code only - not attempting to match sign dimensions
-                # with predefined sign sizes
-                sign_type = find_sign_type(mutcd,"",libraries[library_type])
-                
-                x = float(row["X"])
-                y = float(row["Y"])
-                z = float(row["Z"])
-                orientation = float(row["Orientation"])
-                orientation = math.radians(orientation)
-                
-                if sign_type:
-                    # sign type found, add it to the model
-                    signs_found += 1
-                    sign_type = ifcopenshell.file.add(model,sign_type)
-                else:
-                    # sign type not found, create a unique type
-                    signs_not_found += 1
-                    w = float(row["Width"])
-                    h = float(row["Height"])
-                    rep = create_sign_representation(mutcd,model,body_model_context,w,h,4,math.pi/4)
-                    rep_map = model.createIfcRepresentationMap(MappingOrigin=mapping_origin,MappedRepresentation=rep)
-                    sign_type = model.createIfcSignType(GlobalId=ifcopenshell.guid.new(),Name=mutcd,Description=description,PredefinedType="PICTORAL",RepresentationMaps=[rep_map])
-
-                                        
-                sign_placement = model.createIfcLocalPlacement(
-                        RelativePlacement=model.createIfcAxis2Placement3D(
-                           Location=model.createIfcCartesianPoint((x,y,z)),
-                           RefDirection=model.createIfcDirection((math.cos(orientation),math.sin(orientation),0.)),
-                           Axis=model.createIfcDirection((math.sin(orientation),-math.cos(orientation),0.0))
-                        )
+
+        # sign quantities are collected as columns and written in bulk after all the signs are created
+        all_signs = []
+        all_sign_types = []
+        widths = []
+        heights = []
+        inventory = []
+
+        # the sign records are held in a compact columnar store rather than a dictionary of strings per row
+        if records is None:
+            read_start = time.perf_counter()
+            records = SignRecordStore.from_csv(sign_file)
+            waiting += time.perf_counter() - read_start
+            times.add("Read records",time.perf_counter() - read_start)
+
+        # sign types are found in the library by MUTCD code with a dictionary
+        # library sign types are unit sign panels scaled to the size of each sign
+        wait_start = time.perf_counter()
+        library_file = result(library_file)
+        library = library_file if isinstance(library_file,SignLibrary) else SignLibrary(library_file)
+        waiting += time.perf_counter() - wait_start
+        mapper = SignTypeMapper(model,library,thickness=1.)
+        # sign types are styled once, before their signs map them (styles aren't copied from the library)
+        face_styles = SignFaceStyles(model) if faces else None
+        styled_types = set()
+
+        for record in records:
+            object_id = record.object_id
+            text = record.text
+            mutcd = record.mutcd
+
+            description = f"{object_id} {text}"
+
+            print(f"{description} {mutcd}")
+
+            # note, matching based on mutcd code only. the library sign types are parametric so the
+            # sign is modeled at its measured size rather than matched to a predefined size
+            sign_type = mapper.get_sign_type(mutcd)
+            
+            x = record.x
+            y = record.y
+            z = record.z
+            orientation = math.radians(record.orientation)
+            
+            if sign_type:
+                # sign type found (it is added to the model once by the mapper)
+                signs_found += 1
+                # the mapping scale factors are in inches (the library unit)
+                w = record.width*12.
+                h = record.height*12.
+                # the quantities are the modeled size in feet
+                size = (record.width,record.height)
+                if not (w > 0. and h > 0.):
+                    # the sign wasn't measured, use its first allowed size
+                    w, h = mapper.library_size(mutcd) or (12.,12.)
+                    size = (w/12.,h/12.)
+                if face_styles and sign_type.id() not in styled_types:
+                    styled_types.add(sign_type.id())
+                    url = sign_face_url(faces,mutcd)
+                    if url:
+                        face_styles.style_sign_type(sign_type,url)
+                sign_reps = mapper.representations(sign_type,w,h,contexts)
+            else:
+                # sign type not found, create a unique type
+#                mutcd_code_not_supported_types.append(mutcd)
+                signs_not_found += 1
+                w = record.width
+                h = record.height
+                if not (w > 0. and h > 0.):
+                    # the sign wasn't measured, there is no library size so it is modeled 1' x 1'
+                    print(f"Warning: {description} {mutcd} size {w} x {h} is not positive, modeled 1' x 1'")
+                    w, h = 1., 1.
+                size = (w,h)
+                # the shape is guessed from the MUTCD code, the measured width and height are the bounding box
+                shape, parameters = shape_for_mutcd(mutcd)
+                rep_maps = [model.createIfcRepresentationMap(MappingOrigin=mapping_origin,MappedRepresentation=rep) for rep in shapes.representations(mutcd,contexts,shape,w,h,**parameters)]
+                sign_type = model.createIfcSignType(GlobalId=ifcopenshell.guid.new(),Name=mutcd,Description=description,PredefinedType="PICTORAL",RepresentationMaps=rep_maps)
+                url = sign_face_url(faces,mutcd) if face_styles else None
+                if url:
+                    face_styles.style_sign_type(sign_type,url)
+                    rep_maps = sign_type.RepresentationMaps
+                sign_reps = [model.createIfcShapeRepresentation(ContextOfItems=rep_map.MappedRepresentation.ContextOfItems,RepresentationIdentifier=rep_map.MappedRepresentation.RepresentationIdentifier,RepresentationType="MappedRepresentation",Items=[model.createIfcMappedItem(MappingSource=rep_map,MappingTarget=mapping_target)]) for rep_map in rep_maps]
+
+                                    
+            sign_placement = model.createIfcLocalPlacement(
+                    RelativePlacement=model.createIfcAxis2Placement3D(
+                       Location=model.createIfcCartesianPoint((x,y,z)),
+                       RefDirection=model.createIfcDirection((math.cos(orientation),math.sin(orientation),0.)),
+                       Axis=model.createIfcDirection((math.sin(orientation),-math.cos(orientation),0.0))
                     )
-                    
-                mapped_item = model.createIfcMappedItem(MappingSource=sign_type.RepresentationMaps[0],MappingTarget=mapping_target)
-                sign_rep = model.createIfcShapeRepresentation(ContextOfItems=body_model_context,RepresentationIdentifier="Body",RepresentationType="MappedRepresentation",Items=[mapped_item])
-                product_rep = model.createIfcProductDefinitionShape(Representations=[sign_rep])
+                )
+
+
+            product_rep = model.createIfcProductDefinitionShape(Representations=sign_reps)
 
-                sign = model.createIfcSign(GlobalId=ifcopenshell.guid.new(),Name=description,ObjectPlacement=sign_placement,Representation=product_rep)
+            sign = model.createIfcSign(GlobalId=ifcopenshell.guid.new(),Name=description,ObjectPlacement=sign_placement,Representation=product_rep)
 
-                # collect all the signs for each type so we can assign type to signs after creating all signs and types
-                sign_types[sign_type].append(sign)
+            # collect all the signs for each type so we can assign type to signs after creating all signs and types
+            sign_types[sign_type].append(sign)
 
-                signs_modeled += 1
+            all_signs.append(sign)
+            all_sign_types.append(sign_type)
+            widths.append(size[0])
+            heights.append(size[1])
+            inventory.append(tsms.get(object_id) if tsms else None)
+
+            signs_modeled += 1
 
     except FileNotFoundError:
-        print(f"Error: File '{sign_file}' not found.")
+        error = f"File '{sign_file}' not found."
+        print(f"Error: {error}")
     except Exception as e:
+        error = str(e)
         print(f"An error occurred: {e}")
 
+    # relationships are collected and written in one flush - one IfcRelDefinesByType per sign type,
+    # one IfcRelContainedInSpatialStructure for the site, and one IfcRelDeclares for the project
+    relationship_writer = RelationshipWriter(model)
     sign_types = dict(sign_types)
     for sign_type, signs in sign_types.items():
         # assign all of the signs of a given type to the type definition
-        model.createIfcRelDefinesByType(GlobalId=ifcopenshell.guid.new(),RelatedObjects=signs,RelatingType=sign_type)
+        relationship_writer.assign_type(sign_type,signs)
         # assign all the signs for this type to the site spatial container
-        ifcopenshell.api.spatial.assign_container(model,relating_structure=site,products=signs)
+        relationship_writer.assign_container(site,signs)
+
+    # the IDS requires Width and Height in Qto_SignBaseQuantities
+    property_writer = PropertyWriter(model)
+    property_writer.add_qtos(all_signs,"Qto_SignBaseQuantities",{"Width":widths,"Height":heights},types=all_sign_types)
+    if tsms:
+        # the inventory attributes describe each sign in the field so they are not moved to the sign types
+        columns = {name:[attributes.get(name) if attributes else None for attributes in inventory] for name in TSMS_PROPERTY_NAMES}
+        property_writer.add_psets(all_signs,TSMS_PSET_NAME,columns)
+        print(f"Signs with TSMS inventory attributes: {sum(1 for attributes in inventory if attributes)}")
+    property_writer.flush()
+
+    # classify all of the signs with the WSDOT sign data dictionary using a single IfcRelAssociatesClassification
+    if dictionary is None:
+        dictionary = BsddDictionary.load("Data Dictionary/wsdotsigns_0.5.json")
+    classifier = BulkClassifier(model,dictionary)
+    classifier.classify(all_signs,"SIGN")
+    classifier.flush()
 
     sign_types = list(sign_types.keys())
-    model.createIfcRelDeclares(GlobalId=ifcopenshell.guid.new(),RelatingContext=project,RelatedDefinitions=sign_types)
+    relationship_writer.assign_declaration(project,sign_types)
+    relationship_writer.flush()
 
-    model.write("Test_Corridor_Signs.ifc")
+    times.add("Build",time.perf_counter() - start - waiting)
+    if writer:
+        writer.write(model,file_name)
+    else:
+        with times.phase("Write"):
+            write_model(model,file_name)
 
     print(f"Signs found in MUTCD library: {signs_found}")
     print(f"Signs not found in MUTCD library: {signs_not_found}")
     print(f"Signs modeled: {signs_modeled}")
     print("Sign types used: " + str(len(sign_types)))
+    if report:
+        times.report()
+
+    # the sign types found in the MUTCD library keep their library GlobalId so they can be matched across tiles
+    # error is None if all of the sign records were modeled
+    return {
+        "sign_count":signs_modeled,
+        "error":error,
+        "sign_types":[{"GlobalId":sign_type.GlobalId,"Name":sign_type.Name,"Description":sign_type.Description} for sign_type in sign_types]
+    }
 
 #    type_counts = Counter(mutcd_code_not_supported_types)
 #    for item_type, count in type_counts.most_common():
 #        print(f"{item_type}: {count}")
 
+def remove_duplicates(records,distance=2.,angle=15.):
+    # one record for each cluster of duplicate detections
+    clusters = find_duplicates(records,distance,angle)
+    summary = clusters.summary()
+    print(f"Duplicate detections: {summary['detections in clusters']} in {summary['clusters']} clusters, {summary['records after merging']} records after merging")
+    return merge_duplicates(records,clusters)
+
+
+def remove_tile_file(file_name):
+    # tiles in the rocksdb format are folders
+    if os.path.isdir(file_name):
+        shutil.rmtree(file_name)
+    elif os.path.exists(file_name):
+        os.remove(file_name)
+
+
+def build_tiles(tile_size=5280.,folder="Test_Corridor_Tiles",tiles=None,sequential=False,format="ifc",library_name="MUTCD_Sign_Library.ifc",tsms_file=None,tsms_distance=100.,dedup=None,fallback=False,faces=None):
+    # write the signs in tiles of a state plane grid, one IFC file per tile, and a manifest of the tiles
+    # tile (column,row) covers column*tile_size <= X < (column+1)*tile_size and row*tile_size <= Y < (row+1)*tile_size
+    # tiles is a list of (column,row) to rebuild, None rebuilds all tiles
+    # unless sequential is True, the library is opened while the records are read and tiles are written while the next tile is built
+    # format is the storage format of the tiles (see sign_storage.py)
+    # tsms_file is the TSMS inventory workbook joined to the signs, or None
+    # dedup is (distance, angle) to merge duplicate detections, or None
+    # fallback adds the Body-Fallback level of detail to the signs
+    # faces is a folder of sign face images named <MUTCD code>.png, or None
+    times = PhaseTimes()
+    library_name = library_variant("foot",library_name)
+    if sequential:
+        with times.phase("Load library"):
+            library_file = open_model(library_name)
+    else:
+        library_file = load_in_background(open_model,library_name,times=times)
+    with times.phase("Read records"):
+        records = SignRecordStore.from_csv("Sign_Face.csv")
+    if dedup:
+        with times.phase("Remove duplicates"):
+            records = remove_duplicates(records,*dedup)
+    tsms = None
+    if tsms_file:
+        with times.phase("Join TSMS"):
+            tsms = join_tsms(records,tsms_file,tsms_distance).matches
+    # with a single CPU the writer and the build would take turns, so the tiles are written in sequence
+    writer = None if sequential or (os.cpu_count() or 1) < 2 else BackgroundWriter(times=times)
+
+    located = ~(np.isnan(records.x) | np.isnan(records.y))
+    if not located.all():
+        print(f"{np.count_nonzero(~located)} signs do not have coordinates and are not in any tile")
+    columns = np.full(len(records),-1,dtype=np.int64)
+    rows = np.full(len(records),-1,dtype=np.int64)
+    columns[located] = np.floor(records.x[located]/tile_size).astype(np.int64)
+    rows[located] = np.floor(records.y[located]/tile_size).astype(np.int64)
+
+    os.makedirs(folder,exist_ok=True)
+    manifest_file = os.path.join(folder,"manifest.json")
+
+    # when selected tiles are rebuilt the other entries of the manifest are kept
+    entries = {}
+    if tiles is not None and os.path.exists(manifest_file):
+        with open(manifest_file,mode='r',encoding='utf-8') as f:
+            manifest = json.load(f)
+        if manifest["tile_size"] != tile_size:
+            raise ValueError(f"{manifest_file} has a tile size of {manifest['tile_size']}, rebuild all tiles to change the tile size")
+        entries = {(entry["column"],entry["row"]):entry for entry in manifest["tiles"]}
+
+    keys = sorted(set(zip(columns[located].tolist(),rows[located].tolist())))
+    for column, row in keys:
+        if tiles is not None and (column,row) not in tiles:
+            continue
+        indices = np.flatnonzero(located & (columns == column) & (rows == row))
+        tile_records = records.take(indices)
+        file_name = f"Tile_{column}_{row}{FORMATS[format]}"
+        if (column,row) in entries and entries[(column,row)]["file"] != file_name:
+            # the tile was written in another format
+            remove_tile_file(os.path.join(folder,entries[(column,row)]["file"]))
+        print(f"Tile {column},{row}: {len(tile_records)} signs")
+        summary = build_signs(tile_records,os.path.join(folder,file_name),library_file,site_name=f"Tile {column},{row}",writer=writer,times=times,tsms=tsms,fallback=fallback,faces=faces)
+        entries[(column,row)] = {
+            "file":file_name,
+            "column":column,
+            "row":row,
+            "bounds":[column*tile_size,row*tile_size,(column + 1)*tile_size,(row + 1)*tile_size],
+            "extent":[float(np.nanmin(tile_records.x)),float(np.nanmin(tile_records.y)),float(np.nanmax(tile_records.x)),float(np.nanmax(tile_records.y))],
+            "sign_count":summary["sign_count"],
+            "sign_types":summary["sign_types"],
+        }
+
+    # wait for the tiles to be written. tiles that could not be written are left out of the manifest
+    if writer:
+        for failed_file in writer.close():
+            failed_file = os.path.basename(failed_file)
+            for key in [key for key, entry in entries.items() if entry["file"] == failed_file]:
+                del entries[key]
+
+    # remove tiles that no longer have signs
+    for key in list(entries.keys()):
+        if key not in keys:
+            remove_tile_file(os.path.join(folder,entries.pop(key)["file"]))
+
+    manifest = {
+        "source":"Sign_Face.csv",
+        "library":os.path.basename(library_name),
+        "length_unit":"foot",
+        "tile_size":tile_size,
+        "sign_count":sum(entry["sign_count"] for entry in entries.values()),
+        "tiles":[entries[key] for key in sorted(entries.keys())],
+    }
+    with open(manifest_file,mode='w',encoding='utf-8') as f:
+        json.dump(manifest,f,indent=1)
+
+    print(f"Tiles written: {len(manifest['tiles'])}")
+    times.report()
+    return manifest
+
+
+def find_tiles(manifest_file,x,y,distance=0.):
+    # IFC files of the tiles that have signs within distance of (x,y)
+    with open(manifest_file,mode='r',encoding='utf-8') as f:
+        manifest = json.load(f)
+    folder = os.path.dirname(manifest_file)
+    files = []
+    for entry in manifest["tiles"]:
+        min_x, min_y, max_x, max_y = entry["extent"]
+        dx = max(min_x - x,0.,x - max_x)
+        dy = max(min_y - y,0.,y - max_y)
+        if dx*dx + dy*dy <= distance*distance:
+            files.append(os.path.join(folder,entry["file"]))
+    return files
+
+
 if __name__ == "__main__":
-    build_signs()
+    parser = argparse.ArgumentParser(description="Build the test corridor sign model")
+    parser.add_argument("--tile-size",type=float,default=None,help="write tiles of this size (feet) instead of a single model")
+    parser.add_argument("--tiles",nargs="*",default=None,help="tiles to rebuild as column,row (default is all tiles)")
+    parser.add_argument("--sequential",action="store_true",help="load, read, build, and write one after the other (for comparison)")
+    parser.add_argument("--format",choices=list(FORMATS.keys()),default="ifc",help="storage format of the model or tiles")
+    parser.add_argument("--library",default="MUTCD_Sign_Library.ifc",help="MUTCD sign library file")
+    parser.add_argument("--tsms",default=None,help="TSMS sign inventory workbook to join to the signs, e.g. SR104TSMSSigns.svc.xlsx")
+    parser.add_argument("--tsms-distance",type=float,default=100.,help="TSMS match distance (ft)")
+    parser.add_argument("--fallback",action="store_true",help="add the Body-Fallback triangulated level of detail to the signs")
+    parser.add_argument("--faces",default=None,help="folder of sign face images named <MUTCD code>.png to style the sign types")
+    parser.add_argument("--dedup",action="store_true",help="merge duplicate detections of the same sign before modeling")
+    parser.add_argument("--dedup-distance",type=float,default=2.,help="duplicate match distance (ft)")
+    parser.add_argument("--dedup-angle",type=float,default=15.,help="duplicate orientation tolerance (degrees)")
+    args = parser.parse_args()
+    dedup = (args.dedup_distance,args.dedup_angle) if args.dedup else None
+
+    if args.tile_size:
+        tiles = [tuple(int(v) for v in tile.split(",")) for tile in args.tiles] if args.tiles else None
+        build_tiles(args.tile_size,tiles=tiles,sequential=args.sequential,format=args.format,library_name=args.library,tsms_file=args.tsms,tsms_distance=args.tsms_distance,dedup=dedup,fallback=args.fallback,faces=args.faces)
+    else:
+        records = SignRecordStore.from_csv("Sign_Face.csv") if args.tsms or dedup else None
+        if dedup:
+            records = remove_duplicates(records,*dedup)
+        tsms = None
+        if args.tsms:
+            join = join_tsms(records,args.tsms,args.tsms_distance)
+            for name, count in join.summary().items():
+                print(f"TSMS {name}: {count}")
+            tsms = join.matches
+        build_signs(records,file_name=format_file_name("Test_Corridor_Signs.ifc",args.format),library_file=args.library,sequential=args.sequential,tsms=tsms,fallback=args.fallback,faces=args.faces)
     print("Done")
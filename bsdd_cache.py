@@ -0,0 +1,297 @@
+"""
+Offline snapshot of a bSDD data dictionary and bulk classification of signs
+
+Richard Brice, PE
+WSDOT Bridge and Structures Office
+
+Build_Sign_with_bSDD_Classification.py hard codes the class and property URIs of the WSDOT sign data dictionary.
+Classifying a real sign inventory would require a bSDD lookup for every class and property, which isn't possible
+on build machines without internet access.
+
+BsddDictionary holds the classes, properties, and allowed values of a dictionary in memory with indexes by code and URI.
+It is saved to and loaded from a JSON snapshot file. Snapshots can be created from an Excel2bSDD workbook (the format
+used to upload dictionaries to bSDD) or from the WSDOT sign data dictionary workbook.
+
+BulkClassifier creates one IfcClassificationReference per class and relates all of the classified objects with a
+single IfcRelAssociatesClassification per class.
+
+Run this script directly to create the snapshot of the WSDOT sign data dictionary from
+Data Dictionary/DraftFinal_DataDictionary_Signs.xlsx. Reading workbooks requires openpyxl. Loading a snapshot does not.
+"""
+
+import ifcopenshell
+import ifcopenshell.guid
+import json
+from collections import defaultdict
+
+
+SNAPSHOT_FORMAT = "bsdd-snapshot"
+SNAPSHOT_VERSION = 1
+
+# data types in the WSDOT sign data dictionary workbook mapped to bSDD data types
+DATA_TYPES = {
+    "alphanumeric":"String",
+    "string":"String",
+    "list":"String",
+    "integer":"Integer",
+    "float":"Real",
+    "float/decimal":"Real",
+    "date":"Time",
+    "date/time":"Time",
+}
+
+# value constraints of the WSDOT sign data dictionary properties. the workbook only gives the data type
+# the MUTCD pattern is the same as the MUTCD designation pattern in Signs.ids
+DATA_DICTIONARY_CONSTRAINTS = {
+    "MUTCD":{"pattern":r"[DMRW]\d+-\d+[a-z]?[PLR]?"},
+    "sign_ht":{"min_exclusive":0},
+    "sign_width":{"min_exclusive":0},
+    "sign_posts":{"min_inclusive":0},
+    "sign_height":{"min_inclusive":0},
+    "sign_reflectivity":{"allowed_values":["Pass","Fail"]},
+}
+
+# value constraints of bSDD properties
+CONSTRAINTS = ["min_inclusive","max_inclusive","min_exclusive","max_exclusive","pattern"]
+EXCEL2BSDD_CONSTRAINTS = {"MinInclusive":"min_inclusive","MaxInclusive":"max_inclusive","MinExclusive":"min_exclusive","MaxExclusive":"max_exclusive","Pattern":"pattern"}
+
+
+class BsddDictionary:
+    def __init__(self,organization,code,version,name=None,uri=None):
+        self.organization = organization
+        self.code = code
+        self.version = version
+        self.name = name if name else code
+        self.uri = uri if uri else f"https://identifier.buildingsmart.org/uri/{organization}/{code}/{version}"
+        self.classes = {} # code -> class dictionary
+        self.properties = {} # code -> property dictionary
+        self.by_uri = {} # uri -> class or property dictionary
+        self.classes_by_entity = defaultdict(list) # IFC entity name (upper case) -> class dictionaries
+
+    def add_class(self,code,name=None,definition=None,related_ifc_entities=None,properties=None,uri=None):
+        ifc_class = {
+            "code":code,
+            "name":name if name else code,
+            "uri":uri if uri else f"{self.uri}/class/{code}",
+            "definition":definition,
+            "related_ifc_entities":list(related_ifc_entities or []),
+            "properties":list(properties or []),
+        }
+        self.classes[code] = ifc_class
+        self.by_uri[ifc_class["uri"]] = ifc_class
+        for entity in ifc_class["related_ifc_entities"]:
+            self.classes_by_entity[entity.upper()].append(ifc_class)
+        return ifc_class
+
+    def add_property(self,code,name=None,definition=None,data_type="String",allowed_values=None,uri=None,**constraints):
+        # constraints are the bSDD value restrictions min_inclusive, max_inclusive, min_exclusive, max_exclusive, and pattern
+        prop = {
+            "code":code,
+            "name":name if name else code,
+            "uri":uri if uri else f"{self.uri}/prop/{code}",
+            "definition":definition,
+            "data_type":data_type,
+            "allowed_values":list(allowed_values or []),
+        }
+        for key in CONSTRAINTS:
+            if constraints.get(key) is not None:
+                prop[key] = constraints[key]
+        self.properties[code] = prop
+        self.by_uri[prop["uri"]] = prop
+        prop["allowed_value_set"] = set(prop["allowed_values"])
+        return prop
+
+    def get_class(self,code):
+        return self.classes.get(code)
+
+    def get_property(self,code):
+        return self.properties.get(code)
+
+    def class_uri(self,code):
+        ifc_class = self.classes.get(code)
+        return ifc_class["uri"] if ifc_class else None
+
+    def property_uri(self,code):
+        prop = self.properties.get(code)
+        return prop["uri"] if prop else None
+
+    def property_specifications(self,codes):
+        # specification URIs for PropertyWriter (sign_properties.py)
+        return {code:self.properties[code]["uri"] for code in codes if code in self.properties}
+
+    def classes_for_entity(self,entity):
+        return self.classes_by_entity.get(entity.upper(),[])
+
+    def is_allowed_value(self,code,value):
+        # properties without a list of allowed values accept any value
+        prop = self.properties.get(code)
+        if prop is None:
+            return False
+        return not prop["allowed_value_set"] or value in prop["allowed_value_set"]
+
+    def save(self,file_path):
+        snapshot = {
+            "format":SNAPSHOT_FORMAT,
+            "format_version":SNAPSHOT_VERSION,
+            "dictionary":{"organization":self.organization,"code":self.code,"version":self.version,"name":self.name,"uri":self.uri},
+            "classes":list(self.classes.values()),
+            "properties":[{key:value for key, value in prop.items() if key != "allowed_value_set"} for prop in self.properties.values()],
+        }
+        with open(file_path,mode='w',encoding='utf-8') as f:
+            json.dump(snapshot,f,indent=1,default=str)
+
+    @staticmethod
+    def load(file_path):
+        with open(file_path,mode='r',encoding='utf-8') as f:
+            snapshot = json.load(f)
+        if snapshot.get("format") != SNAPSHOT_FORMAT:
+            raise ValueError(f"{file_path} is not a bSDD snapshot")
+
+        header = snapshot["dictionary"]
+        dictionary = BsddDictionary(header["organization"],header["code"],header["version"],header.get("name"),header.get("uri"))
+        for ifc_class in snapshot["classes"]:
+            dictionary.add_class(ifc_class["code"],ifc_class.get("name"),ifc_class.get("definition"),ifc_class.get("related_ifc_entities"),ifc_class.get("properties"),ifc_class.get("uri"))
+        for prop in snapshot["properties"]:
+            dictionary.add_property(prop["code"],prop.get("name"),prop.get("definition"),prop.get("data_type","String"),prop.get("allowed_values"),prop.get("uri"),**{key:prop.get(key) for key in CONSTRAINTS})
+        return dictionary
+
+
+def _read_sheet(workbook,sheet_name,first_header):
+    # Excel2bSDD sheets have several rows of notes above the header row. Find the header and read the rows below it
+    worksheet = workbook[sheet_name]
+    header = None
+    for row in worksheet.iter_rows(values_only=True):
+        if header is None:
+            if first_header in row:
+                header = [str(value).strip("()") if value is not None else None for value in row]
+            continue
+        if all(value is None for value in row):
+            continue
+        yield {key:value for key, value in zip(header,row) if key is not None}
+
+
+def _parse_list(value):
+    # list values are stored as JSON text, e.g. ["IfcSign","IfcSignType"]
+    if value is None:
+        return []
+    try:
+        return json.loads(value)
+    except (TypeError,ValueError):
+        return [v.strip() for v in str(value).split(",") if v.strip()]
+
+
+def from_excel2bsdd(file_path):
+    import openpyxl
+
+    workbook = openpyxl.load_workbook(file_path,read_only=True,data_only=True)
+    header = next(_read_sheet(workbook,"Dictionary","OrganizationCode"))
+    dictionary = BsddDictionary(header["OrganizationCode"],header["DictionaryCode"],str(header["DictionaryVersion"]),header.get("DictionaryName"),header.get("DictionaryUri"))
+
+    allowed_values = defaultdict(list)
+    for row in _read_sheet(workbook,"AllowedValue","Value"):
+        code = row.get("Origin Property Code")
+        if code and row.get("Value") is not None:
+            allowed_values[code].append(row["Value"])
+
+    for row in _read_sheet(workbook,"Property","Code"):
+        if row.get("Code"):
+            constraints = {key:row.get(column) for column, key in EXCEL2BSDD_CONSTRAINTS.items()}
+            dictionary.add_property(row["Code"],row.get("Name"),row.get("Definition"),row.get("DataType") or "String",allowed_values.get(row["Code"]),**constraints)
+
+    class_properties = defaultdict(list)
+    for row in _read_sheet(workbook,"ClassProperty","PropertyCode"):
+        if row.get("Origin Class Code") and row.get("PropertyCode"):
+            class_properties[row["Origin Class Code"]].append(row["PropertyCode"])
+
+    for row in _read_sheet(workbook,"Class","Code"):
+        if row.get("Code"):
+            dictionary.add_class(row["Code"],row.get("Name"),row.get("Definition"),_parse_list(row.get("RelatedIfcEntityNamesList")),class_properties.get(row["Code"]))
+
+    workbook.close()
+    return dictionary
+
+
+def from_data_dictionary(file_path,organization="wsdot",code="wsdotsigns",version="0.5"):
+    # the WSDOT sign data dictionary workbook lists properties only (Field Name, Standardized Field Name, Description, Source, Data Type, Priority)
+    # all properties are assigned to the SIGN class
+    import openpyxl
+
+    dictionary = BsddDictionary(organization,code,version,name="WSDOT Signs")
+    workbook = openpyxl.load_workbook(file_path,read_only=True,data_only=True)
+    rows = workbook.worksheets[0].iter_rows(values_only=True)
+    next(rows)
+    for row in rows:
+        field_name, standardized_name, description, source, data_type, priority = row[:6]
+        if not field_name:
+            continue
+        data_type = DATA_TYPES.get(str(data_type).strip().lower(),"String") if data_type else "String"
+        field_name = str(field_name).strip()
+        constraints = DATA_DICTIONARY_CONSTRAINTS.get(field_name,{})
+        dictionary.add_property(field_name,str(standardized_name).strip() if standardized_name else None,description,data_type,**constraints)
+    workbook.close()
+
+    dictionary.add_class("SIGN","Sign",related_ifc_entities=["IfcSign","IfcSignType"],properties=list(dictionary.properties.keys()))
+    return dictionary
+
+
+class BulkClassifier:
+    def __init__(self,model,dictionary,source=None):
+        self.model = model
+        self.dictionary = dictionary
+        self.references = {} # class code -> IfcClassificationReference
+        self.related_objects = defaultdict(list) # class code -> objects
+        self.relationships = {} # class code -> IfcRelAssociatesClassification
+
+        # reuse the classification if it is already in the model
+        self.classification = None
+        for classification in model.by_type("IfcClassification"):
+            if classification.Name == dictionary.code and classification.Edition == dictionary.version:
+                self.classification = classification
+                break
+        if self.classification is None:
+            self.classification = model.createIfcClassification(Source=source if source else dictionary.organization,Edition=dictionary.version,Name=dictionary.code,Specification=dictionary.uri)
+
+    def get_reference(self,code):
+        reference = self.references.get(code)
+        if reference is None:
+            ifc_class = self.dictionary.get_class(code)
+            if ifc_class is None:
+                return None
+            reference = self.model.createIfcClassificationReference(Location=ifc_class["uri"],Identification=code,Name=ifc_class["name"],ReferencedSource=self.classification)
+            self.references[code] = reference
+        return reference
+
+    def classify(self,objects,codes):
+        # codes is a single class code for all objects or a list of class codes, one per object
+        if isinstance(codes,str):
+            codes = [codes]*len(objects)
+        not_found = 0
+        for obj, code in zip(objects,codes):
+            if code is None:
+                continue
+            if self.get_reference(code) is None:
+                not_found += 1
+                continue
+            self.related_objects[code].append(obj)
+        if not_found:
+            print(f"{not_found} objects have classes that are not in {self.dictionary.code} {self.dictionary.version}")
+        return not_found
+
+    def flush(self):
+        # one IfcRelAssociatesClassification per class
+        for code, objects in self.related_objects.items():
+            rel = self.relationships.get(code)
+            if rel:
+                rel.RelatedObjects = list(rel.RelatedObjects) + objects
+            else:
+                self.relationships[code] = self.model.createIfcRelAssociatesClassification(GlobalId=ifcopenshell.guid.new(),RelatedObjects=objects,RelatingClassification=self.references[code])
+        count = len(self.related_objects)
+        self.related_objects.clear()
+        return count
+
+
+if __name__ == "__main__":
+    dictionary = from_data_dictionary("Data Dictionary/DraftFinal_DataDictionary_Signs.xlsx")
+    dictionary.save(f"Data Dictionary/{dictionary.code}_{dictionary.version}.json")
+    print(f"{len(dictionary.classes)} classes, {len(dictionary.properties)} properties")
+    print("Done")
@@ -0,0 +1,165 @@
+"""
+Template driven sign assemblies
+
+Richard Brice, PE
+WSDOT Bridge and Structures Office
+
+Build_All_Way_Stop_Model.py originally created every placement, direction, and product shape by hand for each of the
+four Stop + All Way sign assemblies. That doesn't scale to thousands of intersections.
+
+An AssemblyTemplate describes the signs in an assembly (MUTCD code, size, and offset relative to the assembly).
+AssemblyBuilder instantiates templates at locations read from a table (Name, Template, X, Y, Z, Heading).
+1) Sign types are found in the MUTCD sign library and added to the model once (SignTypeMapper, sign_library.py). The
+   member size is applied by the mapping of the parametric sign type geometry
+2) Each template member has one IfcProductDefinitionShape and one relative IfcAxis2Placement3D shared by all instances
+3) Directions are shared by heading
+4) Relationships are written in bulk with RelationshipWriter (sign_relationships.py) - one IfcRelContainedInSpatialStructure
+   for all assemblies, one IfcRelDefinesByType per sign type, and one IfcRelAggregates per assembly (an aggregate has a
+   single relating object)
+"""
+
+import ifcopenshell
+import ifcopenshell.guid
+import csv
+import math
+from collections import defaultdict
+from sign_library import SignTypeMapper
+from sign_relationships import RelationshipWriter
+
+
+class AssemblyMember:
+    # a sign in an assembly template
+    # offset is the location of the sign relative to the assembly placement, in model units
+    def __init__(self,name,mutcd,size,offset):
+        self.name = name
+        self.mutcd = mutcd
+        self.size = size
+        self.offset = tuple(float(v) for v in offset)
+
+
+class AssemblyTemplate:
+    def __init__(self,name,members,object_type="SIGNASSEMBLY"):
+        self.name = name
+        self.members = members
+        self.object_type = object_type
+
+
+# a 36x36 Stop sign with its center point 8ft above the ground and an 18x6 All Way plaque 1" beneath it (inch units)
+STOP_ALL_WAY = AssemblyTemplate("Stop All Way",[
+    AssemblyMember("Stop Sign","R1-1","36x36",(0.,0.,8.*12.)),
+    AssemblyMember("All Way Sign","R1-3P","18x6",(0.,0.,8.*12. - 36./2. - 6./2 - 1.)),
+])
+
+TEMPLATES = {STOP_ALL_WAY.name:STOP_ALL_WAY}
+
+LOCATION_FIELDNAMES = ["Name","Template","X","Y","Z","Heading"]
+
+
+def read_assembly_locations(file_path):
+    # Heading is the direction of the assembly local X axis measured counterclockwise from the site X axis, in degrees
+    locations = []
+    with open(file_path,mode='r',newline='',encoding='utf-8') as csvfile:
+        next(csvfile)
+        reader = csv.DictReader(csvfile,fieldnames=LOCATION_FIELDNAMES)
+        for row in reader:
+            locations.append((row["Name"],row["Template"],float(row["X"]),float(row["Y"]),float(row["Z"] or 0.),float(row["Heading"] or 0.)))
+    return locations
+
+
+class AssemblyBuilder:
+    # library is a SignLibrary and thickness is the sign thickness in inches
+    def __init__(self,model,library,context,site,templates=TEMPLATES,thickness=1.):
+        self.model = model
+        self.library = library
+        self.context = context
+        self.site = site
+        self.templates = templates
+
+        self.mapper = SignTypeMapper(model,library,thickness=thickness)
+        self.members = {} # template name -> [(member, sign type, product shape, relative placement)]
+        self.directions = {} # direction tuple -> IfcDirection
+
+        self.assemblies = []
+        self.aggregates = [] # (assembly, signs)
+        self.typed_signs = defaultdict(list) # sign type -> signs
+
+    def get_direction(self,ratios):
+        # directions are rounded so that nearly identical headings share an entity
+        ratios = tuple(round(v,12) + 0. for v in ratios)
+        direction = self.directions.get(ratios)
+        if direction is None:
+            direction = self.model.createIfcDirection(ratios)
+            self.directions[ratios] = direction
+        return direction
+
+    def get_members(self,template):
+        members = self.members.get(template.name)
+        if members is None:
+            # the signs in the MUTCD library are defined in the X-Y plane with the Z-direction being normal to the face of the sign
+            # when installed the local Z-direction points in the -Y direction of the assembly
+            sign_face_direction = self.get_direction((0.,-1.,0.))
+            members = []
+            for member in template.members:
+                sign_type = self.mapper.get_sign_type(member.mutcd)
+                size = self.mapper.library_size(member.mutcd,member.size) if sign_type else None
+                if size is None:
+                    print(f"{member.mutcd} {member.size} - Sign type not found")
+                    continue
+                mapped_item = self.mapper.mapped_item(sign_type,*size)
+                rep = self.model.createIfcShapeRepresentation(ContextOfItems=self.context,RepresentationIdentifier="Body",RepresentationType="MappedRepresentation",Items=[mapped_item])
+                product_shape = self.model.createIfcProductDefinitionShape(Representations=[rep])
+                relative_placement = self.model.createIfcAxis2Placement3D(Location=self.model.createIfcCartesianPoint(member.offset),Axis=sign_face_direction)
+                members.append((member,sign_type,product_shape,relative_placement))
+            self.members[template.name] = members
+        return members
+
+    def add_assembly(self,name,template,x,y,z,heading):
+        if isinstance(template,str):
+            template = self.templates[template]
+
+        angle = math.radians(heading)
+        placement = self.model.createIfcLocalPlacement(
+            PlacementRelTo=self.site.ObjectPlacement,
+            RelativePlacement=self.model.createIfcAxis2Placement3D(
+                Location=self.model.createIfcCartesianPoint((x,y,z)),
+                RefDirection=self.get_direction((math.cos(angle),math.sin(angle),0.)),
+                Axis=self.get_direction((0.,0.,1.))
+                )
+            )
+        assembly = self.model.createIfcElementAssembly(GlobalId=ifcopenshell.guid.new(),Name=name,ObjectPlacement=placement,AssemblyPlace="SITE",PredefinedType="USERDEFINED",ObjectType=template.object_type)
+
+        signs = []
+        for member, sign_type, product_shape, relative_placement in self.get_members(template):
+            sign_placement = self.model.createIfcLocalPlacement(PlacementRelTo=placement,RelativePlacement=relative_placement)
+            sign = self.model.createIfcSign(GlobalId=ifcopenshell.guid.new(),Name=member.name,ObjectPlacement=sign_placement,Representation=product_shape)
+            self.typed_signs[sign_type].append(sign)
+            signs.append(sign)
+
+        self.assemblies.append(assembly)
+        self.aggregates.append((assembly,signs))
+        return assembly
+
+    def add_assemblies(self,locations):
+        # locations is a sequence of (Name, Template, X, Y, Z, Heading)
+        return [self.add_assembly(*location) for location in locations]
+
+    def flush(self,project=None):
+        # write all the relationships at once
+        relationship_writer = RelationshipWriter(self.model)
+        for assembly, signs in self.aggregates:
+            relationship_writer.assign_object(assembly,signs)
+
+        relationship_writer.assign_container(self.site,self.assemblies)
+
+        for sign_type, signs in self.typed_signs.items():
+            relationship_writer.assign_type(sign_type,signs)
+
+        sign_types = [sign_type for sign_type in self.mapper.sign_types.values() if sign_type]
+        if project:
+            relationship_writer.assign_declaration(project,sign_types)
+
+        relationship_writer.flush()
+
+        self.assemblies = []
+        self.aggregates = []
+        self.typed_signs = defaultdict(list)
@@ -0,0 +1,389 @@
+"""
+MUTCD conformance checks for as-built sign inventories
+
+Richard Brice, PE
+WSDOT Bridge and Structures Office
+
+Implements the "automated evaluation of as-built signs" use case in ReadMe.md. Every sign in an inventory (Sign_Face.csv
+read into a SignRecordStore, or the signs of an IFC model) is checked against MUTCD_Sign_Definitions.csv and
+MUTCD_Variable_Sign_Definitions.csv. The variable dimension signs (guide signs) don't have allowed sizes so only their
+code and shape are checked.
+
+1) MUTCD code - the code is in the sign definitions
+2) Size - the measured width and height match one of the allowed sizes for the road class (the road class column plus
+   the Minimum and Oversized columns) within a tolerance
+3) Shape - the shape code of the inventory matches the definition. Sign_Face.csv doesn't have a shape, so without shape
+   codes the measured aspect ratio is checked against the shape (octagons and diamonds are square, triangles are
+   equilateral, pennants match an allowed size)
+4) Spacing along an alignment - signs are projected to stations and offsets along a path and rules are checked for
+   each side of the road
+   SpacingRule - consecutive signs of a group (e.g. chevrons) are within the spacing limits
+   AdvanceRule - a warning sign (e.g. Stop Ahead) is at least the advance placement distance before the condition
+   sign (e.g. Stop) in the direction of travel
+
+All of the checks are array operations over the whole inventory. MUTCD codes are mapped to rows of the definition
+arrays once per distinct code, and sizes are compared by broadcasting signs x allowed sizes.
+
+The allowed sizes are in inches. They are converted to the bounding box of the sign with bounding_size() from
+sign_shapes.py, the same as Build_Sign_Library.py (e.g. diamond sizes are side lengths).
+
+Usage:
+python sign_conformance.py [--road-class Multi-Lane] [--alignment Alignments/Alignments.ifc "C Line" --origin X Y] [--report conformance.csv]
+
+Run this script with --benchmark to time the sign checks for 1,000,000 signs and the spacing checks for 100,000 signs.
+"""
+
+import argparse
+import csv
+import math
+import numpy as np
+import time
+from sign_records import SignRecordStore
+from sign_shapes import bounding_size
+
+
+ROAD_CLASSES = ["Single Lane","Multi-Lane","Expressway","Freeway"]
+SIZE_COLUMNS = ROAD_CLASSES + ["Minimum","Oversized"]
+
+# typical chevron spacing by advisory speed (mph, feet), MUTCD Table 2C-6
+CHEVRON_SPACING = [(15,40.),(30,80.),(45,120.),(60,160.),(math.inf,200.)]
+
+# advance placement distance of warning signs for a stop (Condition B, 0 mph) by posted speed (mph, feet), MUTCD Table 2C-4
+# no minimum distance is given below 30 mph
+STOP_AHEAD_DISTANCE = [(25,0.),(30,100.),(35,150.),(40,225.),(45,300.),(50,375.),(55,450.),(60,550.),(65,650.),(70,750.),(math.inf,850.)]
+
+
+def _lookup(table,speed):
+    for limit, value in table:
+        if speed <= limit:
+            return value
+    return table[-1][1]
+
+
+class SignDefinitions:
+    def __init__(self,file_paths=("MUTCD_Sign_Definitions.csv","MUTCD_Variable_Sign_Definitions.csv")):
+        # file_paths is a definitions file or a sequence of them, in the format of MUTCD_Sign_Definitions.csv
+        self.codes = []
+        self.names = []
+        shapes = []
+        sizes = []
+        for file_path in [file_paths] if isinstance(file_paths,str) else file_paths:
+            with open(file_path,mode='r',newline='',encoding='utf-8') as csvfile:
+                reader = csv.reader(csvfile)
+                next(reader)
+                for row in reader:
+                    name, code, section = row[:3]
+                    shape = row[9].strip()
+                    self.codes.append(" ".join(code.split()))
+                    self.names.append(name)
+                    shapes.append(shape)
+                    sizes.append([self._bounding_size(size,shape) for size in row[3:9]])
+        self.index = {code:i for i, code in enumerate(self.codes)}
+        self.shapes = np.array(shapes)
+        self.sizes = np.array(sizes,dtype=np.float64) # (definitions, size columns, width/height) in inches, NaN if not allowed
+
+    @staticmethod
+    def _bounding_size(size,shape):
+        # width and height of the bounding box of a sign of this size and shape
+        dimensions = [float(v) for v in size.replace("x"," ").split()]
+        if not dimensions:
+            return (math.nan,math.nan)
+        return bounding_size(shape,dimensions)
+
+    def lookup(self,codes):
+        # row of each code in the definitions, -1 if the code isn't defined
+        unique, inverse = np.unique(np.asarray(codes,dtype=object).astype(str),return_inverse=True)
+        rows = np.array([self.index.get(code,-1) for code in unique],dtype=np.int64)
+        return rows[inverse]
+
+
+class SignInventory:
+    # arrays describing the signs to be checked, sizes in inches
+    def __init__(self,ids,mutcd,x,y,width,height,shapes=None):
+        self.ids = np.asarray(ids)
+        self.mutcd = np.asarray(mutcd,dtype=object)
+        self.x = np.asarray(x,dtype=np.float64)
+        self.y = np.asarray(y,dtype=np.float64)
+        self.width = np.asarray(width,dtype=np.float64)
+        self.height = np.asarray(height,dtype=np.float64)
+        self.shapes = None if shapes is None else np.asarray(shapes)
+
+    def __len__(self):
+        return len(self.ids)
+
+    @staticmethod
+    def from_records(store,length_to_inch=12.):
+        # SignRecordStore (sign_records.py), Sign_Face.csv dimensions are in feet
+        mutcd = np.array(store.mutcd.values,dtype=object)[store.mutcd.codes] if len(store) else np.zeros(0,dtype=object)
+        return SignInventory(store.object_id,mutcd,store.x,store.y,store.width*length_to_inch,store.height*length_to_inch)
+
+    @staticmethod
+    def from_model(model):
+        # signs of an IFC model with Qto_SignBaseQuantities (Build_Test_Corridor_Signs.py)
+        import ifcopenshell.util.unit
+        from sign_export import SignExporter
+        length_to_inch = ifcopenshell.util.unit.calculate_unit_scale(model)/0.0254
+        columns = {"OBJECTID":[],"MUTCD":[],"X":[],"Y":[],"Qto_SignBaseQuantities.Width":[],"Qto_SignBaseQuantities.Height":[]}
+        exporter = SignExporter(model)
+        for batch in exporter.batches():
+            for name in columns:
+                columns[name].extend(batch.get(name,[None]*len(batch["GlobalId"])))
+        width = np.array(columns["Qto_SignBaseQuantities.Width"],dtype=np.float64)*length_to_inch
+        height = np.array(columns["Qto_SignBaseQuantities.Height"],dtype=np.float64)*length_to_inch
+        return SignInventory(columns["OBJECTID"],columns["MUTCD"],columns["X"],columns["Y"],width,height)
+
+
+class ConformanceReport:
+    def __init__(self):
+        self.indices = [] # arrays of sign indices
+        self.rules = [] # rule name for each array
+        self.details = [] # list of detail strings for each array
+
+    def add(self,rule,indices,details):
+        indices = np.asarray(indices,dtype=np.int64)
+        if len(indices):
+            self.indices.append(indices)
+            self.rules.append(rule)
+            self.details.append(details)
+
+    def counts(self):
+        counts = {}
+        for rule, indices in zip(self.rules,self.indices):
+            counts[rule] = counts.get(rule,0) + len(indices)
+        return counts
+
+    def write(self,inventory,file_path):
+        with open(file_path,mode='w',newline='',encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(["OBJECTID","MUTCD","X","Y","Rule","Detail"])
+            for rule, indices, details in zip(self.rules,self.indices,self.details):
+                writer.writerows(zip(inventory.ids[indices].tolist(),inventory.mutcd[indices].tolist(),inventory.x[indices].tolist(),inventory.y[indices].tolist(),[rule]*len(indices),details))
+
+
+def check_signs(inventory,definitions,road_class=None,size_tolerance=0.1,minimum_tolerance=3.,shape_tolerance=0.15,report=None):
+    # size_tolerance is relative, minimum_tolerance is the smallest absolute tolerance in inches
+    report = report if report else ConformanceReport()
+    rows = definitions.lookup(inventory.mutcd)
+
+    unknown = np.flatnonzero(rows < 0)
+    report.add("MUTCD code",unknown,[f"{code} is not in the sign definitions" for code in inventory.mutcd[unknown]])
+
+    known = np.flatnonzero(rows >= 0)
+    width = inventory.width[known]
+    height = inventory.height[known]
+    measured = np.isfinite(width) & np.isfinite(height) & (width > 0.) & (height > 0.)
+    unmeasured = known[~measured]
+    report.add("Size",unmeasured,["size not measured"]*len(unmeasured))
+    known = known[measured]
+    width = width[measured]
+    height = height[measured]
+    known_rows = rows[known]
+
+    # (signs, allowed sizes, 2) broadcast against (signs, 1) measurements
+    columns = [SIZE_COLUMNS.index(road_class),SIZE_COLUMNS.index("Minimum"),SIZE_COLUMNS.index("Oversized")] if road_class else list(range(len(SIZE_COLUMNS)))
+    allowed = definitions.sizes[known_rows][:,columns]
+    tolerance = np.maximum(size_tolerance*allowed,minimum_tolerance)
+    matches = (np.abs(allowed[:,:,0] - width[:,np.newaxis]) <= tolerance[:,:,0]) & (np.abs(allowed[:,:,1] - height[:,np.newaxis]) <= tolerance[:,:,1])
+    has_size = np.isfinite(allowed[:,:,0]).any(axis=1)
+    wrong_size = np.flatnonzero(has_size & ~matches.any(axis=1))
+    # the allowed sizes are formatted once per definition rather than once per sign
+    allowed_text = [", ".join(sorted({f"{w:g}x{h:g}" for w, h in sizes if math.isfinite(w)})) for sizes in definitions.sizes[:,columns]]
+    details = [f"measured {w:.1f}x{h:.1f} in, allowed {allowed_text[row]}" for w, h, row in zip(width[wrong_size].tolist(),height[wrong_size].tolist(),known_rows[wrong_size].tolist())]
+    report.add("Size",known[wrong_size],details)
+
+    shapes = definitions.shapes[known_rows]
+    if inventory.shapes is not None:
+        wrong_shape = np.flatnonzero(inventory.shapes[known] != shapes)
+        report.add("Shape",known[wrong_shape],[f"shape {a}, expected {b}" for a, b in zip(inventory.shapes[known][wrong_shape],shapes[wrong_shape])])
+    else:
+        # aspect ratio (height/width) of the shapes that have a fixed aspect ratio
+        aspect = height/width
+        expected = np.full(len(known),math.nan)
+        expected[(shapes == "O") | (shapes == "D")] = 1.
+        expected[shapes == "T"] = math.sqrt(3.)/2.
+        pennant = shapes == "P"
+        if pennant.any():
+            with np.errstate(invalid="ignore"):
+                expected[pennant] = np.nanmean(allowed[pennant,:,1]/allowed[pennant,:,0],axis=1)
+        wrong_shape = np.flatnonzero(np.isfinite(expected) & (np.abs(aspect - expected) > shape_tolerance*expected))
+        report.add("Shape",known[wrong_shape],[f"aspect ratio {a:.2f} doesn't match shape {s} ({e:.2f})" for a, s, e in zip(aspect[wrong_shape],shapes[wrong_shape],expected[wrong_shape])])
+    return report
+
+
+def project_to_path(x,y,path_points,max_offset=math.inf,block_size=64,chunk_size=4096):
+    # station (distance along the path) and offset (positive to the left) of each point, to the nearest path segment
+    # points farther than max_offset from the path are NaN
+    # the path is processed in blocks of segments and only the points in the bounding box of a block (plus max_offset)
+    # are compared to its segments, so the work grows with the number of signs near the path rather than signs x segments
+    start = path_points[:-1,:2]
+    segment = path_points[1:,:2] - start
+    lengths = np.linalg.norm(segment,axis=1)
+    cumulative = np.concatenate(([0.],np.cumsum(lengths)))
+    length_squared = np.maximum(lengths**2,1e-12)
+    points = np.column_stack((x,y)).astype(np.float64)
+    order = np.argsort(points[:,0],kind="stable")
+    sorted_x = points[order,0]
+    best_distance = np.full(len(points),max_offset**2 if math.isfinite(max_offset) else math.inf)
+    stations = np.full(len(points),math.nan)
+    offsets = np.full(len(points),math.nan)
+    for first in range(0,len(segment),block_size):
+        block = slice(first,first + block_size)
+        ends = np.concatenate((start[block],start[block] + segment[block]))
+        low = ends.min(axis=0) - max_offset
+        high = ends.max(axis=0) + max_offset
+        candidates = order[np.searchsorted(sorted_x,low[0],side="left"):np.searchsorted(sorted_x,high[0],side="right")]
+        candidates = candidates[(points[candidates,1] >= low[1]) & (points[candidates,1] <= high[1])]
+        for chunk in range(0,len(candidates),chunk_size):
+            indices = candidates[chunk:chunk + chunk_size]
+            # (points, segments) projection parameter clamped to the segment
+            relative = points[indices,np.newaxis,:] - start[np.newaxis,block]
+            t = np.clip((relative*segment[np.newaxis,block]).sum(axis=2)/length_squared[block],0.,1.)
+            nearest = relative - t[:,:,np.newaxis]*segment[np.newaxis,block]
+            distance = (nearest**2).sum(axis=2)
+            best = np.argmin(distance,axis=1)
+            rows = np.arange(len(indices))
+            closer = distance[rows,best] < best_distance[indices]
+            indices, rows, best = indices[closer], rows[closer], best[closer]
+            best_distance[indices] = distance[rows,best]
+            stations[indices] = cumulative[first + best] + t[rows,best]*lengths[first + best]
+            cross = segment[first + best,0]*relative[rows,best,1] - segment[first + best,1]*relative[rows,best,0]
+            offsets[indices] = np.sign(cross)*np.sqrt(best_distance[indices])
+    return stations, offsets
+
+
+class SpacingRule:
+    # consecutive signs with these codes on the same side of the road are min_spacing to max_spacing apart
+    # signs farther apart than group_gap are in different groups (e.g. different curves)
+    def __init__(self,name,codes,min_spacing,max_spacing,group_gap):
+        self.name = name
+        self.codes = codes
+        self.min_spacing = min_spacing
+        self.max_spacing = max_spacing
+        self.group_gap = group_gap
+
+    def check(self,inventory,stations,sides,report):
+        selected = np.isin(inventory.mutcd,self.codes) & np.isfinite(stations)
+        for side in (-1,1):
+            indices = np.flatnonzero(selected & (sides == side))
+            indices = indices[np.argsort(stations[indices],kind="stable")]
+            gaps = np.diff(stations[indices])
+            too_close = np.flatnonzero(gaps < self.min_spacing)
+            too_far = np.flatnonzero((gaps > self.max_spacing) & (gaps <= self.group_gap))
+            report.add(self.name,indices[too_close + 1],[f"{gap:.0f} ft from the previous sign, minimum {self.min_spacing:.0f} ft" for gap in gaps[too_close]])
+            report.add(self.name,indices[too_far + 1],[f"{gap:.0f} ft from the previous sign, maximum {self.max_spacing:.0f} ft" for gap in gaps[too_far]])
+
+
+class AdvanceRule:
+    # a warning sign is min_distance to max_distance before the next condition sign in the direction of travel
+    def __init__(self,name,warning_codes,condition_codes,min_distance,max_distance):
+        self.name = name
+        self.warning_codes = warning_codes
+        self.condition_codes = condition_codes
+        self.min_distance = min_distance
+        self.max_distance = max_distance
+
+    def check(self,inventory,stations,sides,report):
+        warnings = np.isin(inventory.mutcd,self.warning_codes) & np.isfinite(stations)
+        conditions = np.isin(inventory.mutcd,self.condition_codes) & np.isfinite(stations)
+        for side in (-1,1):
+            # signs on the right side (-1) face traffic traveling up station, signs on the left side face traffic traveling down station
+            direction = 1. if side == -1 else -1.
+            warning_indices = np.flatnonzero(warnings & (sides == side))
+            travel = direction*stations
+            condition_stations = np.sort(travel[conditions & (sides == side)])
+            next_condition = np.searchsorted(condition_stations,travel[warning_indices],side="right")
+            ahead = np.full(len(warning_indices),math.inf)
+            found = next_condition < len(condition_stations)
+            ahead[found] = condition_stations[next_condition[found]] - travel[warning_indices][found]
+            too_close = np.flatnonzero(ahead < self.min_distance)
+            too_far = np.flatnonzero(ahead > self.max_distance)
+            report.add(self.name,warning_indices[too_close],[f"{distance:.0f} ft before the condition, minimum {self.min_distance:.0f} ft" for distance in ahead[too_close]])
+            report.add(self.name,warning_indices[too_far],[f"no {'/'.join(self.condition_codes)} within {self.max_distance:.0f} ft ahead" for distance in ahead[too_far]])
+
+
+def default_rules(posted_speed=35.,advisory_speed=None):
+    advisory_speed = advisory_speed if advisory_speed else posted_speed
+    chevron_spacing = _lookup(CHEVRON_SPACING,advisory_speed)
+    return [
+        SpacingRule("Chevron spacing",["W1-8L","W1-8R"],0.5*chevron_spacing,1.5*chevron_spacing,4.*chevron_spacing),
+        AdvanceRule("Stop Ahead placement",["W3-1"],["R1-1"],_lookup(STOP_AHEAD_DISTANCE,posted_speed),1500.),
+    ]
+
+
+def check_spacing(inventory,path_points,rules,max_offset=100.,report=None):
+    # path_points are (n,2) or (n,3) points along the alignment in the units of the inventory coordinates
+    report = report if report else ConformanceReport()
+    stations, offsets = project_to_path(inventory.x,inventory.y,np.asarray(path_points,dtype=np.float64),max_offset)
+    sides = np.where(offsets > 0.,1,-1) # stations of points that weren't projected are NaN
+    for rule in rules:
+        rule.check(inventory,stations,sides,report)
+    return report
+
+
+def _synthetic_inventory(store,count):
+    # the inventory repeated to count signs, shifted so the copies don't overlap
+    repeats = -(-count//len(store))
+    index = np.tile(np.arange(len(store)),repeats)[:count]
+    shift = np.repeat(np.arange(repeats)*100000.,len(store))[:count]
+    inventory = SignInventory.from_records(store)
+    return SignInventory(np.arange(count),inventory.mutcd[index],inventory.x[index] + shift,inventory.y[index],inventory.width[index],inventory.height[index])
+
+
+def benchmark(count=1000000,road_count=100000):
+    definitions = SignDefinitions()
+    inventory = _synthetic_inventory(SignRecordStore.from_csv("Sign_Face.csv"),count)
+    start = time.perf_counter()
+    report = check_signs(inventory,definitions,road_class="Multi-Lane")
+    print(f"{count} signs checked in {time.perf_counter() - start:.2f} s: {report.counts()}")
+
+    # a road with count signs - curves with 8 chevrons 120 ft apart, some of them missing, and Stop Ahead signs
+    # 100 to 300 ft before stop signs, on alternating sides of the road
+    rng = np.random.default_rng(0)
+    groups = road_count//10
+    group_start = np.arange(groups)*2000.
+    chevrons = (group_start[:,np.newaxis] + np.arange(8)*120.).ravel()
+    chevrons = chevrons[rng.random(len(chevrons)) > 0.02]
+    stops = group_start + 1500.
+    # signs on the left side face traffic traveling in the other direction
+    left = np.arange(groups) % 2 == 1
+    stop_ahead = stops - np.where(left,-1.,1.)*rng.uniform(100.,300.,groups)
+    side = np.where(left,20.,-20.)
+    x = np.concatenate((chevrons,stop_ahead,stops))
+    y = np.concatenate((np.full(len(chevrons),-20.),side,side))
+    mutcd = np.array(["W1-8R"]*len(chevrons) + ["W3-1"]*groups + ["R1-1"]*groups,dtype=object)
+    road = SignInventory(np.arange(len(x)),mutcd,x,y,np.full(len(x),30.),np.full(len(x),30.))
+    path = np.column_stack((np.linspace(-1000.,groups*2000.,groups*20),np.zeros(groups*20)))
+    start = time.perf_counter()
+    report = check_spacing(road,path,default_rules())
+    print(f"{len(road)} signs along {groups*2000/5280:.0f} miles projected and spacing checked in {time.perf_counter() - start:.2f} s: {report.counts()}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check signs against the MUTCD sign definitions")
+    parser.add_argument("--signs",default="Sign_Face.csv",help="Sign_Face.csv or an IFC model")
+    parser.add_argument("--road-class",default=None,choices=ROAD_CLASSES)
+    parser.add_argument("--alignment",nargs=2,default=None,metavar=("FILE","NAME"),help="check spacing along this alignment")
+    parser.add_argument("--origin",type=float,nargs=2,default=(0.,0.))
+    parser.add_argument("--rotation",type=float,default=0.)
+    parser.add_argument("--speed",type=float,default=35.,help="posted speed, mph")
+    parser.add_argument("--report",default="conformance.csv")
+    parser.add_argument("--benchmark",action="store_true")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        benchmark()
+    else:
+        definitions = SignDefinitions()
+        if args.signs.lower().endswith(".ifc"):
+            import ifcopenshell
+            inventory = SignInventory.from_model(ifcopenshell.open(args.signs))
+        else:
+            inventory = SignInventory.from_records(SignRecordStore.from_csv(args.signs))
+        report = check_signs(inventory,definitions,args.road_class)
+        if args.alignment:
+            from sign_visibility import DriverPath
+            path = DriverPath.from_alignment(args.alignment[0],args.alignment[1],origin=args.origin,rotation=args.rotation)
+            check_spacing(inventory,path.points,default_rules(args.speed),report=report)
+        report.write(inventory,args.report)
+        for rule, count in report.counts().items():
+            print(f"{rule}: {count}")
+    print("Done")
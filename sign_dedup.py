@@ -0,0 +1,214 @@
+"""
+Duplicate sign detections
+
+Richard Brice, PE
+WSDOT Bridge and Structures Office
+
+The signs in Sign_Face.csv are detected in LiDAR data. The same physical sign is sometimes detected more than once, or
+its face is split into fragments, giving several records with the same MUTCD code at nearly the same location. Without
+deduplication each of them is modeled as a sign.
+
+find_duplicates clusters the detections
+1) Detections are hashed into a 3D grid with cells the size of the match distance. The MUTCD code is part of the hash
+   key so only detections with the same code share a cell
+2) Candidate pairs are the detections in the same or neighboring cells (half of the 26 neighbors so each pair is
+   found once). The pairs are generated with sorted keys and searchsorted, one NumPy operation per neighbor offset
+3) Pairs within the match distance whose orientations differ by no more than the angle tolerance are kept, and the
+   clusters are the connected components of the pairs (label propagation with pointer jumping)
+The work is proportional to the number of detections so millions of detections are clustered in seconds.
+
+merge_duplicates replaces each cluster with one record. The record of the largest detection is kept, at the average
+location of the cluster, with the largest width and height of the cluster. The distinct texts are joined from top to
+bottom so fragments of a sign face keep all of their text. Detections without a location or MUTCD code are kept as is.
+
+python sign_dedup.py --report Sign_Face_Duplicates.csv
+
+reports the clusters. Build_Test_Corridor_Signs.py --dedup removes the duplicates before modeling.
+"""
+
+import argparse
+import csv
+import numpy as np
+import time
+from sign_records import SignRecordStore
+
+
+# half of the neighboring cells, each pair of cells is visited once. (0,0,0) is the cell itself
+HALF_NEIGHBORS = [(0,0,0)] + [(i,j,k) for i in (-1,0,1) for j in (-1,0,1) for k in (-1,0,1) if (i,j,k) > (0,0,0)]
+
+
+class DuplicateClusters:
+    def __init__(self,labels):
+        # labels - for each record, the index of the first record of its cluster
+        self.labels = labels
+        # record indices of each cluster of two or more detections
+        roots = np.unique(labels[labels != np.arange(len(labels))])
+        indices = np.flatnonzero(np.isin(labels,roots))
+        indices = indices[np.argsort(labels[indices],kind="stable")]
+        self.clusters = np.split(indices,np.flatnonzero(np.diff(labels[indices])) + 1) if len(indices) else []
+
+    def summary(self):
+        duplicates = sum(len(cluster) for cluster in self.clusters)
+        return {
+            "detections":len(self.labels),
+            "clusters":len(self.clusters),
+            "detections in clusters":duplicates,
+            "records after merging":len(self.labels) - duplicates + len(self.clusters),
+            "largest cluster":max((len(cluster) for cluster in self.clusters),default=0),
+        }
+
+
+def _candidate_pairs(keys,span):
+    # pairs (a,b) of positions in keys that are in the same or neighboring cells
+    order = np.argsort(keys,kind="stable")
+    sorted_keys = keys[order]
+    first = []
+    second = []
+    for di, dj, dk in HALF_NEIGHBORS:
+        # searching for the keys in sorted order is several times faster than in random order
+        neighbor_keys = sorted_keys + (di*span[1] + dj)*span[2] + dk
+        lo = np.searchsorted(sorted_keys,neighbor_keys,side="left")
+        counts = np.searchsorted(sorted_keys,neighbor_keys,side="right") - lo
+        total = int(counts.sum())
+        if total == 0:
+            continue
+        a = np.repeat(order,counts)
+        starts = np.repeat(lo - np.cumsum(counts) + counts,counts)
+        b = order[starts + np.arange(total)]
+        if (di,dj,dk) == (0,0,0):
+            keep = a < b
+            a, b = a[keep], b[keep]
+        first.append(a)
+        second.append(b)
+    if not first:
+        return np.zeros(0,dtype=np.int64), np.zeros(0,dtype=np.int64)
+    return np.concatenate(first), np.concatenate(second)
+
+
+def _connected_components(count,a,b):
+    # label of each node is the smallest node of its component
+    labels = np.arange(count)
+    while True:
+        low = np.minimum(labels[a],labels[b])
+        np.minimum.at(labels,a,low)
+        np.minimum.at(labels,b,low)
+        # pointer jumping until every label points to a root
+        while True:
+            jumped = labels[labels]
+            if np.array_equal(jumped,labels):
+                break
+            labels = jumped
+        if np.array_equal(labels[a],labels[b]):
+            return labels
+
+
+def find_duplicates(records,distance=2.,angle=15.):
+    # records - SignRecordStore. distance (ft) and angle (degrees) are the match tolerances
+    count = len(records)
+    xyz = np.column_stack((records.x,records.y,records.z))
+    codes = records.mutcd.codes.astype(np.int64)
+    blank = records.mutcd.code_of("")
+    candidates = np.flatnonzero(~np.isnan(xyz).any(axis=1) & (codes != blank))
+    labels = np.arange(count)
+    if len(candidates) < 2:
+        return DuplicateClusters(labels)
+
+    # grid cells, with a margin of one cell so the neighbor offsets stay inside the key space
+    cells = np.floor(xyz[candidates]/distance).astype(np.int64)
+    cells -= cells.min(axis=0) - 1
+    span = cells.max(axis=0) + 2
+    if float(codes.max() + 1)*float(span[0])*float(span[1])*float(span[2]) >= 2.**63:
+        raise ValueError(f"a match distance of {distance} is too small for the extent of the records")
+    keys = ((codes[candidates]*span[0] + cells[:,0])*span[1] + cells[:,1])*span[2] + cells[:,2]
+
+    a, b = _candidate_pairs(keys,span)
+    a, b = candidates[a], candidates[b]
+    close = np.linalg.norm(xyz[a] - xyz[b],axis=1) <= distance
+    turn = np.abs((records.orientation[a] - records.orientation[b] + 180.) % 360. - 180.)
+    keep = close & (turn <= angle)
+    a, b = a[keep], b[keep]
+
+    if len(a):
+        nodes, inverse = np.unique(np.concatenate((a,b)),return_inverse=True)
+        component = _connected_components(len(nodes),inverse[:len(a)],inverse[len(a):])
+        labels[nodes] = nodes[component]
+    return DuplicateClusters(labels)
+
+
+def merge_duplicates(records,clusters):
+    # returns a SignRecordStore with one record for each cluster
+    if not clusters.clusters:
+        return records
+    area = np.nan_to_num(records.width*records.height)
+    keep = np.ones(len(records),dtype=bool)
+    representatives = []
+    for cluster in clusters.clusters:
+        representative = cluster[np.argmax(area[cluster])]
+        keep[cluster] = False
+        keep[representative] = True
+        representatives.append(representative)
+
+    indices = np.flatnonzero(keep)
+    merged = records.take(indices)
+    # the text column gets new values, don't share its strings with records
+    merged.text.values = list(merged.text.values)
+    merged.text.lookup = dict(merged.text.lookup)
+    position = {index:i for i, index in enumerate(indices.tolist())}
+    for cluster, representative in zip(clusters.clusters,representatives):
+        i = position[int(representative)]
+        merged.x[i] = records.x[cluster].mean()
+        merged.y[i] = records.y[cluster].mean()
+        merged.z[i] = records.z[cluster].mean()
+        merged.width[i] = np.nanmax(records.width[cluster])
+        merged.height[i] = np.nanmax(records.height[cluster])
+        texts = []
+        for index in cluster[np.argsort(-records.z[cluster],kind="stable")]:
+            text = records.text[index].strip()
+            if text and text not in texts:
+                texts.append(text)
+        merged.text.codes[i] = merged.text.intern("\n".join(texts))
+    return merged
+
+
+def write_clusters(records,clusters,file_path):
+    with open(file_path,mode='w',newline='',encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(["Cluster","OBJECTID","MUTCD","X","Y","Z","Orientation","Width","Height","Text"])
+        for number, cluster in enumerate(clusters.clusters):
+            for index in cluster:
+                writer.writerow([number,records.object_id[index],records.mutcd[index],records.x[index],records.y[index],records.z[index],records.orientation[index],records.width[index],records.height[index],records.text[index]])
+
+
+def benchmark(file_path="Sign_Face.csv",copies=300,distance=2.,angle=15.):
+    # the records repeated side by side, copies times, to simulate a large inventory
+    records = SignRecordStore.from_csv(file_path)
+    offset = (np.nanmax(records.x) - np.nanmin(records.x)) + 1000.
+    indices = np.tile(np.arange(len(records)),copies)
+    large = records.take(indices)
+    large.x = large.x + np.repeat(np.arange(copies),len(records))*offset
+    large.object_id = np.arange(len(large))
+    start = time.perf_counter()
+    clusters = find_duplicates(large,distance,angle)
+    elapsed = time.perf_counter() - start
+    print(f"{len(large)} detections, {len(clusters.clusters)} clusters in {elapsed:.2f} s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Find duplicate sign detections")
+    parser.add_argument("--signs",default="Sign_Face.csv",help="sign detections")
+    parser.add_argument("--distance",type=float,default=2.,help="match distance (ft)")
+    parser.add_argument("--angle",type=float,default=15.,help="orientation tolerance (degrees)")
+    parser.add_argument("--report",default=None,help="CSV file of the clusters")
+    parser.add_argument("--benchmark",type=int,default=None,help="cluster this many copies of the detections")
+    args = parser.parse_args()
+
+    records = SignRecordStore.from_csv(args.signs)
+    start = time.perf_counter()
+    clusters = find_duplicates(records,args.distance,args.angle)
+    print(f"Clustered in {time.perf_counter() - start:.3f} s")
+    for name, count in clusters.summary().items():
+        print(f"{name}: {count}")
+    if args.report:
+        write_clusters(records,clusters,args.report)
+    if args.benchmark:
+        benchmark(args.signs,args.benchmark,args.distance,args.angle)
@@ -0,0 +1,260 @@
+"""
+Compiled sign data dictionary
+
+Richard Brice, PE
+WSDOT Bridge and Structures Office
+
+The WSDOT sign data dictionary (Data Dictionary/DraftFinal_DataDictionary_Signs.xlsx, or a dictionary in the
+Excel2bSDD format) defines the sign properties, their data types, and the values they can have. The builders hand code
+property set names and values and nothing checks the values against the dictionary until the model is validated.
+
+compile_dictionary turns a BsddDictionary (bsdd_cache.py) into
+1) an IfcPropertySetTemplate with an IfcSimplePropertyTemplate for each property of a class (P_ENUMERATEDVALUE with an
+   IfcPropertyEnumeration when the property has allowed values). The template is declared by the project and related
+   to the property sets written with it by an IfcRelDefinesByTemplate
+2) a validator for each property, compiled once, that converts a column of values to the IFC measure type and checks
+   the type, allowed values (enumeration), range, and pattern. Numbers and dates are converted and range checked as
+   NumPy arrays and enumerations are checked with np.isin, so thousands of values are checked in one pass
+
+CompiledDictionary.add_psets validates columnar property data and writes it with a PropertyWriter (sign_properties.py)
+in the same call. Values that are not valid are left out of the property sets and reported.
+
+python sign_dictionary.py --output WSDOT_Sign_Templates.ifc
+
+writes the property set template of the SIGN class to a project library file.
+"""
+
+import ifcopenshell
+import ifcopenshell.guid
+import argparse
+import datetime
+import numpy as np
+import re
+import time
+from bsdd_cache import BsddDictionary
+
+
+# bSDD data types -> IFC measure types
+MEASURE_TYPES = {
+    "String":"IfcLabel",
+    "Character":"IfcLabel",
+    "Integer":"IfcInteger",
+    "Real":"IfcReal",
+    "Boolean":"IfcBoolean",
+    "Time":"IfcDate",
+}
+
+TRUE_VALUES = {"true","yes","y","1"}
+FALSE_VALUES = {"false","no","n","0"}
+
+
+class PropertyValidator:
+    # converts and checks the values of one dictionary property
+    def __init__(self,prop):
+        self.code = prop["code"]
+        self.uri = prop["uri"]
+        self.measure_type = MEASURE_TYPES.get(prop["data_type"],"IfcLabel")
+        self.allowed_values = [str(value) for value in prop["allowed_values"]]
+        self.allowed = np.array(self.allowed_values,dtype=str) if self.allowed_values else None
+        pattern = prop.get("pattern")
+        self.pattern = re.compile(pattern) if pattern else None
+        self.bounds = [(key,prop.get(key)) for key in ("min_inclusive","max_inclusive","min_exclusive","max_exclusive") if prop.get(key) is not None]
+
+    def _numbers(self,values):
+        try:
+            return values.astype(np.float64)
+        except (TypeError,ValueError):
+            # at least one value isn't a number, convert them one at a time
+            numbers = np.full(len(values),np.nan)
+            for i, value in enumerate(values):
+                try:
+                    numbers[i] = float(value)
+                except (TypeError,ValueError):
+                    pass
+            return numbers
+
+    def _dates(self,values):
+        values = np.array([value.date() if isinstance(value,datetime.datetime) else value for value in values],dtype=object)
+        try:
+            return values.astype("datetime64[D]")
+        except (TypeError,ValueError):
+            dates = np.full(len(values),np.datetime64("NaT"),dtype="datetime64[D]")
+            for i, value in enumerate(values):
+                try:
+                    dates[i] = np.datetime64(value,"D")
+                except (TypeError,ValueError):
+                    pass
+            return dates
+
+    def check(self,values):
+        # values - a column of values, None (or blank) for no value
+        # returns the values converted to the measure type (None for no value or a value that isn't valid) and a list
+        # of (index, value, reason) for the values that aren't valid
+        column = np.empty(len(values),dtype=object)
+        column[:] = values
+        present = np.flatnonzero(np.not_equal(column,None) & np.not_equal(column,""))
+        given = column[present]
+        converted = np.empty(len(values),dtype=object)
+        reasons = np.full(len(present),None,dtype=object)
+
+        if self.measure_type in ("IfcInteger","IfcReal"):
+            numbers = self._numbers(given)
+            reasons[np.isnan(numbers)] = "not a number"
+            if self.measure_type == "IfcInteger":
+                reasons[np.equal(reasons,None) & (numbers != np.round(numbers))] = "not an integer"
+            for key, bound in self.bounds:
+                if key == "min_inclusive":
+                    outside = numbers < bound
+                elif key == "max_inclusive":
+                    outside = numbers > bound
+                elif key == "min_exclusive":
+                    outside = numbers <= bound
+                else:
+                    outside = numbers >= bound
+                reasons[np.equal(reasons,None) & outside] = f"{key.replace('_',' ')} {bound}"
+            valid = np.equal(reasons,None)
+            numbers = numbers[valid]
+            converted[present[valid]] = numbers.astype(np.int64).tolist() if self.measure_type == "IfcInteger" else numbers.tolist()
+        elif self.measure_type == "IfcDate":
+            dates = self._dates(given)
+            reasons[np.isnat(dates)] = "not a date"
+            valid = np.equal(reasons,None)
+            converted[present[valid]] = np.datetime_as_string(dates[valid],unit="D").tolist()
+        elif self.measure_type == "IfcBoolean":
+            flags = [value if isinstance(value,bool) else (True if str(value).strip().lower() in TRUE_VALUES else (False if str(value).strip().lower() in FALSE_VALUES else None)) for value in given]
+            for i, flag in enumerate(flags):
+                if flag is None:
+                    reasons[i] = "not a boolean"
+            valid = np.equal(reasons,None)
+            converted[present[valid]] = [flag for flag, ok in zip(flags,valid) if ok]
+        else:
+            strings = given.astype(str)
+            if self.allowed is not None:
+                reasons[~np.isin(strings,self.allowed)] = f"not one of {self.allowed_values}"
+            if self.pattern is not None:
+                match = np.fromiter((self.pattern.fullmatch(string) is not None for string in strings),dtype=bool,count=len(strings))
+                reasons[np.equal(reasons,None) & ~match] = f"does not match {self.pattern.pattern}"
+            valid = np.equal(reasons,None)
+            converted[present[valid]] = strings[valid].tolist()
+
+        invalid = np.flatnonzero(np.not_equal(reasons,None))
+        errors = [(int(present[i]),given[i],reasons[i]) for i in invalid]
+        return converted.tolist(), errors
+
+
+class CompiledDictionary:
+    def __init__(self,dictionary,class_code="SIGN",pset_name=None,applicable_entity="IfcSign"):
+        ifc_class = dictionary.get_class(class_code)
+        if ifc_class is None:
+            raise ValueError(f"{class_code} is not a class of {dictionary.code} {dictionary.version}")
+        self.dictionary = dictionary
+        self.pset_name = pset_name if pset_name else f"{dictionary.organization.upper()}_{ifc_class['name']}"
+        self.applicable_entity = applicable_entity
+        self.validators = {code:PropertyValidator(dictionary.get_property(code)) for code in ifc_class["properties"] if dictionary.get_property(code)}
+        self.property_types = {code:validator.measure_type for code, validator in self.validators.items()}
+        self.specifications = {code:validator.uri for code, validator in self.validators.items()}
+        self.templates = {} # model -> IfcPropertySetTemplate
+
+    def validate(self,columns):
+        # columns - dictionary of property code to list of values
+        # returns the converted columns and a list of (index, property code, value, reason) for the values that aren't valid
+        unknown = [code for code in columns if code not in self.validators]
+        if unknown:
+            raise ValueError(f"{unknown} are not properties of {self.pset_name}")
+        converted = {}
+        errors = []
+        for code, values in columns.items():
+            converted[code], column_errors = self.validators[code].check(values)
+            errors.extend((index,code,value,reason) for index, value, reason in column_errors)
+        return converted, errors
+
+    def add_templates(self,model):
+        # the IfcPropertySetTemplate of the property set, created once per model
+        template = self.templates.get(model)
+        if template:
+            return template
+        property_templates = []
+        for code, validator in self.validators.items():
+            prop = self.dictionary.get_property(code)
+            enumerators = None
+            if validator.allowed_values:
+                enumerators = model.createIfcPropertyEnumeration(Name=code,EnumerationValues=[model.create_entity(validator.measure_type,value) for value in validator.allowed_values])
+            property_templates.append(model.createIfcSimplePropertyTemplate(
+                GlobalId=ifcopenshell.guid.new(),
+                Name=code,
+                Description=prop["name"],
+                TemplateType="P_ENUMERATEDVALUE" if enumerators else "P_SINGLEVALUE",
+                PrimaryMeasureType=validator.measure_type,
+                Enumerators=enumerators))
+        template = model.createIfcPropertySetTemplate(
+            GlobalId=ifcopenshell.guid.new(),
+            Name=self.pset_name,
+            Description=f"{self.dictionary.name} {self.dictionary.version}",
+            TemplateType="PSET_OCCURRENCEDRIVEN",
+            ApplicableEntity=self.applicable_entity,
+            HasPropertyTemplates=property_templates)
+        self.templates[model] = template
+        return template
+
+    def add_psets(self,property_writer,objects,columns,types=None,min_shared=2):
+        # validates the columns and adds them to the objects with property_writer
+        # returns the list of values that aren't valid, they are not written
+        converted, errors = self.validate(columns)
+        property_writer.set_property_types(self.pset_name,self.property_types)
+        property_writer.add_psets(objects,self.pset_name,converted,types,self.specifications,min_shared)
+        if errors:
+            print(f"{len(errors)} {self.pset_name} values are not valid and were not written")
+            for index, code, value, reason in errors[:10]:
+                print(f"   {objects[index].Name} {code}={value!r} - {reason}")
+        return errors
+
+    def relate_templates(self,property_writer):
+        # call after property_writer.flush() - relates the property sets to the template
+        model = property_writer.model
+        psets = property_writer.get_property_sets(self.pset_name)
+        if not psets:
+            return None
+        return model.createIfcRelDefinesByTemplate(GlobalId=ifcopenshell.guid.new(),RelatedPropertySets=psets,RelatingTemplate=self.add_templates(model))
+
+
+def compile_dictionary(dictionary="Data Dictionary/wsdotsigns_0.5.json",class_code="SIGN",pset_name=None):
+    # dictionary is a BsddDictionary or the file name of a snapshot
+    if isinstance(dictionary,str):
+        dictionary = BsddDictionary.load(dictionary)
+    return CompiledDictionary(dictionary,class_code,pset_name)
+
+
+def benchmark(count=100000):
+    # time to validate the property values of count signs
+    compiled = compile_dictionary()
+    rng = np.random.default_rng(1)
+    columns = {
+        "MUTCD":rng.choice(["R1-1","W1-8R","S5-1","R2-1"],count).tolist(),
+        "sign_ht":rng.choice([36,48,"30",0,None],count).tolist(),
+        "sign_inst_date":rng.choice(["1989-01-01","2024-05-28","unknown"],count).tolist(),
+        "sign_reflectivity":rng.choice(["Pass","Fail","?"],count).tolist(),
+    }
+    start = time.perf_counter()
+    converted, errors = compiled.validate(columns)
+    print(f"{count} signs, {len(columns)} properties, {len(errors)} values not valid, validated in {time.perf_counter() - start:.3f} s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compile the sign data dictionary to property set templates")
+    parser.add_argument("--dictionary",default="Data Dictionary/wsdotsigns_0.5.json",help="bSDD snapshot (see bsdd_cache.py)")
+    parser.add_argument("--class-code",default="SIGN")
+    parser.add_argument("--output",default=None,help="IFC project library file for the property set template")
+    parser.add_argument("--benchmark",type=int,default=None,help="validate this many synthetic signs")
+    args = parser.parse_args()
+
+    compiled = compile_dictionary(args.dictionary,args.class_code)
+    print(f"{compiled.pset_name}: {len(compiled.validators)} properties")
+    if args.output:
+        model = ifcopenshell.file(schema="IFC4X3")
+        library = model.createIfcProjectLibrary(GlobalId=ifcopenshell.guid.new(),Name=f"{compiled.dictionary.name} {compiled.dictionary.version}")
+        template = compiled.add_templates(model)
+        model.createIfcRelDeclares(GlobalId=ifcopenshell.guid.new(),RelatingContext=library,RelatedDefinitions=[template])
+        model.write(args.output)
+        print(f"{args.output} written")
+    if args.benchmark:
+        benchmark(args.benchmark)
@@ -0,0 +1,285 @@
+"""
+Semantic difference between two versions of a sign model
+
+Richard Brice, PE
+WSDOT Bridge and Structures Office
+
+GlobalIds are created new every time a sign model is built, so a text comparison of two versions of
+Test_Corridor_Signs.ifc shows every line as changed. This script compares the signs themselves.
+
+Each sign is fingerprinted with
+1) a key - the source OBJECTID if the sign name starts with one, otherwise nothing
+2) its world location (X, Y, Z)
+3) a type hash - MUTCD code and type description. The library types are parametric so the size of a sign is one of
+   its quantities (Qto_SignBaseQuantities) and a change of size is a re-attribution
+4) a property hash - all of the property and quantity values of the sign, including those from its type. Properties
+   the sign doesn't have (None) are left out, so models with different property sets (e.g. a corridor built with and
+   without --tsms) only differ for the signs whose properties differ
+
+Signs are matched by key with a dictionary lookup. Signs without a key, or whose key isn't in the other model, are
+matched to the nearest unmatched sign within the move tolerance using a hash grid (cells the size of the tolerance),
+so matching takes linear time. Matched signs are reported as moved (farther apart than the tolerance), retyped, and
+re-attributed (with the names of the properties that changed). Unmatched signs are added or removed.
+
+The fingerprints are read with SignExporter (sign_export.py), which resolves the placements and property sets in batch.
+
+Usage:
+python sign_diff.py old.ifc new.ifc [--tolerance 0.5] [--report changes.csv]
+
+Run this script without arguments to time the comparison of two 100,000 sign fingerprint sets.
+"""
+
+import argparse
+import csv
+import hashlib
+import ifcopenshell
+import numpy as np
+import time
+from sign_export import SignExporter
+
+
+TYPE_COLUMNS = ["MUTCD","TypeDescription"]
+
+
+def _hash(values):
+    return hashlib.blake2b(repr(values).encode(),digest_size=8).digest()
+
+
+def _property_hash(columns,values):
+    # the hash includes the column names so models with different property sets compare correctly
+    return _hash(tuple((column,value) for column, value in zip(columns,values) if value is not None))
+
+
+def _comparable(value):
+    # floating point values are rounded so that values that went through a different calculation compare equal
+    return round(value,6) if isinstance(value,float) else value
+
+
+class SignFingerprints:
+    def __init__(self):
+        self.global_ids = []
+        self.names = []
+        self.keys = []
+        self.xyz = np.zeros((0,3))
+        self.types = [] # (MUTCD, TypeDescription)
+        self.type_hashes = []
+        self.property_columns = []
+        self.properties = [] # tuple of values in the order of property_columns
+        self.property_hashes = []
+
+    def __len__(self):
+        return len(self.global_ids)
+
+    def get_properties(self,index):
+        # {column:value} of the properties the sign has
+        return {column:value for column, value in zip(self.property_columns,self.properties[index]) if value is not None}
+
+    @staticmethod
+    def from_model(model,batch_size=10000):
+        fingerprints = SignFingerprints()
+        exporter = SignExporter(model,batch_size)
+        fingerprints.property_columns = exporter.property_columns
+        xyz = []
+        for columns in exporter.batches():
+            fingerprints.global_ids.extend(columns["GlobalId"])
+            fingerprints.names.extend(columns["Name"])
+            fingerprints.keys.extend(columns["OBJECTID"])
+            xyz.append(np.column_stack((columns["X"],columns["Y"],columns["Z"])))
+            for sign_type in zip(*(columns[name] for name in TYPE_COLUMNS)):
+                fingerprints.types.append(sign_type)
+                fingerprints.type_hashes.append(_hash(sign_type))
+            rows = zip(*(columns[name] for name in exporter.property_columns)) if exporter.property_columns else [()]*len(columns["GlobalId"])
+            for values in rows:
+                values = tuple(_comparable(value) for value in values)
+                fingerprints.properties.append(values)
+                fingerprints.property_hashes.append(_property_hash(exporter.property_columns,values))
+        if xyz:
+            fingerprints.xyz = np.concatenate(xyz)
+        return fingerprints
+
+
+class SignDiff:
+    def __init__(self):
+        self.added = [] # new index
+        self.removed = [] # old index
+        self.matched = [] # (old index, new index)
+        self.moved = [] # (old index, new index, distance)
+        self.retyped = [] # (old index, new index)
+        self.reattributed = [] # (old index, new index, changed property names)
+
+    def summary(self):
+        return {
+            "matched":len(self.matched),
+            "added":len(self.added),
+            "removed":len(self.removed),
+            "moved":len(self.moved),
+            "retyped":len(self.retyped),
+            "re-attributed":len(self.reattributed),
+        }
+
+
+def _grid_cells(xyz,cell_size):
+    return np.floor(xyz/cell_size).astype(np.int64)
+
+
+def match_by_location(old,new,old_indices,new_indices,tolerance):
+    # nearest unmatched new sign within tolerance of each unmatched old sign, preferring signs of the same type
+    # returns [(old index, new index)]
+    if not len(old_indices) or not len(new_indices):
+        return []
+    grid = {}
+    new_cells = _grid_cells(new.xyz[new_indices],tolerance)
+    for index, cell in zip(new_indices,map(tuple,new_cells)):
+        grid.setdefault(cell,[]).append(index)
+
+    taken = set()
+    pairs = []
+    old_cells = _grid_cells(old.xyz[old_indices],tolerance)
+    neighbors = [(i,j,k) for i in (-1,0,1) for j in (-1,0,1) for k in (-1,0,1)]
+    for old_index, (ci,cj,ck) in zip(old_indices,old_cells.tolist()):
+        best = None
+        for di, dj, dk in neighbors:
+            for new_index in grid.get((ci + di,cj + dj,ck + dk),()):
+                if new_index in taken:
+                    continue
+                distance = float(np.linalg.norm(new.xyz[new_index] - old.xyz[old_index]))
+                if distance > tolerance:
+                    continue
+                rank = (new.type_hashes[new_index] != old.type_hashes[old_index],distance)
+                if best is None or rank < best[0]:
+                    best = (rank,new_index)
+        if best:
+            taken.add(best[1])
+            pairs.append((old_index,best[1]))
+    return pairs
+
+
+def diff_fingerprints(old,new,tolerance=0.5):
+    diff = SignDiff()
+
+    # match by source OBJECTID. A key that occurs more than once is matched by location instead
+    new_by_key = {}
+    duplicate_keys = set()
+    for index, key in enumerate(new.keys):
+        if key is None:
+            continue
+        if key in new_by_key:
+            duplicate_keys.add(key)
+        new_by_key[key] = index
+    old_key_counts = {}
+    for key in old.keys:
+        if key is not None:
+            old_key_counts[key] = old_key_counts.get(key,0) + 1
+
+    matched_new = set()
+    unmatched_old = []
+    for old_index, key in enumerate(old.keys):
+        new_index = new_by_key.get(key) if key is not None and key not in duplicate_keys and old_key_counts[key] == 1 else None
+        if new_index is None:
+            unmatched_old.append(old_index)
+        else:
+            diff.matched.append((old_index,new_index))
+            matched_new.add(new_index)
+
+    unmatched_new = [index for index in range(len(new)) if index not in matched_new]
+    location_pairs = match_by_location(old,new,unmatched_old,unmatched_new,tolerance)
+    diff.matched.extend(location_pairs)
+    matched_old = {old_index for old_index, new_index in location_pairs}
+    matched_new.update(new_index for old_index, new_index in location_pairs)
+    diff.removed = [index for index in unmatched_old if index not in matched_old]
+    diff.added = [index for index in unmatched_new if index not in matched_new]
+
+    # compare the matched signs
+    if diff.matched:
+        pairs = np.array(diff.matched)
+        distances = np.linalg.norm(new.xyz[pairs[:,1]] - old.xyz[pairs[:,0]],axis=1)
+        for (old_index, new_index), distance in zip(diff.matched,distances.tolist()):
+            if distance > tolerance:
+                diff.moved.append((old_index,new_index,distance))
+            if old.type_hashes[old_index] != new.type_hashes[new_index]:
+                diff.retyped.append((old_index,new_index))
+            if old.property_hashes[old_index] != new.property_hashes[new_index]:
+                old_properties = old.get_properties(old_index)
+                new_properties = new.get_properties(new_index)
+                changed = sorted(name for name in set(old_properties) | set(new_properties) if old_properties.get(name) != new_properties.get(name))
+                if changed:
+                    diff.reattributed.append((old_index,new_index,changed))
+    return diff
+
+
+def write_report(diff,old,new,file_path):
+    with open(file_path,mode='w',newline='',encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(["Change","OBJECTID","OldGlobalId","NewGlobalId","Name","Detail"])
+        for index in diff.added:
+            writer.writerow(["added",new.keys[index],None,new.global_ids[index],new.names[index],None])
+        for index in diff.removed:
+            writer.writerow(["removed",old.keys[index],old.global_ids[index],None,old.names[index],None])
+        for old_index, new_index, distance in diff.moved:
+            writer.writerow(["moved",new.keys[new_index],old.global_ids[old_index],new.global_ids[new_index],new.names[new_index],f"{distance:.3f}"])
+        for old_index, new_index in diff.retyped:
+            writer.writerow(["retyped",new.keys[new_index],old.global_ids[old_index],new.global_ids[new_index],new.names[new_index],f"{old.types[old_index][0]} -> {new.types[new_index][0]}"])
+        for old_index, new_index, changed in diff.reattributed:
+            writer.writerow(["re-attributed",new.keys[new_index],old.global_ids[old_index],new.global_ids[new_index],new.names[new_index],";".join(changed)])
+
+
+def diff_models(old_path,new_path,tolerance=0.5,report=None):
+    old = SignFingerprints.from_model(ifcopenshell.open(old_path))
+    new = SignFingerprints.from_model(ifcopenshell.open(new_path))
+    diff = diff_fingerprints(old,new,tolerance)
+    for change, count in diff.summary().items():
+        print(f"{change}: {count}")
+    if report:
+        write_report(diff,old,new,report)
+    return diff
+
+
+def _synthetic_fingerprints(count,seed):
+    # fingerprints of count signs, 10% of them without an OBJECTID
+    rng = np.random.default_rng(seed)
+    fingerprints = SignFingerprints()
+    fingerprints.global_ids = [f"{seed}-{i}" for i in range(count)]
+    fingerprints.names = [f"{i} Sign" for i in range(count)]
+    fingerprints.keys = [i if i % 10 else None for i in range(count)]
+    fingerprints.xyz = np.column_stack((np.arange(count)*50.,rng.uniform(0.,5000.,count),rng.uniform(0.,100.,count)))
+    fingerprints.types = [(f"R{i % 50}-1","") for i in range(count)]
+    fingerprints.type_hashes = [_hash(sign_type) for sign_type in fingerprints.types]
+    fingerprints.property_columns = ["Qto_SignBaseQuantities.Width","Qto_SignBaseQuantities.Height"]
+    fingerprints.properties = [(3.,2.)]*count
+    fingerprints.property_hashes = [_property_hash(fingerprints.property_columns,values) for values in fingerprints.properties]
+    return fingerprints
+
+
+def benchmark(count=100000):
+    old = _synthetic_fingerprints(count,0)
+    new = _synthetic_fingerprints(count,0)
+    # move, retype, re-attribute, and remove some signs
+    new.xyz[1::1000,0] += 10.
+    for i in range(1,count,997):
+        new.types[i] = ("W1-1","")
+        new.type_hashes[i] = _hash(new.types[i])
+    for i in range(2,count,991):
+        new.properties[i] = (4.,2.)
+        new.property_hashes[i] = _property_hash(new.property_columns,new.properties[i])
+    for name in ("global_ids","names","keys","types","type_hashes","properties","property_hashes"):
+        setattr(new,name,getattr(new,name)[:-100])
+    new.xyz = new.xyz[:-100]
+
+    start = time.perf_counter()
+    diff = diff_fingerprints(old,new)
+    print(f"{count} signs compared in {time.perf_counter() - start:.2f} s: {diff.summary()}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the signs in two versions of a sign model")
+    parser.add_argument("old",nargs="?")
+    parser.add_argument("new",nargs="?")
+    parser.add_argument("--tolerance",type=float,default=0.5,help="signs that moved farther than this (model units) are reported as moved")
+    parser.add_argument("--report",default=None,help="CSV file listing every change")
+    args = parser.parse_args()
+
+    if args.old and args.new:
+        diff_models(args.old,args.new,args.tolerance,args.report)
+    else:
+        benchmark()
+    print("Done")
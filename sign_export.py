@@ -0,0 +1,402 @@
+"""
+Streaming columnar export of the signs in an IFC sign model
+
+Richard Brice, PE
+WSDOT Bridge and Structures Office
+
+Getting sign data out of an IFC model for analytics (see SignMapLocation.ipynb) usually means calling
+ifcopenshell.util.placement.get_local_placement and ifcopenshell.util.element.get_psets for every sign. Both walk the
+model one entity at a time and build new NumPy arrays and dictionaries for every call.
+
+SignExporter writes one row per IfcSign to a columnar file
+1) Parquet (.parquet) or Arrow IPC (.arrow, .feather) if pyarrow is installed, otherwise CSV
+2) the signs are processed in batches of batch_size so memory use doesn't depend on the number of signs
+3) placements are resolved in batch - the locations and axes of a batch of IfcLocalPlacements are gathered into arrays
+   and converted to matrices with vectorized NumPy operations. Parent placements are resolved once and cached.
+   IfcLinearPlacements use their CartesianPosition if it is present, otherwise they are evaluated with
+   ifcopenshell.util.placement.get_local_placement
+4) world coordinates are converted to map coordinates (Easting, Northing, Elevation) with the IfcMapConversion of the
+   model, if it has one
+5) property and quantity sets are read from the IfcRelDefinesByProperties relationships and type property sets once.
+   Property sets are usually shared by many signs (see sign_properties.py) so the values of each property set are
+   converted once. Each property is a column named "PropertySet.Property"
+6) Size is the width x height of the sign in inches, e.g. 36x48, from the Width and Height of Qto_SignBaseQuantities.
+   Signs without those quantities get the size in the description of their type, as in the earlier libraries with a
+   sign type per size (e.g. "Stop (36x36)")
+
+Run this script directly to compare the exporter with a per-sign loop on Test_Corridor_Signs.ifc.
+"""
+
+import csv
+import ifcopenshell
+import ifcopenshell.util.element
+import ifcopenshell.util.placement
+import ifcopenshell.util.unit
+import math
+import numpy as np
+import os
+import re
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import defaultdict
+
+
+OBJECT_ID_PATTERN = re.compile(r"^\s*(\d+)\b")
+# size in the description of a sign type of the earlier libraries
+SIZE_PATTERN = re.compile(r"\((\d+(?:\.\d+)?x\d+(?:\.\d+)?(?:x\d+(?:\.\d+)?)?)\)")
+
+SIZE_QUANTITIES = ("Qto_SignBaseQuantities.Width","Qto_SignBaseQuantities.Height")
+
+BASE_COLUMNS = [
+    "GlobalId","Name","OBJECTID","TypeGlobalId","MUTCD","TypeDescription","Size",
+    "X","Y","Z","NormalX","NormalY","NormalZ","Easting","Northing","Elevation"
+]
+
+
+def _normalize(vectors):
+    return vectors/np.linalg.norm(vectors,axis=1)[:,np.newaxis]
+
+
+def axis2placements(locations,axes,ref_directions):
+    # vectorized ifcopenshell.util.placement.a2p - arrays of shape (n,3) to matrices of shape (n,4,4)
+    z = _normalize(axes)
+    x = _normalize(ref_directions)
+    y = _normalize(np.cross(z,x))
+    matrices = np.zeros((len(locations),4,4))
+    matrices[:,:3,0] = x
+    matrices[:,:3,1] = y
+    matrices[:,:3,2] = z
+    matrices[:,:3,3] = locations
+    matrices[:,3,3] = 1.
+    return matrices
+
+
+class PlacementResolver:
+    def __init__(self,model):
+        self.model = model
+        self.matrices = {} # placement id -> matrix, for placements that are the parent of other placements
+        self.directions = {} # direction id -> ratios
+
+    def _direction(self,direction,default):
+        if direction is None:
+            return default
+        ratios = self.directions.get(direction.id())
+        if ratios is None:
+            ratios = direction[0]
+            if len(ratios) == 2:
+                ratios = (ratios[0],ratios[1],0.)
+            self.directions[direction.id()] = ratios
+        return ratios
+
+    def _single(self,placement):
+        # matrix of one placement, cached because parent placements are shared by many signs
+        if placement is None:
+            return np.eye(4)
+        matrix = self.matrices.get(placement.id())
+        if matrix is None:
+            matrix = self.resolve([placement])[0]
+            self.matrices[placement.id()] = matrix
+        return matrix
+
+    def resolve(self,placements):
+        # world matrices of a sequence of IfcObjectPlacement (or None), shape (n,4,4)
+        count = len(placements)
+        matrices = np.zeros((count,4,4))
+        locations = np.zeros((count,3))
+        axes = np.zeros((count,3))
+        ref_directions = np.zeros((count,3))
+        batched = np.zeros(count,dtype=bool)
+        parents = [None]*count
+
+        # attributes are read by position, which is about twice as fast as by name
+        # IfcLocalPlacement and IfcLinearPlacement (PlacementRelTo, RelativePlacement, CartesianPosition)
+        # IfcAxis2Placement3D (Location, Axis, RefDirection)
+        for i, placement in enumerate(placements):
+            if placement is None:
+                matrices[i] = np.eye(4)
+                continue
+            relative = placement[1]
+            if placement.is_a() == "IfcLinearPlacement":
+                if placement[2] is None:
+                    # the point along the alignment has to be evaluated by the geometry kernel
+                    matrices[i] = ifcopenshell.util.placement.get_local_placement(placement)
+                    continue
+                relative = placement[2]
+            if relative.is_a() != "IfcAxis2Placement3D" or relative[0].is_a() != "IfcCartesianPoint":
+                matrices[i] = ifcopenshell.util.placement.get_local_placement(placement)
+                continue
+            coordinates = relative[0][0]
+            locations[i,:len(coordinates)] = coordinates
+            axes[i] = self._direction(relative[1],(0.,0.,1.))
+            ref_directions[i] = self._direction(relative[2],(1.,0.,0.))
+            parents[i] = placement[0]
+            batched[i] = True
+
+        if batched.any():
+            local = axis2placements(locations[batched],axes[batched],ref_directions[batched])
+            # most placements have no parent or share a few parents (site, assembly) so parents are resolved once each
+            parent_matrices = {}
+            parent_index = np.zeros(count,dtype=np.int64)
+            unique_parents = [np.eye(4)]
+            for i in np.flatnonzero(batched):
+                parent = parents[i]
+                if parent is None:
+                    continue
+                key = parent.id()
+                if key not in parent_matrices:
+                    parent_matrices[key] = len(unique_parents)
+                    unique_parents.append(self._single(parent))
+                parent_index[i] = parent_matrices[key]
+            matrices[batched] = np.matmul(np.array(unique_parents)[parent_index[batched]],local)
+        return matrices
+
+
+class MapConversion:
+    # engineering (project) coordinates to map coordinates, same as the "by hand" calculation in SignMapLocation.ipynb
+    def __init__(self,model):
+        conversions = model.by_type("IfcMapConversion")
+        self.conversion = conversions[0] if conversions else None
+        if self.conversion:
+            self.eastings = self.conversion.Eastings or 0.
+            self.northings = self.conversion.Northings or 0.
+            self.height = self.conversion.OrthogonalHeight or 0.
+            self.angle = math.atan2(self.conversion.XAxisOrdinate or 0.,self.conversion.XAxisAbscissa or 1.)
+            self.scale = self.conversion.Scale or 1.
+
+    def convert(self,xyz):
+        if self.conversion is None:
+            return xyz.copy()
+        c = math.cos(self.angle)
+        s = math.sin(self.angle)
+        result = np.empty_like(xyz)
+        result[:,0] = self.scale*(xyz[:,0]*c - xyz[:,1]*s) + self.eastings
+        result[:,1] = self.scale*(xyz[:,0]*s + xyz[:,1]*c) + self.northings
+        result[:,2] = self.scale*xyz[:,2] + self.height
+        return result
+
+
+def _size_text(width,height):
+    # 36.0, 48.0 -> "36x48"
+    return f"{round(width,1):g}x{round(height,1):g}"
+
+
+def _property_values(pset):
+    # [(column, value)] of a property or quantity set
+    # IfcPropertySet (GlobalId, OwnerHistory, Name, Description, HasProperties)
+    # IfcElementQuantity (GlobalId, OwnerHistory, Name, Description, MethodOfMeasurement, Quantities)
+    # IfcPropertySingleValue (Name, Specification, NominalValue, Unit) and IfcPhysicalSimpleQuantity (Name, Description, Unit, Value, Formula)
+    values = []
+    pset_class = pset.is_a()
+    if pset_class == "IfcPropertySet":
+        for prop in pset[4]:
+            if prop.is_a("IfcPropertySingleValue"):
+                values.append((f"{pset[2]}.{prop[0]}",prop[2].wrappedValue if prop[2] else None))
+            elif prop.is_a("IfcPropertyEnumeratedValue"):
+                values.append((f"{pset[2]}.{prop[0]}",";".join(str(v.wrappedValue) for v in prop.EnumerationValues or [])))
+    elif pset_class == "IfcElementQuantity":
+        for quantity in pset[5]:
+            if quantity.is_a("IfcPhysicalSimpleQuantity"):
+                values.append((f"{pset[2]}.{quantity[0]}",quantity[3]))
+    return values
+
+
+class SignExporter:
+    def __init__(self,model,batch_size=10000):
+        self.model = model
+        self.batch_size = batch_size
+        self.placements = PlacementResolver(model)
+        self.map_conversion = MapConversion(model)
+        # inches per model length unit, for the Size column
+        self.inches = ifcopenshell.util.unit.calculate_unit_scale(model)/0.0254
+
+        # sign id -> type and sign id -> property sets, read from the relationships once
+        self.types = {}
+        for rel in model.by_type("IfcRelDefinesByType"):
+            for obj in rel.RelatedObjects:
+                self.types[obj.id()] = rel.RelatingType
+        self.psets = defaultdict(list)
+        for rel in model.by_type("IfcRelDefinesByProperties"):
+            definition = rel.RelatingPropertyDefinition
+            if definition.is_a("IfcPropertySetDefinition"):
+                for obj in rel.RelatedObjects:
+                    self.psets[obj.id()].append(definition)
+
+        self.pset_values = {} # pset id -> [(column, value)]
+        self.type_rows = {} # type id -> see get_type_row
+
+        # the property columns are known before any rows are written so the file schema is fixed
+        property_columns = {}
+        sign_ids = {sign.id() for sign in model.by_type("IfcSign")}
+        definitions = [pset for sign_id in sign_ids for pset in self.psets.get(sign_id,[])]
+        for sign_type in {self.types[sign_id] for sign_id in sign_ids if sign_id in self.types}:
+            definitions.extend(sign_type.HasPropertySets or [])
+        for pset in {definition.id():definition for definition in definitions}.values():
+            for column, value in self.get_pset_values(pset):
+                property_columns[column] = None
+        self.property_columns = sorted(property_columns.keys())
+        self.columns = BASE_COLUMNS + self.property_columns
+
+    def get_pset_values(self,pset):
+        values = self.pset_values.get(pset.id())
+        if values is None:
+            values = _property_values(pset)
+            self.pset_values[pset.id()] = values
+        return values
+
+    def get_type_row(self,sign_type):
+        # (GlobalId, MUTCD code, Description, size, type property values) of a sign type
+        if sign_type is None:
+            return (None,None,None,None,{})
+        row = self.type_rows.get(sign_type.id())
+        if row is None:
+            values = {}
+            for pset in sign_type.HasPropertySets or []:
+                values.update(self.get_pset_values(pset))
+            description = sign_type.Description
+            size = SIZE_PATTERN.search(description) if description else None
+            row = (sign_type.GlobalId,sign_type.Name,description,size.group(1) if size else None,values)
+            self.type_rows[sign_type.id()] = row
+        return row
+
+    def batches(self):
+        # dictionary of columns for each batch of signs
+        signs = self.model.by_type("IfcSign")
+        for start in range(0,len(signs),self.batch_size):
+            batch = signs[start:start + self.batch_size]
+            # IfcSign attributes by position (GlobalId, OwnerHistory, Name, Description, ObjectType, ObjectPlacement)
+            matrices = self.placements.resolve([sign[5] for sign in batch])
+            xyz = matrices[:,:3,3]
+            normals = matrices[:,:3,2]
+            map_xyz = self.map_conversion.convert(xyz)
+
+            columns = {name:[] for name in self.columns}
+            for sign in batch:
+                sign_id = sign.id()
+                name = sign[2]
+                match = OBJECT_ID_PATTERN.match(name) if name else None
+                columns["GlobalId"].append(sign[0])
+                columns["Name"].append(name)
+                columns["OBJECTID"].append(int(match.group(1)) if match else None)
+
+                type_global_id, mutcd, description, size, values = self.get_type_row(self.types.get(sign_id))
+                columns["TypeGlobalId"].append(type_global_id)
+                columns["MUTCD"].append(mutcd)
+                columns["TypeDescription"].append(description)
+
+                # occurrence properties override type properties
+                psets = self.psets.get(sign_id)
+                if psets:
+                    values = dict(values)
+                    for pset in psets:
+                        values.update(self.get_pset_values(pset))
+                width, height = (values.get(column) for column in SIZE_QUANTITIES)
+                if width and height:
+                    size = _size_text(width*self.inches,height*self.inches)
+                columns["Size"].append(size)
+                for column in self.property_columns:
+                    columns[column].append(values.get(column))
+
+            for i, name in enumerate(("X","Y","Z")):
+                columns[name] = xyz[:,i]
+            for i, name in enumerate(("NormalX","NormalY","NormalZ")):
+                columns[name] = normals[:,i]
+            for i, name in enumerate(("Easting","Northing","Elevation")):
+                columns[name] = map_xyz[:,i]
+            yield columns
+
+    def export(self,file_path):
+        # returns the file that was written, which is a CSV file if pyarrow isn't available
+        extension = os.path.splitext(file_path)[1].lower()
+        if extension in (".parquet",".arrow",".feather"):
+            try:
+                import pyarrow
+            except ImportError:
+                file_path = os.path.splitext(file_path)[0] + ".csv"
+                extension = ".csv"
+                print(f"pyarrow is not installed - writing {file_path} instead")
+
+        count = 0
+        if extension == ".csv":
+            with open(file_path,mode='w',newline='',encoding='utf-8') as f:
+                writer = csv.writer(f)
+                writer.writerow(self.columns)
+                for columns in self.batches():
+                    writer.writerows(zip(*(columns[name] for name in self.columns)))
+                    count += len(columns["GlobalId"])
+        else:
+            import pyarrow.ipc
+            import pyarrow.parquet
+            writer = None
+            for columns in self.batches():
+                table = pyarrow.table({name:columns[name] for name in self.columns})
+                if writer is None:
+                    # the schema of the first batch is used for all batches
+                    schema = table.schema
+                    if extension == ".parquet":
+                        writer = pyarrow.parquet.ParquetWriter(file_path,schema)
+                    else:
+                        writer = pyarrow.ipc.new_file(file_path,schema)
+                writer.write_table(table.cast(schema))
+                count += table.num_rows
+            if writer:
+                writer.close()
+        print(f"{count} signs written to {file_path}")
+        return file_path
+
+
+def export_signs(model_path,file_path,batch_size=10000):
+    return SignExporter(ifcopenshell.open(model_path),batch_size).export(file_path)
+
+
+def _per_sign_export(model,file_path):
+    # the per-sign loop this module replaces
+    rows = []
+    for sign in model.by_type("IfcSign"):
+        matrix = ifcopenshell.util.placement.get_local_placement(sign.ObjectPlacement)
+        sign_type = ifcopenshell.util.element.get_type(sign)
+        row = {"GlobalId":sign.GlobalId,"Name":sign.Name,"MUTCD":sign_type.Name if sign_type else None,"X":matrix[0][3],"Y":matrix[1][3],"Z":matrix[2][3]}
+        for pset, values in ifcopenshell.util.element.get_psets(sign).items():
+            for name, value in values.items():
+                if name != "id":
+                    row[f"{pset}.{name}"] = value
+        rows.append(row)
+    fieldnames = list({name:None for row in rows for name in row}.keys())
+    with open(file_path,mode='w',newline='',encoding='utf-8') as f:
+        writer = csv.DictWriter(f,fieldnames=fieldnames)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def benchmark(model_path="Test_Corridor_Signs.ifc"):
+    model = ifcopenshell.open(model_path)
+    folder = tempfile.mkdtemp()
+    methods = {
+        "per sign":lambda: _per_sign_export(model,os.path.join(folder,"per_sign.csv")),
+        "exporter":lambda: SignExporter(model,batch_size=1000).export(os.path.join(folder,"export.csv")),
+    }
+    for method, run in methods.items():
+        # time without tracemalloc, it slows down allocation heavy code
+        start = time.perf_counter()
+        run()
+        elapsed = time.perf_counter() - start
+        tracemalloc.start()
+        run()
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f"{method}: {elapsed:.2f} s, {peak/2**20:.1f} MB peak")
+
+    # the batched placements must match ifcopenshell
+    signs = model.by_type("IfcSign")
+    matrices = PlacementResolver(model).resolve([sign.ObjectPlacement for sign in signs])
+    expected = np.array([ifcopenshell.util.placement.get_local_placement(sign.ObjectPlacement) for sign in signs])
+    print(f"largest placement difference: {np.abs(matrices - expected).max():.3g}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 3:
+        export_signs(sys.argv[1],sys.argv[2])
+    else:
+        benchmark()
+    print("Done")
@@ -0,0 +1,252 @@
+"""
+SQLite index of the signs in IFC sign models
+
+Richard Brice, PE
+WSDOT Bridge and Structures Office
+
+Questions like "how many R1-1 signs are there", "which IfcSign came from OBJECTID 1234", or "which signs don't use
+a type from the MUTCD library" require opening the whole IFC file and iterating over by_type("IfcSign") and the inverse
+relationships. SignIndex extracts the signs of one or more models into a SQLite database once so these questions can
+be answered with indexed queries without parsing the IFC file again.
+
+Tables
+models - one row per indexed IFC file with its size, modification time, and SHA-256 digest
+signs - GlobalId, Name, OBJECTID (leading number of the Name, if any), type GlobalId, Name and Description, MUTCD code
+        (the type Name), world placement matrix (row major, 16 values as JSON), and X, Y, Z of the placement origin
+properties - property set name, property name, and value of every property and quantity of a sign (including those
+             inherited from its type)
+library_types - GlobalId, Name, and Description of the sign types in a library (MUTCD_Sign_Library.ifc). Types copied
+                from the library into a model keep the library GlobalId
+
+Updates are incremental. A model whose size and modification time haven't changed is skipped without reading it,
+and a model whose content digest hasn't changed only has its file information updated. When a model is rewritten its
+rows are replaced in a single transaction. Tiled models (Build_Test_Corridor_Signs.py --tile-size) can be indexed
+from their manifest so only the rebuilt tiles are read again.
+
+Run this script directly to index Test_Corridor_Signs.ifc and time some example queries.
+"""
+
+import hashlib
+import ifcopenshell
+import ifcopenshell.util.element
+import ifcopenshell.util.placement
+import json
+import os
+import re
+import sqlite3
+import time
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS models (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    size INTEGER,
+    mtime REAL,
+    digest TEXT,
+    sign_count INTEGER
+);
+CREATE TABLE IF NOT EXISTS signs (
+    model_id INTEGER NOT NULL REFERENCES models(id),
+    global_id TEXT NOT NULL,
+    name TEXT,
+    object_id INTEGER,
+    type_global_id TEXT,
+    type_name TEXT,
+    type_description TEXT,
+    mutcd TEXT,
+    x REAL,
+    y REAL,
+    z REAL,
+    matrix TEXT,
+    PRIMARY KEY (model_id,global_id)
+);
+CREATE TABLE IF NOT EXISTS properties (
+    model_id INTEGER NOT NULL REFERENCES models(id),
+    global_id TEXT NOT NULL,
+    pset TEXT NOT NULL,
+    name TEXT NOT NULL,
+    value
+);
+CREATE TABLE IF NOT EXISTS library_types (
+    global_id TEXT PRIMARY KEY,
+    name TEXT,
+    description TEXT
+);
+CREATE INDEX IF NOT EXISTS signs_global_id ON signs(global_id);
+CREATE INDEX IF NOT EXISTS signs_object_id ON signs(object_id);
+CREATE INDEX IF NOT EXISTS signs_mutcd ON signs(mutcd);
+CREATE INDEX IF NOT EXISTS signs_type_global_id ON signs(type_global_id);
+CREATE INDEX IF NOT EXISTS signs_xy ON signs(x,y);
+CREATE INDEX IF NOT EXISTS properties_sign ON properties(model_id,global_id);
+CREATE INDEX IF NOT EXISTS properties_name ON properties(pset,name,value);
+"""
+
+OBJECT_ID_PATTERN = re.compile(r"^\s*(\d+)\b")
+
+
+def file_digest(file_path):
+    digest = hashlib.sha256()
+    with open(file_path,mode='rb') as f:
+        for block in iter(lambda: f.read(1 << 20),b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _property_value(value):
+    # SQLite stores numbers and text as is, anything else (lists, entity references) is stored as JSON text
+    if value is None or isinstance(value,(bool,int,float,str)):
+        return value
+    return json.dumps(value,default=str)
+
+
+def extract_signs(model):
+    # rows for the signs and properties tables (without the model id)
+    signs = []
+    properties = []
+    for sign in model.by_type("IfcSign"):
+        sign_type = ifcopenshell.util.element.get_type(sign)
+        match = OBJECT_ID_PATTERN.match(sign.Name or "")
+        if sign.ObjectPlacement:
+            matrix = ifcopenshell.util.placement.get_local_placement(sign.ObjectPlacement)
+            x, y, z = (float(v) for v in matrix[:3,3])
+            matrix = json.dumps([float(v) for v in matrix.flatten()])
+        else:
+            x = y = z = matrix = None
+        signs.append((
+            sign.GlobalId,sign.Name,int(match.group(1)) if match else None,
+            sign_type.GlobalId if sign_type else None,sign_type.Name if sign_type else None,sign_type.Description if sign_type else None,
+            sign_type.Name if sign_type else None,
+            x,y,z,matrix
+        ))
+        for pset, values in ifcopenshell.util.element.get_psets(sign).items():
+            for name, value in values.items():
+                if name != "id":
+                    properties.append((sign.GlobalId,pset,name,_property_value(value)))
+    return signs, properties
+
+
+class SignIndex:
+    def __init__(self,database="sign_index.sqlite"):
+        self.connection = sqlite3.connect(database)
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def add_library(self,library_path):
+        # remember the sign types of a library so signs can be checked for library types
+        library = ifcopenshell.open(library_path)
+        rows = [(sign_type.GlobalId,sign_type.Name,sign_type.Description) for sign_type in library.by_type("IfcSignType")]
+        with self.connection:
+            self.connection.executemany("INSERT OR REPLACE INTO library_types VALUES (?,?,?)",rows)
+        return len(rows)
+
+    def update(self,model_path):
+        # index a model if it is new or has changed since it was last indexed
+        # returns True if the model was read
+        path = os.path.abspath(model_path)
+        stat = os.stat(path)
+        row = self.connection.execute("SELECT id, size, mtime, digest FROM models WHERE path = ?",(path,)).fetchone()
+        if row and row[1] == stat.st_size and row[2] == stat.st_mtime:
+            return False
+
+        digest = file_digest(path)
+        if row and row[3] == digest:
+            with self.connection:
+                self.connection.execute("UPDATE models SET size = ?, mtime = ? WHERE id = ?",(stat.st_size,stat.st_mtime,row[0]))
+            return False
+
+        signs, properties = extract_signs(ifcopenshell.open(path))
+        with self.connection:
+            if row:
+                model_id = row[0]
+                self.connection.execute("DELETE FROM signs WHERE model_id = ?",(model_id,))
+                self.connection.execute("DELETE FROM properties WHERE model_id = ?",(model_id,))
+                self.connection.execute("UPDATE models SET size = ?, mtime = ?, digest = ?, sign_count = ? WHERE id = ?",(stat.st_size,stat.st_mtime,digest,len(signs),model_id))
+            else:
+                model_id = self.connection.execute("INSERT INTO models (path,size,mtime,digest,sign_count) VALUES (?,?,?,?,?)",(path,stat.st_size,stat.st_mtime,digest,len(signs))).lastrowid
+            self.connection.executemany("INSERT INTO signs VALUES (?,?,?,?,?,?,?,?,?,?,?,?)",((model_id,) + sign for sign in signs))
+            self.connection.executemany("INSERT INTO properties VALUES (?,?,?,?,?)",((model_id,) + prop for prop in properties))
+        return True
+
+    def update_manifest(self,manifest_path):
+        # index the tiles listed in a tile manifest and remove tiles that are no longer listed
+        with open(manifest_path,mode='r',encoding='utf-8') as f:
+            manifest = json.load(f)
+        folder = os.path.dirname(os.path.abspath(manifest_path))
+        paths = [os.path.join(folder,entry["file"]) for entry in manifest["tiles"]]
+        updated = sum(self.update(path) for path in paths)
+        for (path,) in self.connection.execute("SELECT path FROM models").fetchall():
+            if os.path.dirname(path) == folder and path not in paths:
+                self.remove(path)
+        return updated
+
+    def remove(self,model_path):
+        path = os.path.abspath(model_path)
+        with self.connection:
+            row = self.connection.execute("SELECT id FROM models WHERE path = ?",(path,)).fetchone()
+            if row:
+                self.connection.execute("DELETE FROM signs WHERE model_id = ?",row)
+                self.connection.execute("DELETE FROM properties WHERE model_id = ?",row)
+                self.connection.execute("DELETE FROM models WHERE id = ?",row)
+
+    def query(self,sql,parameters=()):
+        return self.connection.execute(sql,parameters).fetchall()
+
+    def count_by_mutcd(self,mutcd=None):
+        # number of signs with a MUTCD code, or (MUTCD code, count) for all codes
+        if mutcd:
+            return self.query("SELECT COUNT(*) FROM signs WHERE mutcd = ?",(mutcd,))[0][0]
+        return self.query("SELECT mutcd, COUNT(*) FROM signs GROUP BY mutcd ORDER BY COUNT(*) DESC")
+
+    def find_object_id(self,object_id):
+        # (model path, GlobalId, Name) of the signs created from a source OBJECTID
+        return self.query("SELECT models.path, signs.global_id, signs.name FROM signs JOIN models ON models.id = signs.model_id WHERE signs.object_id = ?",(object_id,))
+
+    def signs_without_library_type(self):
+        # (GlobalId, Name, MUTCD code) of signs whose type is not in an indexed library
+        return self.query("SELECT global_id, name, mutcd FROM signs WHERE type_global_id IS NULL OR type_global_id NOT IN (SELECT global_id FROM library_types)")
+
+    def signs_near(self,x,y,distance):
+        return self.query("SELECT global_id, name, mutcd, x, y, z FROM signs WHERE x BETWEEN ? AND ? AND y BETWEEN ? AND ? AND (x - ?)*(x - ?) + (y - ?)*(y - ?) <= ?",
+                          (x - distance,x + distance,y - distance,y + distance,x,x,y,y,distance*distance))
+
+    def get_properties(self,global_id,model_path=None):
+        # {pset:{name:value}} of a sign in the model at model_path, or in the first indexed model with the sign
+        # the properties are looked up by (model_id, global_id) so the properties_sign index is used and the properties of
+        # the same sign in different models aren't merged
+        if model_path:
+            row = self.connection.execute("SELECT id FROM models WHERE path = ?",(os.path.abspath(model_path),)).fetchone()
+        else:
+            row = self.connection.execute("SELECT model_id FROM signs WHERE global_id = ? ORDER BY model_id LIMIT 1",(global_id,)).fetchone()
+        if row is None:
+            return {}
+        psets = {}
+        for pset, name, value in self.query("SELECT pset, name, value FROM properties WHERE model_id = ? AND global_id = ?",(row[0],global_id)):
+            psets.setdefault(pset,{})[name] = value
+        return psets
+
+
+if __name__ == "__main__":
+    index = SignIndex()
+    index.add_library("MUTCD_Sign_Library.ifc")
+
+    for attempt in ("initial","unchanged"):
+        start = time.perf_counter()
+        updated = index.update("Test_Corridor_Signs.ifc")
+        print(f"{attempt} update: {'indexed' if updated else 'skipped'} in {time.perf_counter() - start:.3f} s")
+
+    queries = [
+        ("R1-1 signs",lambda: index.count_by_mutcd("R1-1")),
+        ("OBJECTID 1234",lambda: index.find_object_id(1234)),
+        ("signs without library types",lambda: len(index.signs_without_library_type())),
+        ("most common MUTCD codes",lambda: index.count_by_mutcd()[:3]),
+    ]
+    for name, query in queries:
+        start = time.perf_counter()
+        result = query()
+        print(f"{name}: {result} ({1000*(time.perf_counter() - start):.2f} ms)")
+
+    index.close()
+    print("Done")
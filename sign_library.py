@@ -0,0 +1,184 @@
+"""
+Parametric MUTCD sign types
+
+Richard Brice, PE
+WSDOT Bridge and Structures Office
+
+MUTCD_Sign_Library.ifc has one IfcSignType per MUTCD designation rather than one per size. The geometry of each type
+is a unit sign panel (a 1 x 1 bounding box, 1 thick) and the MUTCD_SignType property set holds the parameters
+1) Section - MUTCD section
+2) Shape - shape code (see sign_shapes.py)
+3) SingleLane, MultiLane, Expressway, Freeway, Minimum, Oversized - allowed size for each application, e.g. "36 x 36"
+4) VariableDimensions - True for signs, such as guide signs, whose size depends on their legend
+5) SizeRule - how a MUTCD size is converted to the bounding box of the sign panel
+
+The size of a sign comes from the mapping of the type geometry, an IfcCartesianTransformationOperator3DnonUniform with
+the width, height, and thickness of the sign as scale factors.
+
+SignLibrary finds sign types by MUTCD code with a dictionary (rather than searching the library for each sign) and
+reads the size parameters. SignTypeMapper adds library sign types to a model once and shares the mapping operators
+between signs of the same size.
+
+A sign type has a representation map for each level of detail (Body, Box, and Body-Fallback, see sign_lod.py).
+SignTypeMapper.representations maps all of them with the same mapping operator.
+
+The library is built in each length unit of LIBRARY_UNITS, MUTCD_Sign_Library.ifc (inch), MUTCD_Sign_Library_foot.ifc,
+and MUTCD_Sign_Library_metre.ifc. The unit sign panel is 1 library unit in each of them and the sign types have the same
+GlobalIds in all of them. ifcopenshell.file.add converts the type geometry when the library and model length units differ,
+so a builder opens the variant in the unit of its model (library_variant) and the types are copied as they are.
+Sign sizes are in inches in every variant, SignTypeMapper converts them to library units for the mapping operators.
+"""
+
+import math
+import os
+import ifcopenshell.util.element
+import ifcopenshell.util.unit
+from sign_shapes import bounding_size
+from sign_storage import open_model
+
+
+PSET_NAME = "MUTCD_SignType"
+
+# MUTCD_Sign_Definitions.csv column -> property name
+SIZE_PROPERTIES = {
+    "Single Lane":"SingleLane",
+    "Multi-Lane":"MultiLane",
+    "Expressway":"Expressway",
+    "Freeway":"Freeway",
+    "Minimum":"Minimum",
+    "Oversized":"Oversized",
+}
+
+
+# library length unit -> (length unit name, area unit name, metres per unit). None is the SI unit
+LIBRARY_UNITS = {
+    "inch":("inch","square inch",0.0254),
+    "foot":("foot","square foot",0.3048),
+    "metre":(None,None,1.),
+}
+
+
+def library_file_name(unit,file_name="MUTCD_Sign_Library.ifc"):
+    # MUTCD_Sign_Library.ifc is the inch library, the other units are MUTCD_Sign_Library_foot.ifc, ...
+    if unit == "inch":
+        return file_name
+    base, extension = os.path.splitext(file_name)
+    return f"{base}_{unit}{extension}"
+
+
+def library_variant(unit,file_name="MUTCD_Sign_Library.ifc"):
+    # the variant of file_name in the model length unit (a LIBRARY_UNITS key, or an ifcopenshell.file to use its length
+    # unit). falls back to file_name, whose types are converted as they are added, if the variant hasn't been built
+    if not isinstance(unit,str):
+        scale = ifcopenshell.util.unit.calculate_unit_scale(unit)
+        unit = next((name for name, (length, area, metres) in LIBRARY_UNITS.items() if math.isclose(scale,metres)),None)
+    if unit not in LIBRARY_UNITS:
+        return file_name
+    variant = library_file_name(unit,file_name)
+    return variant if os.path.exists(variant) else file_name
+
+
+def parse_size(size):
+    # "36 x 36", "36x36", or "48 x 48 x 36" -> [36.,36.] or [48.,48.,36.]
+    return [float(v) for v in size.replace("x"," ").split()]
+
+
+class SignLibrary:
+    def __init__(self,library_file="MUTCD_Sign_Library.ifc"):
+        if isinstance(library_file,str):
+            # .ifc libraries are opened lazily, .rdb libraries are read from the store as they are used
+            library_file = open_model(library_file)
+        self.file = library_file
+        # library length units per inch, sign sizes are in inches
+        self.unit_scale = ifcopenshell.util.unit.calculate_unit_scale(library_file)
+        self.per_inch = 0.0254/self.unit_scale
+        self.types = {} # MUTCD code -> IfcSignType
+        for sign_type in library_file.by_type("IfcSignType"):
+            self.types.setdefault(sign_type.Name,sign_type)
+        self.parameters_cache = {}
+
+    def find(self,mutcd):
+        sign_type = self.types.get(mutcd)
+        if sign_type is None:
+            print(f"{mutcd} - Sign type not found")
+        return sign_type
+
+    def parameters(self,mutcd):
+        # MUTCD_SignType property values of a sign type, empty if the type isn't in the library
+        parameters = self.parameters_cache.get(mutcd)
+        if parameters is None:
+            sign_type = self.types.get(mutcd)
+            parameters = ifcopenshell.util.element.get_pset(sign_type,PSET_NAME) if sign_type else None
+            parameters = parameters if parameters else {}
+            self.parameters_cache[mutcd] = parameters
+        return parameters
+
+    def sizes(self,mutcd):
+        # {property name:size} of the allowed sizes
+        parameters = self.parameters(mutcd)
+        return {name:parameters[name] for name in SIZE_PROPERTIES.values() if parameters.get(name)}
+
+    def bounding_size(self,mutcd,size=None):
+        # (width, height) of the sign panel in inches
+        # size is a size such as "36x36", an application such as "MultiLane", or None for the first allowed size
+        # returns None for variable dimension signs without a size
+        parameters = self.parameters(mutcd)
+        if size is None or size in SIZE_PROPERTIES.values():
+            sizes = self.sizes(mutcd)
+            size = sizes.get(size) if size else next(iter(sizes.values()),None)
+            if size is None:
+                return None
+        return bounding_size(parameters.get("Shape","R"),parse_size(size))
+
+
+class SignTypeMapper:
+    # library sign types are added to a model once and their unit geometry is scaled to the size of each sign
+    # the unit sign panel is 1 library unit, converted to model units by ifcopenshell.file.add if the library isn't the
+    # variant in the model unit, so the scale factors are the width, height, and thickness (inches) in library units
+    def __init__(self,model,library,thickness=1.):
+        self.model = model
+        self.library = library
+        self.thickness = thickness # inches
+        self.per_inch = library.per_inch
+        self.sign_types = {} # MUTCD code -> IfcSignType in model
+        self.mapping_targets = {} # (width, height) -> IfcCartesianTransformationOperator3DnonUniform
+        self.origin = None
+
+    def get_sign_type(self,mutcd):
+        if mutcd not in self.sign_types:
+            sign_type = self.library.types.get(mutcd)
+            # add the IfcTypeObject to the model and use the returned value
+            # (undefined behavior results when using objects from one model in another model)
+            self.sign_types[mutcd] = ifcopenshell.file.add(self.model,sign_type) if sign_type else None
+        return self.sign_types[mutcd]
+
+    def library_size(self,mutcd,size=None):
+        # (width, height) of a library size, see SignLibrary.bounding_size
+        return self.library.bounding_size(mutcd,size)
+
+    def mapping_target(self,width,height):
+        # width and height are in inches
+        key = (round(width,9),round(height,9))
+        mapping_target = self.mapping_targets.get(key)
+        if mapping_target is None:
+            if self.origin is None:
+                self.origin = self.model.createIfcCartesianPoint((0.,0.,0.))
+            mapping_target = self.model.createIfcCartesianTransformationOperator3DnonUniform(LocalOrigin=self.origin,Scale=width*self.per_inch,Scale2=height*self.per_inch,Scale3=self.thickness*self.per_inch)
+            self.mapping_targets[key] = mapping_target
+        return mapping_target
+
+    def mapped_item(self,sign_type,width,height):
+        return self.model.createIfcMappedItem(MappingSource=sign_type.RepresentationMaps[0],MappingTarget=self.mapping_target(width,height))
+
+    def representations(self,sign_type,width,height,contexts):
+        # mapped representations of each representation map of sign_type that has a context in contexts
+        # contexts is {context identifier:context of the model}, width and height are in inches
+        mapping_target = self.mapping_target(width,height)
+        representations = []
+        for rep_map in sign_type.RepresentationMaps:
+            identifier = rep_map.MappedRepresentation.RepresentationIdentifier
+            context = contexts.get(identifier)
+            if context is not None:
+                mapped_item = self.model.createIfcMappedItem(MappingSource=rep_map,MappingTarget=mapping_target)
+                representations.append(self.model.createIfcShapeRepresentation(ContextOfItems=context,RepresentationIdentifier=identifier,RepresentationType="MappedRepresentation",Items=[mapped_item]))
+        return representations
@@ -0,0 +1,225 @@
+"""
+Sign levels of detail
+
+Richard Brice, PE
+WSDOT Bridge and Structures Office
+
+The sign types of MUTCD_Sign_Library.ifc, and the signs of the corridor models, had only a "Body" swept solid. A viewer
+has to tessellate every extruded profile, arcs included, to draw a corridor even when it is zoomed out so far that the
+signs are a few pixels, and an analysis tool has to do the same to find which signs are in a region.
+
+Each sign type now has a representation map for each level of detail, and each sign has a mapped representation for
+the levels of detail of its model. Each level of detail has its own representation subcontext of the Model context so
+viewers and tools can select one by its context identifier
+Body - IfcExtrudedAreaSolid of the exact sign panel profile
+Box - IfcBoundingBox of the sign panel, for culling and drawing signs far from the camera
+Body-Fallback - IfcTriangulatedFaceSet of the sign panel, a prism over the profile with its arcs replaced by chords.
+                It is ready to draw without tessellating and has 8 to 44 triangles per sign
+
+Signs get Body and Box by default (DEFAULT_LEVELS). Body-Fallback is opt-in (Build_Test_Corridor_Signs.py --fallback)
+because the ifcopenshell geometry iterator, and IfcConvert and the viewers built on it, process Body-Fallback along with
+Body and return two shapes per sign. The face sets are also slower through the kernel than the swept solids because
+the kernel rebuilds a shell from the triangles (see ReadMe.md). Box representations aren't processed by the iterator.
+
+sign_bounds reads the world bounds of all the signs of a model from their Box representations, and cull selects the
+signs that intersect a region. sign_meshes builds one triangle mesh of all the signs from their Body-Fallback face
+sets (in models built with them), as a viewer would before drawing. Neither uses the geometry kernel. The signs that share a face set (same type and
+size) are transformed together with array operations.
+
+python sign_lod.py Test_Corridor_Signs.ifc
+
+times opening the model, tessellating the signs with the ifcopenshell geometry iterator (a stand in for a viewer's
+render preparation), reading the Body-Fallback meshes directly, and computing the bounds of the signs from their boxes.
+"""
+
+import argparse
+import ifcopenshell
+import ifcopenshell.api.context
+import ifcopenshell.geom
+import ifcopenshell.util.placement
+import multiprocessing
+import numpy as np
+import time
+from sign_export import PlacementResolver
+
+
+LEVELS_OF_DETAIL = ["Body","Box","Body-Fallback"]
+# levels of detail of the signs of a model unless Body-Fallback is asked for, the sign types of the library have all of them
+DEFAULT_LEVELS = ["Body","Box"]
+
+
+def add_contexts(model,parent,levels=LEVELS_OF_DETAIL):
+    # {context identifier:subcontext} of each level of detail in levels
+    return {identifier:ifcopenshell.api.context.add_context(model,context_type="Model",context_identifier=identifier,target_view="MODEL_VIEW",parent=parent) for identifier in levels}
+
+
+def body_context_ids(model):
+    # ids of the representation contexts other than the Box and Body-Fallback levels of detail. the geometry iterator
+    # processes Body-Fallback representations along with Body, so it is limited to these contexts to get one shape per
+    # product. returns None if the model doesn't have levels of detail
+    contexts = model.by_type("IfcGeometricRepresentationContext")
+    if not any(context.ContextIdentifier in LEVELS_OF_DETAIL[1:] for context in contexts):
+        return None
+    return [context.id() for context in contexts if context.ContextIdentifier not in LEVELS_OF_DETAIL[1:]]
+
+
+def _target_matrix(target):
+    # matrix of an IfcCartesianTransformationOperator3D, read directly when it doesn't have axes (the operators of the
+    # sign mapper are a scale and a local origin)
+    # (Axis1, Axis2, LocalOrigin, Scale, Axis3[, Scale2, Scale3])
+    if target[0] is None and target[1] is None and target[4] is None:
+        scale = target[3] if target[3] is not None else 1.
+        non_uniform = target.is_a() == "IfcCartesianTransformationOperator3DnonUniform"
+        matrix = np.diag([scale,(target[5] if non_uniform else None) or scale,(target[6] if non_uniform else None) or scale,1.])
+        coordinates = target[2][0]
+        matrix[:len(coordinates),3] = coordinates
+        return matrix
+    return ifcopenshell.util.placement.get_cartesiantransformationoperator3d(target)
+
+
+def level_items(model,identifier):
+    # signs with a representation of a level of detail, the geometric item of the representation, and the world matrix
+    # of the item (n,4,4). mapped items are resolved once each since signs of the same type and size share them
+    # attributes are read by position (see sign_export.py)
+    # IfcSign (.., Representation at 6), IfcProductDefinitionShape (Name, Description, Representations)
+    # IfcShapeRepresentation (ContextOfItems, RepresentationIdentifier, RepresentationType, Items)
+    # IfcMappedItem (MappingSource, MappingTarget), IfcRepresentationMap (MappingOrigin, MappedRepresentation)
+    signs = []
+    items = []
+    transforms = []
+    resolved = {}
+    origins = {} # mapping origin id -> matrix, the representation maps of a model usually share one origin
+    targets = {} # mapping target id -> matrix
+    identity = np.eye(4)
+    for sign in model.by_type("IfcSign"):
+        product_shape = sign[6]
+        if product_shape is None:
+            continue
+        for representation in product_shape[2]:
+            if representation[1] == identifier and representation[3]:
+                item = representation[3][0]
+                item_transform = resolved.get(item.id())
+                if item_transform is None:
+                    if item.is_a() == "IfcMappedItem":
+                        source = item[0]
+                        target = item[1]
+                        origin = source[0]
+                        if origin.id() not in origins:
+                            origins[origin.id()] = ifcopenshell.util.placement.get_axis2placement(origin)
+                        if target.id() not in targets:
+                            targets[target.id()] = _target_matrix(target)
+                        item_transform = (source[1][3][0],targets[target.id()] @ origins[origin.id()])
+                    else:
+                        item_transform = (item,identity)
+                    resolved[item.id()] = item_transform
+                signs.append(sign)
+                items.append(item_transform[0])
+                transforms.append(item_transform[1])
+                break
+    if not signs:
+        return signs, items, np.zeros((0,4,4))
+    matrices = PlacementResolver(model).resolve([sign[5] for sign in signs])
+    return signs, items, np.matmul(matrices,np.array(transforms))
+
+
+def sign_bounds(model):
+    # signs with a Box representation and their world axis aligned bounds (n,2,3) in model units
+    signs, items, matrices = level_items(model,"Box")
+    if not signs:
+        return signs, np.zeros((0,2,3))
+    corners = {} # the eight corners of each distinct box
+    boxes = []
+    for item in items:
+        box = corners.get(item.id())
+        if box is None:
+            low = np.array(item.Corner.Coordinates,dtype=np.float64)
+            size = np.array([item.XDim,item.YDim,item.ZDim])
+            box = corners[item.id()] = low + np.array(list(np.ndindex(2,2,2)))*size
+        boxes.append(box)
+    world = np.einsum("nij,nkj->nki",matrices[:,:3,:3],np.array(boxes)) + matrices[:,None,:3,3]
+    return signs, np.stack((world.min(axis=1),world.max(axis=1)),axis=1)
+
+
+def cull(bounds,low,high):
+    # indices of the bounds that intersect the box from low to high
+    return np.flatnonzero(np.all(bounds[:,1] >= low,axis=1) & np.all(bounds[:,0] <= high,axis=1))
+
+
+def sign_meshes(model):
+    # one triangle mesh of all the signs from their Body-Fallback face sets, without the geometry kernel
+    # returns the signs, world vertices (n,3), triangles (m,3) with 0-based indices, and the sign index of each triangle
+    signs, items, matrices = level_items(model,"Body-Fallback")
+    face_sets = {} # item id -> (points, triangles)
+    groups = {} # item id -> sign indices
+    for i, item in enumerate(items):
+        if item.id() not in face_sets:
+            face_sets[item.id()] = (np.array(item.Coordinates.CoordList,dtype=np.float64),np.array(item.CoordIndex,dtype=np.int64) - 1)
+            groups[item.id()] = []
+        groups[item.id()].append(i)
+
+    vertices = []
+    triangles = []
+    owners = []
+    offset = 0
+    # the signs that share a face set are transformed together
+    for key, indices in groups.items():
+        points, faces = face_sets[key]
+        indices = np.array(indices)
+        world = np.einsum("nij,kj->nki",matrices[indices,:3,:3],points) + matrices[indices,None,:3,3]
+        vertices.append(world.reshape(-1,3))
+        triangles.append((faces[None,:,:] + offset + len(points)*np.arange(len(indices))[:,None,None]).reshape(-1,3))
+        owners.append(np.repeat(indices,len(faces)))
+        offset += len(indices)*len(points)
+    if not vertices:
+        return signs, np.zeros((0,3)), np.zeros((0,3),dtype=np.int64), np.zeros(0,dtype=np.int64)
+    return signs, np.concatenate(vertices), np.concatenate(triangles), np.concatenate(owners)
+
+
+def tessellate(model,identifier):
+    # number of signs, vertices, and triangles of the signs tessellated by the geometry kernel in the contexts with identifier
+    settings = ifcopenshell.geom.settings()
+    settings.set("context-ids",[context.id() for context in model.by_type("IfcGeometricRepresentationSubContext") if context.ContextIdentifier == identifier])
+    iterator = ifcopenshell.geom.iterator(settings,model,multiprocessing.cpu_count(),include=model.by_type("IfcSign"))
+    count = vertices = triangles = 0
+    if iterator.initialize():
+        while True:
+            geometry = iterator.get().geometry
+            count += 1
+            vertices += len(geometry.verts)//3
+            triangles += len(geometry.faces)//3
+            if not iterator.next():
+                break
+    return count, vertices, triangles
+
+
+def benchmark(file_name="Test_Corridor_Signs.ifc"):
+    start = time.perf_counter()
+    model = ifcopenshell.open(file_name)
+    print(f"Opened {file_name} in {time.perf_counter() - start:.3f} s")
+
+    identifiers = {context.ContextIdentifier for context in model.by_type("IfcGeometricRepresentationSubContext")}
+    for identifier in [identifier for identifier in ("Body","Body-Fallback") if identifier in identifiers]:
+        start = time.perf_counter()
+        count, vertices, triangles = tessellate(model,identifier)
+        print(f"{identifier} by the geometry kernel: {count} signs, {vertices} vertices, {triangles} triangles in {time.perf_counter() - start:.3f} s")
+
+    start = time.perf_counter()
+    signs, vertices, triangles, owners = sign_meshes(model)
+    print(f"Body-Fallback read directly: {len(signs)} signs, {len(vertices)} vertices, {len(triangles)} triangles in {time.perf_counter() - start:.3f} s")
+
+    start = time.perf_counter()
+    signs, bounds = sign_bounds(model)
+    elapsed = time.perf_counter() - start
+    if len(signs):
+        # a mile square region around the sign in the middle of the model
+        centers = bounds.mean(axis=1)
+        center = centers[np.argsort(centers[:,0])[len(centers)//2]]
+        inside = cull(bounds,center - 2640.,center + 2640.)
+        print(f"Box: bounds of {len(signs)} signs in {elapsed:.3f} s, {len(inside)} signs in a 1 mile square")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time the levels of detail of a sign model")
+    parser.add_argument("model",nargs="?",default="Test_Corridor_Signs.ifc")
+    args = parser.parse_args()
+    benchmark(args.model)
@@ -0,0 +1,147 @@
+"""
+Overlapped loading and writing of sign models
+
+Richard Brice, PE
+WSDOT Bridge and Structures Office
+
+Building a sign model has phases that don't depend on each other - opening MUTCD_Sign_Library.ifc, reading the sign
+records, creating the entities, and writing the IFC file. Run one after the other, the build waits on each of them.
+1) The library is opened on a worker thread (load_in_background) while the sign records are read
+2) BackgroundWriter writes finished models while the next model (tile) is built. ifcopenshell holds the GIL while it
+   serializes a model, so a writer thread can't run at the same time as the Python code building the next tile. Where
+   processes can be forked, each model is written by a forked child process that has a copy-on-write image of the model.
+   Elsewhere (Windows) the models are written by a thread, which only overlaps the file I/O.
+3) PhaseTimes adds up the time spent in each phase, wherever it runs. The sum is the time the phases would take one
+   after the other, so the difference between it and the elapsed time is the saving from overlapping the phases. Phases
+   that share a CPU slow each other down, which inflates the sum, so build with --sequential to measure the baseline.
+"""
+
+import concurrent.futures
+import multiprocessing
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from sign_storage import write_model
+
+
+class PhaseTimes:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.times = defaultdict(float)
+        self.lock = threading.Lock()
+
+    def add(self,phase,seconds):
+        with self.lock:
+            self.times[phase] += seconds
+
+    @contextmanager
+    def phase(self,name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name,time.perf_counter() - start)
+
+    def report(self):
+        elapsed = time.perf_counter() - self.start
+        sequential = sum(self.times.values())
+        for phase, seconds in self.times.items():
+            print(f"{phase}: {seconds:.2f} s")
+        print(f"Sequential: {sequential:.2f} s, elapsed: {elapsed:.2f} s, saving: {sequential - elapsed:.2f} s")
+        return elapsed, sequential
+
+
+def load_in_background(function,*args,times=None,phase="Load library"):
+    # returns a Future for function(*args) running on a worker thread
+    # the thread ends when function returns so that it isn't running when writer processes are forked
+    def timed():
+        start = time.perf_counter()
+        result = function(*args)
+        if times is not None:
+            times.add(phase,time.perf_counter() - start)
+        return result
+
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=1,thread_name_prefix="sign_loader")
+    future = executor.submit(timed)
+    executor.shutdown(wait=False)
+    return future
+
+
+def result(value):
+    # the value of a Future from load_in_background, or the value itself
+    return value.result() if isinstance(value,concurrent.futures.Future) else value
+
+
+def _write(model,file_name):
+    # returns the time to write the model, the storage format is given by the extension of file_name
+    start = time.perf_counter()
+    write_model(model,file_name)
+    return time.perf_counter() - start
+
+
+def _write_in_child(model,file_name,connection):
+    # runs in the forked process
+    try:
+        connection.send(_write(model,file_name))
+    except Exception as e:
+        connection.send(f"{file_name} - {e}")
+    connection.close()
+
+
+class BackgroundWriter:
+    # writes models while the caller builds the next one
+    # max_pending limits the number of models held in memory waiting to be written
+    # processes is True to write in forked processes, False for a thread, None to fork when the platform can
+    def __init__(self,max_pending=2,processes=None,times=None):
+        if processes is None:
+            processes = "fork" in multiprocessing.get_all_start_methods()
+        self.max_pending = max_pending
+        self.times = times
+        self.context = multiprocessing.get_context("fork") if processes else None
+        self.executor = None if processes else concurrent.futures.ThreadPoolExecutor(max_workers=1,thread_name_prefix="sign_writer")
+        self.pending = [] # (file name, process and connection or Future)
+        self.failed = []
+
+    def write(self,model,file_name):
+        # the model must not be changed after it is submitted
+        while len(self.pending) >= self.max_pending:
+            self._finish(self.pending.pop(0))
+
+        if self.context:
+            receiver, sender = self.context.Pipe(duplex=False)
+            process = self.context.Process(target=_write_in_child,args=(model,file_name,sender))
+            process.start()
+            sender.close()
+            self.pending.append((file_name,(process,receiver)))
+        else:
+            self.pending.append((file_name,self.executor.submit(_write,model,file_name)))
+
+    def _finish(self,item):
+        file_name, job = item
+        try:
+            if self.context:
+                process, receiver = job
+                try:
+                    outcome = receiver.recv()
+                except EOFError:
+                    outcome = f"{file_name} - writer process ended without a result"
+                process.join()
+            else:
+                outcome = job.result()
+        except Exception as e:
+            outcome = f"{file_name} - {e}"
+
+        if isinstance(outcome,str):
+            print(f"Error writing {outcome}")
+            self.failed.append(file_name)
+        elif self.times is not None:
+            self.times.add("Write",outcome)
+
+    def close(self):
+        # wait for all the models to be written, returns the files that could not be written
+        while self.pending:
+            self._finish(self.pending.pop(0))
+        if self.executor:
+            self.executor.shutdown()
+        return self.failed
@@ -0,0 +1,206 @@
+"""
+Bulk property set and quantity set writer for sign models
+
+Richard Brice, PE
+WSDOT Bridge and Structures Office
+
+ifcopenshell.api.pset.add_pset/edit_pset looks up the property set template, validates, and searches inverse
+relationships every time it is called. That is fine for a single sign, but far too slow for thousands of signs.
+
+PropertyWriter takes columnar property data (one list of values per property, one value per sign) and writes the
+property sets and quantity sets in a single pass.
+1) Property set templates are looked up once per property set name
+2) Identical IfcPropertySingleValue and IfcPhysicalSimpleQuantity entities are created once and shared by all the
+   property sets that use them (IfcProperty.PartOfPset is a SET[0:?])
+3) Signs with identical property values share a single property set and a single IfcRelDefinesByProperties
+4) When the sign types are provided, values that are the same for every sign of a type are written once on the
+   IfcSignType (HasPropertySets) instead of being repeated on each IfcSign
+
+Call flush() after all the property data has been added to create the IfcRelDefinesByProperties relationships.
+"""
+
+import ifcopenshell
+import ifcopenshell.guid
+import ifcopenshell.util.pset
+from collections import defaultdict
+
+
+# quantity entity and value attribute for each property template type
+QUANTITY_TYPES = {
+    "Q_LENGTH":("IfcQuantityLength","LengthValue"),
+    "Q_AREA":("IfcQuantityArea","AreaValue"),
+    "Q_VOLUME":("IfcQuantityVolume","VolumeValue"),
+    "Q_COUNT":("IfcQuantityCount","CountValue"),
+    "Q_WEIGHT":("IfcQuantityWeight","WeightValue"),
+    "Q_TIME":("IfcQuantityTime","TimeValue"),
+}
+
+
+def _guess_quantity_type(name):
+    # quantities that are not defined by a template are typed by their name
+    for key, template_type in (("Area","Q_AREA"),("Volume","Q_VOLUME"),("Weight","Q_WEIGHT"),("Count","Q_COUNT")):
+        if key in name:
+            return template_type
+    return "Q_LENGTH"
+
+
+def _guess_measure_type(value):
+    if isinstance(value,bool):
+        return "IfcBoolean"
+    if isinstance(value,int):
+        return "IfcInteger"
+    if isinstance(value,float):
+        return "IfcReal"
+    return "IfcLabel"
+
+
+class PropertyWriter:
+    def __init__(self,model):
+        self.model = model
+        self.template = ifcopenshell.util.pset.get_template(model.schema)
+        self.property_types = {} # property set name -> {property name: template type or measure type}
+        self.properties = {} # (name, type, value, specification) -> IfcPropertySingleValue or IfcPhysicalSimpleQuantity
+        self.property_sets = {} # (property set name, property ids) -> IfcPropertySet or IfcElementQuantity
+        self.related_objects = defaultdict(list) # property set -> objects
+        self.relationships = {} # property set -> IfcRelDefinesByProperties
+        self.type_property_sets = {} # (type id, property set name) -> IfcPropertySet or IfcElementQuantity
+
+    def _get_property_types(self,name):
+        property_types = self.property_types.get(name)
+        if property_types is None:
+            property_types = {}
+            definition = self.template.get_by_name(name)
+            if definition:
+                for property_template in definition.HasPropertyTemplates:
+                    if property_template.TemplateType and property_template.TemplateType.startswith("Q_"):
+                        property_types[property_template.Name] = property_template.TemplateType
+                    elif property_template.PrimaryMeasureType:
+                        property_types[property_template.Name] = property_template.PrimaryMeasureType
+            self.property_types[name] = property_types
+        return property_types
+
+    def set_property_types(self,name,property_types):
+        # measure types of a property set that isn't defined by the IFC templates, e.g. from a data dictionary
+        self.property_types[name] = dict(property_types)
+
+    def get_property_sets(self,name):
+        # the property sets or quantity sets created with this name, on objects and on types
+        psets = [pset for (pset_name, ids), pset in self.property_sets.items() if pset_name == name]
+        return psets + [pset for (type_id, pset_name), pset in self.type_property_sets.items() if pset_name == name]
+
+    def _get_property(self,pset_name,name,value,is_qto,specification=None):
+        property_type = self._get_property_types(pset_name).get(name)
+        if is_qto:
+            property_type = property_type if property_type in QUANTITY_TYPES else _guess_quantity_type(name)
+        elif property_type is None:
+            property_type = _guess_measure_type(value)
+
+        key = (name,property_type,value,specification)
+        prop = self.properties.get(key)
+        if prop is None:
+            if is_qto:
+                entity, attribute = QUANTITY_TYPES[property_type]
+                prop = self.model.create_entity(entity,Name=name,**{attribute:value})
+            else:
+                prop = self.model.createIfcPropertySingleValue(Name=name,NominalValue=self.model.create_entity(property_type,value))
+                if specification:
+                    prop.Specification = specification
+            self.properties[key] = prop
+        return prop
+
+    def _create_property_set(self,name,props,is_qto):
+        if is_qto:
+            return self.model.createIfcElementQuantity(GlobalId=ifcopenshell.guid.new(),Name=name,Quantities=props)
+        return self.model.createIfcPropertySet(GlobalId=ifcopenshell.guid.new(),Name=name,HasProperties=props)
+
+    def _get_property_set(self,name,props,is_qto):
+        key = (name,tuple(sorted(prop.id() for prop in props)))
+        pset = self.property_sets.get(key)
+        if pset is None:
+            pset = self._create_property_set(name,props,is_qto)
+            self.property_sets[key] = pset
+        return pset
+
+    def _add_type_properties(self,object_type,name,props,is_qto):
+        key = (object_type.id(),name)
+        pset = self.type_property_sets.get(key)
+        if pset is None:
+            pset = self._create_property_set(name,props,is_qto)
+            object_type.HasPropertySets = list(object_type.HasPropertySets or []) + [pset]
+            self.type_property_sets[key] = pset
+        elif is_qto:
+            pset.Quantities = list(pset.Quantities) + props
+        else:
+            pset.HasProperties = list(pset.HasProperties) + props
+
+    def _add(self,objects,name,columns,types,specifications,is_qto,min_shared):
+        specifications = specifications if specifications else {}
+        count = len(objects)
+        for column_name, values in columns.items():
+            if len(values) != count:
+                raise ValueError(f"{name}.{column_name} has {len(values)} values for {count} objects")
+
+        # group the objects by type. columns with a single value for every object of a type go on the type
+        groups = defaultdict(list)
+        if types is None:
+            groups[None] = list(range(count))
+        else:
+            for i, object_type in enumerate(types):
+                groups[object_type].append(i)
+
+        for object_type, indices in groups.items():
+            instance_columns = []
+            type_props = []
+            for column_name, values in columns.items():
+                first = values[indices[0]]
+                if object_type is not None and min_shared <= len(indices) and first is not None and all(values[i] == first for i in indices):
+                    type_props.append(self._get_property(name,column_name,first,is_qto,specifications.get(column_name)))
+                else:
+                    instance_columns.append((column_name,values))
+
+            if type_props:
+                self._add_type_properties(object_type,name,type_props,is_qto)
+
+            if not instance_columns:
+                continue
+
+            for i in indices:
+                props = [self._get_property(name,column_name,values[i],is_qto,specifications.get(column_name)) for column_name, values in instance_columns if values[i] is not None]
+                if props:
+                    pset = self._get_property_set(name,props,is_qto)
+                    self.related_objects[pset].append(objects[i])
+
+    def add_psets(self,objects,name,columns,types=None,specifications=None,min_shared=2):
+        # objects - list of IfcObject
+        # name - property set name
+        # columns - dictionary of property name to list of values (one per object, None for no value)
+        # types - optional list of IfcTypeObject (one per object) so common values can be moved to the type
+        # specifications - optional dictionary of property name to Specification (e.g. bSDD property URI)
+        # min_shared - number of objects of a type that must share a value before it is moved to the type
+        self._add(objects,name,columns,types,specifications,False,min_shared)
+
+    def add_qtos(self,objects,name,columns,types=None,min_shared=2):
+        self._add(objects,name,columns,types,None,True,min_shared)
+
+    def add_type_psets(self,object_type,name,properties,specifications=None):
+        # properties for a single type object, e.g. {"Height":36.0,"Width":36.0}
+        specifications = specifications if specifications else {}
+        props = [self._get_property(name,key,value,False,specifications.get(key)) for key, value in properties.items() if value is not None]
+        self._add_type_properties(object_type,name,props,False)
+
+    def add_type_qtos(self,object_type,name,quantities):
+        props = [self._get_property(name,key,value,True) for key, value in quantities.items() if value is not None]
+        self._add_type_properties(object_type,name,props,True)
+
+    def flush(self):
+        # one IfcRelDefinesByProperties for each distinct property set
+        # a property set can only be related by one relationship so objects added after a previous flush are appended
+        for pset, objects in self.related_objects.items():
+            rel = self.relationships.get(pset)
+            if rel:
+                rel.RelatedObjects = list(rel.RelatedObjects) + objects
+            else:
+                self.relationships[pset] = self.model.createIfcRelDefinesByProperties(GlobalId=ifcopenshell.guid.new(),RelatedObjects=objects,RelatingPropertyDefinition=pset)
+        count = len(self.related_objects)
+        self.related_objects.clear()
+        return count
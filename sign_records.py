@@ -0,0 +1,264 @@
+"""
+Compact array backed store for sign records
+
+Richard Brice, PE
+WSDOT Bridge and Structures Office
+
+Reading Sign_Face.csv with csv.DictReader keeps every row as a dictionary of strings until it is converted to numbers
+field by field. At statewide scale the per-row dictionaries use far more memory than the data itself.
+
+SignRecordStore keeps the sign records in columns
+1) X, Y, Z, Width, Height, and Orientation are NumPy float64 arrays (NaN where the value is missing)
+2) OBJECTID is a NumPy int64 array
+3) MUTCD, Layer, Condition, and Text are interned - each distinct string is stored once and the column is an array of
+   int32 codes into the list of distinct strings
+
+Iterating over the store returns SignRecord objects, a __slots__ view of a single row, so existing code that reads one
+sign at a time can use record.mutcd, record.x, etc. without materializing the row.
+
+Run this script directly to compare the memory use of the store and of a list of dictionaries for 1,000,000 rows.
+"""
+
+import array
+import csv
+import io
+import numpy as np
+import time
+import tracemalloc
+
+
+FIELDNAMES = [
+    "OBJECTID","X","Y","Z","Layer","Text","MUTCD","Width","Height","Condition","Orientation"
+]
+
+NUMERIC_FIELDS = {"X":"x","Y":"y","Z":"z","Width":"width","Height":"height","Orientation":"orientation"}
+CATEGORY_FIELDS = {"MUTCD":"mutcd","Layer":"layer","Condition":"condition","Text":"text"}
+
+
+class CategoryColumn:
+    # interned strings - codes index into values
+    def __init__(self):
+        self.values = []
+        self.lookup = {}
+        self.builder = array.array('i')
+        self.codes = None
+
+    def intern(self,value):
+        code = self.lookup.get(value)
+        if code is None:
+            code = len(self.values)
+            self.values.append(value)
+            self.lookup[value] = code
+        return code
+
+    def append(self,value):
+        self.builder.append(self.intern(value))
+
+    def finish(self):
+        self.codes = np.frombuffer(self.builder,dtype=np.int32).copy() if len(self.builder) else np.zeros(0,dtype=np.int32)
+        self.builder = array.array('i')
+
+    def __getitem__(self,index):
+        return self.values[self.codes[index]]
+
+    def code_of(self,value):
+        # -1 if the value doesn't occur in the column
+        return self.lookup.get(value,-1)
+
+    def mask(self,value):
+        # boolean mask of the rows with this value
+        return self.codes == self.code_of(value)
+
+    def nbytes(self):
+        return self.codes.nbytes + sum(len(v) for v in self.values)
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except ValueError:
+        return float("nan")
+
+
+class SignRecord:
+    __slots__ = ("store","index")
+
+    def __init__(self,store,index):
+        self.store = store
+        self.index = index
+
+    @property
+    def object_id(self):
+        return int(self.store.object_id[self.index])
+
+    @property
+    def x(self):
+        return float(self.store.x[self.index])
+
+    @property
+    def y(self):
+        return float(self.store.y[self.index])
+
+    @property
+    def z(self):
+        return float(self.store.z[self.index])
+
+    @property
+    def width(self):
+        return float(self.store.width[self.index])
+
+    @property
+    def height(self):
+        return float(self.store.height[self.index])
+
+    @property
+    def orientation(self):
+        return float(self.store.orientation[self.index])
+
+    @property
+    def mutcd(self):
+        return self.store.mutcd[self.index]
+
+    @property
+    def layer(self):
+        return self.store.layer[self.index]
+
+    @property
+    def condition(self):
+        return self.store.condition[self.index]
+
+    @property
+    def text(self):
+        return self.store.text[self.index]
+
+    def as_dict(self):
+        # same fields and string values as a csv.DictReader row
+        return {
+            "OBJECTID":str(self.object_id),"X":repr(self.x),"Y":repr(self.y),"Z":repr(self.z),"Layer":self.layer,"Text":self.text,
+            "MUTCD":self.mutcd,"Width":repr(self.width),"Height":repr(self.height),"Condition":self.condition,"Orientation":repr(self.orientation)
+        }
+
+
+class SignRecordStore:
+    def __init__(self):
+        self.object_id = np.zeros(0,dtype=np.int64)
+        for name in NUMERIC_FIELDS.values():
+            setattr(self,name,np.zeros(0,dtype=np.float64))
+        for name in CATEGORY_FIELDS.values():
+            column = CategoryColumn()
+            column.finish()
+            setattr(self,name,column)
+
+    def __len__(self):
+        return len(self.object_id)
+
+    def __getitem__(self,index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        return SignRecord(self,index)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield SignRecord(self,index)
+
+    @staticmethod
+    def from_rows(rows):
+        # rows is any iterable of sequences ordered as FIELDNAMES
+        store = SignRecordStore()
+        object_ids = array.array('q')
+        numeric = {name:array.array('d') for name in NUMERIC_FIELDS.values()}
+        categories = {name:CategoryColumn() for name in CATEGORY_FIELDS.values()}
+
+        numeric_columns = [(FIELDNAMES.index(field),numeric[name]) for field, name in NUMERIC_FIELDS.items()]
+        category_columns = [(FIELDNAMES.index(field),categories[name]) for field, name in CATEGORY_FIELDS.items()]
+        skipped = 0
+        for row in rows:
+            # rows without an OBJECTID (blank lines, partial records) are skipped rather than failing the whole store
+            try:
+                object_id = int(row[0])
+            except (IndexError,ValueError):
+                skipped += 1
+                continue
+            object_ids.append(object_id)
+            if len(row) < len(FIELDNAMES):
+                row = list(row) + [""]*(len(FIELDNAMES) - len(row))
+            for i, column in numeric_columns:
+                column.append(_to_float(row[i]))
+            for i, column in category_columns:
+                column.append(row[i])
+        if skipped:
+            print(f"Warning: {skipped} sign records without an OBJECTID were skipped")
+
+        store.object_id = np.frombuffer(object_ids,dtype=np.int64).copy() if len(object_ids) else np.zeros(0,dtype=np.int64)
+        for name, column in numeric.items():
+            setattr(store,name,np.frombuffer(column,dtype=np.float64).copy() if len(column) else np.zeros(0,dtype=np.float64))
+        for name, column in categories.items():
+            column.finish()
+            setattr(store,name,column)
+        return store
+
+    @staticmethod
+    def from_csv(file_path):
+        with open(file_path,mode='r',newline='',encoding='utf-8') as csvfile:
+            next(csvfile)
+            return SignRecordStore.from_rows(csv.reader(csvfile))
+
+    def take(self,indices):
+        # new store with the selected rows (indices or boolean mask). category values are shared with this store
+        store = SignRecordStore()
+        store.object_id = self.object_id[indices]
+        for name in NUMERIC_FIELDS.values():
+            setattr(store,name,getattr(self,name)[indices])
+        for name in CATEGORY_FIELDS.values():
+            column = getattr(self,name)
+            subset = CategoryColumn()
+            subset.values = column.values
+            subset.lookup = column.lookup
+            subset.codes = column.codes[indices]
+            setattr(store,name,subset)
+        return store
+
+    def nbytes(self):
+        size = self.object_id.nbytes
+        size += sum(getattr(self,name).nbytes for name in NUMERIC_FIELDS.values())
+        size += sum(getattr(self,name).nbytes() for name in CATEGORY_FIELDS.values())
+        return size
+
+
+def _repeat_rows(file_path,count):
+    # repeat the rows of a csv file, with unique OBJECTID, to simulate a large inventory
+    # the lines are parsed again for every row so each row has its own strings, like reading a large file
+    with open(file_path,mode='r',newline='',encoding='utf-8') as csvfile:
+        next(csvfile)
+        rows = list(csv.reader(csvfile))
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    lines = []
+    for row in rows:
+        writer.writerow(row[1:])
+        lines.append(buffer.getvalue())
+        buffer.seek(0)
+        buffer.truncate()
+    return csv.reader(f"{i},{lines[i % len(lines)]}" for i in range(count))
+
+
+def benchmark(file_path="Sign_Face.csv",count=1000000):
+    for method in ("dict","store"):
+        tracemalloc.start()
+        start = time.perf_counter()
+        if method == "dict":
+            data = [dict(zip(FIELDNAMES,row)) for row in _repeat_rows(file_path,count)]
+        else:
+            data = SignRecordStore.from_rows(_repeat_rows(file_path,count))
+        elapsed = time.perf_counter() - start
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f"{method}: {len(data)} rows, {current/2**20:.0f} MB retained, {peak/2**20:.0f} MB peak, {elapsed:.1f} s")
+        del data
+
+
+if __name__ == "__main__":
+    benchmark()
+    print("Done")
@@ -0,0 +1,215 @@
+"""
+Bulk relationship writer for sign models
+
+Richard Brice, PE
+WSDOT Bridge and Structures Office
+
+The builders call ifcopenshell.api.spatial.assign_container, ifcopenshell.api.aggregate.assign_object, etc.
+Each call searches the inverse relationships of every product and rewrites the related object lists, so calling them
+once per sign (or even once per sign type) gets slow as the model grows.
+
+RelationshipWriter collects containment, aggregation, type, and declares assignments while a model is being built
+and writes the minimum number of relationship entities in a single flush.
+- IfcRelContainedInSpatialStructure, one per spatial structure element
+- IfcRelAggregates, one per whole
+- IfcRelDefinesByType, one per type
+- IfcRelDeclares, one per context (project or project library)
+
+The result is the same as making the equivalent ifcopenshell.api calls in the same order
+1) the last assignment of an object wins (an object has one container or aggregate, one type, and one declaring context)
+2) an object is either contained in a spatial structure or is part of an aggregate, never both
+3) objects that are already related in the model are removed from their previous relationship, and existing
+   relationships of the relating object are extended rather than duplicated
+Object placements are not changed (ifcopenshell.api.aggregate.assign_object makes the placement relative to the new
+whole) and type representations are not mapped (same as assign_type with should_map_representations=False).
+
+Run this script directly to verify the equivalence with ifcopenshell.api and benchmark 100,000 signs.
+"""
+
+import ifcopenshell
+import ifcopenshell.guid
+import ifcopenshell.api.aggregate
+import ifcopenshell.api.project
+import ifcopenshell.api.spatial
+import ifcopenshell.api.type
+import time
+from collections import defaultdict
+
+
+CONTAINED = 0
+AGGREGATED = 1
+
+
+class RelationshipWriter:
+    def __init__(self,model):
+        self.model = model
+        self.spatial = {} # product -> (CONTAINED or AGGREGATED, relating structure or object)
+        self.types = {} # object -> type
+        self.declares = {} # definition -> context
+
+    def assign_container(self,relating_structure,products):
+        for product in products:
+            self.spatial[product] = (CONTAINED,relating_structure)
+
+    def assign_object(self,relating_object,products):
+        for product in products:
+            self.spatial[product] = (AGGREGATED,relating_object)
+
+    def assign_type(self,relating_type,related_objects):
+        for obj in related_objects:
+            self.types[obj] = relating_type
+
+    def assign_declaration(self,relating_context,definitions):
+        for definition in definitions:
+            self.declares[definition] = relating_context
+
+    def _write(self,rel_class,related_attribute,relating_attribute,assignments,reassigned):
+        # assignments - related object -> relating object, for the relationships to be written
+        # reassigned - all of the objects that are getting new relationships of this kind
+        existing = {}
+        if reassigned:
+            for rel in list(self.model.by_type(rel_class)):
+                related = getattr(rel,related_attribute)
+                keep = [obj for obj in related if obj not in reassigned]
+                if not keep:
+                    self.model.remove(rel)
+                    continue
+                if len(keep) != len(related):
+                    setattr(rel,related_attribute,keep)
+                existing.setdefault(getattr(rel,relating_attribute),rel)
+
+        groups = defaultdict(list)
+        for related, relating in assignments.items():
+            groups[relating].append(related)
+
+        for relating, related in groups.items():
+            rel = existing.get(relating)
+            if rel:
+                setattr(rel,related_attribute,list(getattr(rel,related_attribute)) + related)
+            else:
+                self.model.create_entity(rel_class,GlobalId=ifcopenshell.guid.new(),**{related_attribute:related,relating_attribute:relating})
+
+        return len(groups)
+
+    def flush(self):
+        count = 0
+        count += self._write("IfcRelDeclares","RelatedDefinitions","RelatingContext",self.declares,self.declares)
+        count += self._write("IfcRelDefinesByType","RelatedObjects","RelatingType",self.types,self.types)
+
+        # containment and aggregation are mutually exclusive so a product moving from one to the other is removed from both
+        contained = {product:relating for product, (kind,relating) in self.spatial.items() if kind == CONTAINED}
+        aggregated = {product:relating for product, (kind,relating) in self.spatial.items() if kind == AGGREGATED}
+        count += self._write("IfcRelContainedInSpatialStructure","RelatedElements","RelatingStructure",contained,self.spatial)
+        count += self._write("IfcRelAggregates","RelatedObjects","RelatingObject",aggregated,self.spatial)
+
+        self.spatial = {}
+        self.types = {}
+        self.declares = {}
+        return count
+
+
+def _relationship_summary(model):
+    # container/aggregate, type, and declaring context of every product and type, by name
+    summary = {}
+    for obj in model.by_type("IfcObjectDefinition"):
+        container = obj.ContainedInStructure[0].RelatingStructure.Name if getattr(obj,"ContainedInStructure",None) else None
+        whole = obj.Decomposes[0].RelatingObject.Name if obj.Decomposes else None
+        object_type = obj.IsTypedBy[0].RelatingType.Name if getattr(obj,"IsTypedBy",None) else None
+        context = obj.HasContext[0].RelatingContext.Name if obj.HasContext else None
+        summary[obj.Name] = (container,whole,object_type,context)
+    return summary
+
+
+def _start_model():
+    model = ifcopenshell.file(schema="IFC4X3")
+    project = model.createIfcProject(GlobalId=ifcopenshell.guid.new(),Name="Project")
+    site = model.createIfcSite(GlobalId=ifcopenshell.guid.new(),Name="Site")
+    model.createIfcRelAggregates(GlobalId=ifcopenshell.guid.new(),RelatingObject=project,RelatedObjects=[site])
+    return model, project, site
+
+
+def verify():
+    # apply the same sequence of assignments (including reassignments) with the api and with the writer and compare
+    summaries = []
+    for use_writer in (False,True):
+        model, project, site = _start_model()
+        site2 = model.createIfcSite(GlobalId=ifcopenshell.guid.new(),Name="Site 2")
+        types = [model.createIfcSignType(GlobalId=ifcopenshell.guid.new(),Name=f"Type {i}") for i in range(3)]
+        assemblies = [model.createIfcElementAssembly(GlobalId=ifcopenshell.guid.new(),Name=f"Assembly {i}") for i in range(3)]
+        signs = [model.createIfcSign(GlobalId=ifcopenshell.guid.new(),Name=f"Sign {i}") for i in range(12)]
+
+        # an existing relationship made before the writer is used
+        ifcopenshell.api.spatial.assign_container(model,relating_structure=site2,products=signs[:4])
+
+        steps = [
+            ("container",site,signs[2:8]),
+            ("container",site,assemblies),
+            ("aggregate",assemblies[0],signs[6:9]),
+            ("aggregate",assemblies[1],signs[8:10]),
+            ("container",site2,signs[9:12]),
+            ("type",types[0],signs[:6]),
+            ("type",types[1],signs[4:12]),
+            ("declare",project,types),
+        ]
+
+        writer = RelationshipWriter(model) if use_writer else None
+        for kind, relating, related in steps:
+            if writer:
+                {"container":writer.assign_container,"aggregate":writer.assign_object,"type":writer.assign_type,"declare":writer.assign_declaration}[kind](relating,related)
+            elif kind == "container":
+                ifcopenshell.api.spatial.assign_container(model,relating_structure=relating,products=related)
+            elif kind == "aggregate":
+                ifcopenshell.api.aggregate.assign_object(model,relating_object=relating,products=related)
+            elif kind == "type":
+                ifcopenshell.api.type.assign_type(model,related_objects=related,relating_type=relating,should_map_representations=False)
+            else:
+                ifcopenshell.api.project.assign_declaration(model,definitions=related,relating_context=relating)
+        if writer:
+            writer.flush()
+        summaries.append(_relationship_summary(model))
+
+    if summaries[0] != summaries[1]:
+        for name in summaries[0]:
+            if summaries[0][name] != summaries[1].get(name):
+                print(f"{name}: api {summaries[0][name]} writer {summaries[1].get(name)}")
+        raise RuntimeError("RelationshipWriter results differ from ifcopenshell.api")
+    print("RelationshipWriter results match ifcopenshell.api")
+
+
+def _benchmark_signs(sign_count,type_count,method):
+    model, project, site = _start_model()
+    types = [model.createIfcSignType(GlobalId=ifcopenshell.guid.new(),Name=f"Type {i}") for i in range(type_count)]
+    signs = [model.createIfcSign(GlobalId=ifcopenshell.guid.new(),Name=f"Sign {i}") for i in range(sign_count)]
+
+    start = time.perf_counter()
+    if method == "api per sign":
+        for i, sign in enumerate(signs):
+            ifcopenshell.api.spatial.assign_container(model,relating_structure=site,products=[sign])
+            ifcopenshell.api.type.assign_type(model,related_objects=[sign],relating_type=types[i % type_count],should_map_representations=False)
+        ifcopenshell.api.project.assign_declaration(model,definitions=types,relating_context=project)
+    elif method == "api per type":
+        for i, sign_type in enumerate(types):
+            group = signs[i::type_count]
+            model.createIfcRelDefinesByType(GlobalId=ifcopenshell.guid.new(),RelatedObjects=group,RelatingType=sign_type)
+            ifcopenshell.api.spatial.assign_container(model,relating_structure=site,products=group)
+        model.createIfcRelDeclares(GlobalId=ifcopenshell.guid.new(),RelatingContext=project,RelatedDefinitions=types)
+    else:
+        writer = RelationshipWriter(model)
+        for i, sign in enumerate(signs):
+            writer.assign_container(site,[sign])
+            writer.assign_type(types[i % type_count],[sign])
+        writer.assign_declaration(project,types)
+        writer.flush()
+    return time.perf_counter() - start
+
+
+def benchmark(sign_count=100000,type_count=1000,api_sign_count=2000):
+    for method, count in (("api per sign",api_sign_count),("api per type",sign_count),("writer",sign_count)):
+        elapsed = _benchmark_signs(count,min(type_count,count),method)
+        print(f"{method}: {count} signs, {elapsed:.2f} s, {1e6*elapsed/count:.1f} us per sign")
+
+
+if __name__ == "__main__":
+    verify()
+    benchmark()
+    print("Done")
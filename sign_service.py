@@ -0,0 +1,299 @@
+"""
+Sign build service
+
+Richard Brice, PE
+WSDOT Bridge and Structures Office
+
+Every Build_* script pays for importing Python and ifcopenshell and for parsing MUTCD_Sign_Library.ifc before it does any
+work. That is most of the time of a small build, such as a single intersection or a chevron run, and a pipeline runs
+hundreds of them a day.
+
+The service keeps worker processes running with the sign library (and its type dictionary and size cache), the WSDOT
+sign data dictionary, and the sign shape outline cache loaded. The workers load the library variant in the length unit of
+each kind of job (feet for corridor and linear jobs, inches for assemblies, see sign_library.py). Jobs are posted to a localhost HTTP server and the IFC
+model is returned in the response.
+
+python sign_service.py serve --port 8765 --workers 2
+
+POST /jobs/corridor - {"records":<Sign_Face.csv text>, "site":<site name>} builds signs like Build_Test_Corridor_Signs.py
+POST /jobs/assembly - {"locations":<All_Way_Stop_Locations.csv text>} builds assemblies like Build_All_Way_Stop_Model.py
+POST /jobs/linear - {"radius":..,"start":..,"spacing":..,"count":..,"offset":..,"elevation":..,"mutcd":..,"size":..} builds a
+                    run of signs along a curve like Build_signs_with_Linear_Placement.py
+GET /metrics - number of jobs, failures, and latency (mean, 50th and 95th percentile, max) for each kind of job
+
+The response headers X-Job-Latency and X-Build-Time are the time from receiving the job to finishing it and the time
+spent building in the worker. A failed job returns status 500 with the build log.
+
+python sign_service.py submit linear chevrons.json chevrons.ifc
+
+posts a job (the input file is the JSON spec, or the CSV file for corridor and assembly jobs) and writes the model.
+python sign_service.py benchmark compares the latency of jobs run by the service with running the build scripts.
+"""
+
+import argparse
+import concurrent.futures
+import contextlib
+import csv
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import defaultdict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from Build_Test_Corridor_Signs import build_signs
+from Build_All_Way_Stop_Model import build_model as build_assemblies
+from Build_signs_with_Linear_Placement import build_model as build_linear
+from bsdd_cache import BsddDictionary
+from sign_assemblies import read_assembly_locations
+from sign_library import SignLibrary, library_variant
+from sign_records import SignRecordStore
+
+
+JOB_KINDS = ["corridor","assembly","linear"]
+# length unit of the models built by each kind of job
+JOB_UNITS = {"corridor":"foot","assembly":"inch","linear":"foot"}
+LINEAR_PARAMETERS = ["radius","start","spacing","count","offset","elevation","mutcd","size"]
+
+
+# state of each worker process, set once by _init_worker
+_worker = {}
+
+
+def _init_worker(library_file,dictionary_file):
+    # one SignLibrary per library variant, the variants that aren't built fall back to library_file
+    libraries = {}
+    for unit in set(JOB_UNITS.values()):
+        variant = library_variant(unit,library_file)
+        if variant not in libraries:
+            libraries[variant] = SignLibrary(variant)
+        _worker[unit] = libraries[variant]
+    _worker["dictionary"] = BsddDictionary.load(dictionary_file)
+
+
+def _warm():
+    return os.getpid()
+
+
+def _run_job(kind,spec):
+    # runs in a worker process, returns the model (bytes, None if the build failed), build log, and build time
+    start = time.perf_counter()
+    log = io.StringIO()
+    data = None
+    succeeded = True
+    with tempfile.TemporaryDirectory() as folder, contextlib.redirect_stdout(log):
+        file_name = os.path.join(folder,"model.ifc")
+        try:
+            if kind == "corridor":
+                reader = csv.reader(io.StringIO(spec["records"]))
+                next(reader)
+                records = SignRecordStore.from_rows(reader)
+                # build_signs writes the signs modeled before an error, the partial model is not returned
+                summary = build_signs(records,file_name,_worker[JOB_UNITS[kind]],site_name=spec.get("site","Test Site"),dictionary=_worker["dictionary"])
+                succeeded = summary["error"] is None
+            elif kind == "assembly":
+                locations_file = os.path.join(folder,"locations.csv")
+                with open(locations_file,mode='w',newline='',encoding='utf-8') as f:
+                    f.write(spec["locations"])
+                build_assemblies(read_assembly_locations(locations_file),_worker[JOB_UNITS[kind]],file_name)
+            elif kind == "linear":
+                build_linear(library=_worker[JOB_UNITS[kind]],file_name=file_name,**{name:spec[name] for name in LINEAR_PARAMETERS if name in spec})
+        except Exception as e:
+            succeeded = False
+            print(f"An error occurred: {e}")
+        if succeeded and os.path.exists(file_name):
+            with open(file_name,mode='rb') as f:
+                data = f.read()
+    return {"ifc":data,"log":log.getvalue(),"build_time":time.perf_counter() - start}
+
+
+class JobMetrics:
+    # latency of the most recent jobs of each kind
+    def __init__(self,history=1000):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(lambda: deque(maxlen=history))
+        self.build_times = defaultdict(lambda: deque(maxlen=history))
+        self.counts = defaultdict(int)
+        self.failures = defaultdict(int)
+
+    def add(self,kind,latency,build_time,succeeded):
+        with self.lock:
+            self.counts[kind] += 1
+            if not succeeded:
+                self.failures[kind] += 1
+            self.latencies[kind].append(latency)
+            self.build_times[kind].append(build_time)
+
+    def summary(self):
+        with self.lock:
+            summary = {}
+            for kind, latencies in self.latencies.items():
+                values = sorted(latencies)
+                summary[kind] = {
+                    "jobs":self.counts[kind],
+                    "failures":self.failures[kind],
+                    "latency_mean":sum(values)/len(values),
+                    "latency_p50":values[len(values)//2],
+                    "latency_p95":values[min(int(0.95*len(values)),len(values) - 1)],
+                    "latency_max":values[-1],
+                    "build_time_mean":sum(self.build_times[kind])/len(self.build_times[kind]),
+                }
+            return summary
+
+
+class SignBuildService:
+    def __init__(self,library_file="MUTCD_Sign_Library.ifc",dictionary_file="Data Dictionary/wsdotsigns_0.5.json",workers=None):
+        workers = workers if workers else (os.cpu_count() or 1)
+        self.executor = concurrent.futures.ProcessPoolExecutor(max_workers=workers,initializer=_init_worker,initargs=(library_file,dictionary_file))
+        self.metrics = JobMetrics()
+        # start the workers so the first jobs don't wait for the library to load
+        concurrent.futures.wait([self.executor.submit(_warm) for i in range(workers)])
+
+    def run(self,kind,spec):
+        # returns (model bytes or None, build log, latency, build time)
+        if kind not in JOB_KINDS:
+            raise ValueError(f"{kind} is not a kind of job, use one of {JOB_KINDS}")
+        start = time.perf_counter()
+        try:
+            outcome = self.executor.submit(_run_job,kind,spec).result()
+        except Exception as e:
+            outcome = {"ifc":None,"log":f"An error occurred: {e}","build_time":0.}
+        latency = time.perf_counter() - start
+        self.metrics.add(kind,latency,outcome["build_time"],outcome["ifc"] is not None)
+        return outcome["ifc"], outcome["log"], latency, outcome["build_time"]
+
+    def shutdown(self):
+        self.executor.shutdown()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def _send(self,status,body,content_type="text/plain; charset=utf-8",headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type",content_type)
+        self.send_header("Content-Length",str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name,value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/metrics":
+            self._send(200,json.dumps(self.server.service.metrics.summary(),indent=1).encode("utf-8"),"application/json")
+        elif self.path == "/health":
+            self._send(200,b"ok")
+        else:
+            self._send(404,b"not found")
+
+    def do_POST(self):
+        kind = self.path[len("/jobs/"):] if self.path.startswith("/jobs/") else None
+        if kind not in JOB_KINDS:
+            self._send(404,f"use /jobs/<kind> with kind one of {JOB_KINDS}".encode("utf-8"))
+            return
+        try:
+            spec = json.loads(self.rfile.read(int(self.headers.get("Content-Length",0))) or b"{}")
+        except ValueError as e:
+            self._send(400,f"job spec is not valid JSON - {e}".encode("utf-8"))
+            return
+
+        data, log, latency, build_time = self.server.service.run(kind,spec)
+        headers = {"X-Job-Latency":f"{latency:.4f}","X-Build-Time":f"{build_time:.4f}"}
+        if data is None:
+            self._send(500,log.encode("utf-8"),headers=headers)
+        else:
+            self._send(200,data,"application/x-step",headers)
+
+    def log_message(self,format,*args):
+        print(f"{self.address_string()} {format % args}")
+
+
+def serve(port=8765,workers=None,library_file="MUTCD_Sign_Library.ifc"):
+    service = SignBuildService(library_file,workers=workers)
+    # only local connections are accepted
+    server = ThreadingHTTPServer(("127.0.0.1",port),_Handler)
+    server.service = service
+    print(f"Sign build service listening on http://127.0.0.1:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.shutdown()
+
+
+def job_spec(kind,input_file):
+    # the spec of a job from an input file - a JSON spec, or the CSV file of corridor and assembly jobs
+    if input_file.lower().endswith(".json"):
+        with open(input_file,mode='r',encoding='utf-8') as f:
+            return json.load(f)
+    with open(input_file,mode='r',encoding='utf-8') as f:
+        text = f.read()
+    return {"records":text} if kind == "corridor" else {"locations":text}
+
+
+def submit(kind,spec,output_file,url="http://127.0.0.1:8765"):
+    # returns the job latency reported by the service, or None if the job failed
+    request = urllib.request.Request(f"{url}/jobs/{kind}",data=json.dumps(spec).encode("utf-8"),headers={"Content-Type":"application/json"})
+    try:
+        with urllib.request.urlopen(request) as response:
+            with open(output_file,mode='wb') as f:
+                f.write(response.read())
+            return float(response.headers["X-Job-Latency"])
+    except urllib.error.HTTPError as e:
+        print(f"Job failed ({e.code}):\n{e.read().decode('utf-8')}")
+    except urllib.error.URLError as e:
+        print(f"Error: the sign build service is not running at {url} - {e.reason}")
+    return None
+
+
+def benchmark(jobs=20,workers=None):
+    # latency of small jobs run by the service compared to running the build scripts
+    scripts = {"assembly":"Build_All_Way_Stop_Model.py","linear":"Build_signs_with_Linear_Placement.py"}
+    specs = {"assembly":job_spec("assembly","All_Way_Stop_Locations.csv"),"linear":{"count":10}}
+
+    for kind, script in scripts.items():
+        start = time.perf_counter()
+        subprocess.run([sys.executable,script],check=True,capture_output=True)
+        print(f"{kind}: python {script} took {time.perf_counter() - start:.3f} s")
+
+    start = time.perf_counter()
+    service = SignBuildService(workers=workers)
+    print(f"Service started in {time.perf_counter() - start:.3f} s")
+    for kind, spec in specs.items():
+        for i in range(jobs):
+            service.run(kind,spec)
+    for kind, summary in service.metrics.summary().items():
+        print(f"{kind}: {summary['jobs']} jobs, {summary['failures']} failed, latency mean {summary['latency_mean']:.3f} s, p50 {summary['latency_p50']:.3f} s, p95 {summary['latency_p95']:.3f} s")
+    service.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sign build service")
+    commands = parser.add_subparsers(dest="command",required=True)
+    serve_parser = commands.add_parser("serve",help="run the service")
+    serve_parser.add_argument("--port",type=int,default=8765)
+    serve_parser.add_argument("--workers",type=int,default=None,help="worker processes (default is the number of CPUs)")
+    serve_parser.add_argument("--library",default="MUTCD_Sign_Library.ifc")
+    submit_parser = commands.add_parser("submit",help="post a job to the service and write the model")
+    submit_parser.add_argument("kind",choices=JOB_KINDS)
+    submit_parser.add_argument("input",help="JSON job spec, or the CSV file of a corridor or assembly job")
+    submit_parser.add_argument("output",help="IFC file")
+    submit_parser.add_argument("--url",default="http://127.0.0.1:8765")
+    benchmark_parser = commands.add_parser("benchmark",help="compare the service with running the build scripts")
+    benchmark_parser.add_argument("--jobs",type=int,default=20)
+    benchmark_parser.add_argument("--workers",type=int,default=None)
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        serve(args.port,args.workers,args.library)
+    elif args.command == "submit":
+        latency = submit(args.kind,job_spec(args.kind,args.input),args.output,args.url)
+        if latency is not None:
+            print(f"{args.output} built in {latency:.3f} s")
+    else:
+        benchmark(args.jobs,args.workers)
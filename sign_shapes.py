@@ -0,0 +1,396 @@
+"""
+Sign face profiles
+
+Richard Brice, PE
+WSDOT Bridge and Structures Office
+
+Build_Sign_Library.py and Build_Test_Corridor_Signs.py each had a copy of generate_polygon/create_sign_representation
+which could only make regular polygons. This module is the shared replacement.
+
+Shape codes (the codes of MUTCD_Sign_Definitions.csv plus a few more)
+O - octagon
+R - rectangle, optionally with rounded corners (fillet is the corner radius as a fraction of the smaller dimension)
+D - diamond
+T - triangle pointing down (yield)
+P - pennant pointing right (no passing zone)
+C - circle (ellipse if the width and height are different)
+X - crossbuck (blade is the blade width as a fraction of the blade length)
+S - shield, flat top with rounded corners and a pointed bottom
+
+The width and height of a profile are the size of its bounding box and the profile is centered on its bounding box.
+Straight edges are IfcLineIndex segments and curved edges are IfcArcIndex segments (three points on the arc) of an
+IfcIndexedPolyCurve, so rounded shapes are exact rather than faceted.
+
+A sign panel also has two lower levels of detail, each in its own representation subcontext (see sign_lod.py)
+Box - an IfcBoundingBox of the panel
+Body-Fallback - an IfcTriangulatedFaceSet of the panel. The outline is the profile with each arc replaced by the two
+                chords through its mid point, and the caps are triangulated by ear clipping
+
+Outlines are computed once for each shape, aspect ratio, and parameters with a width of 1 and cached. A profile of
+any size is the cached outline scaled uniformly, so arcs stay circular. SignShapes creates the IfcIndexedPolyCurve of
+each distinct profile once per model and shares it among all the profiles and sign types that have that shape and size.
+
+shape_for_mutcd() guesses the shape of signs that aren't in the sign library from their MUTCD code.
+"""
+
+import functools
+import math
+
+
+CROSSBUCK_BLADE = 9./48. # MUTCD R15-1 blades are 48 x 9 inches
+GUIDE_SIGN_FILLET = 1./16.
+
+# how a MUTCD size is converted to the bounding box of the sign panel, see bounding_size()
+SIZE_RULES = {
+    "O":"width x height across the flats",
+    "R":"width x height",
+    "D":"length of the sides, the bounding box is sqrt(2) times larger",
+    "T":"length of the sides of an equilateral triangle",
+    "P":"length of the long sides x length of the long sides x base",
+    "C":"diameter",
+    "X":"blade length x blade width, blades crossed at 90 degrees",
+    "S":"width x height",
+}
+
+# shape of signs by MUTCD code for the signs that aren't rectangles
+MUTCD_SHAPES = {
+    "R1-1":("O",{}),
+    "R1-2":("T",{}),
+    "R15-1":("X",{}),
+    "W10-1":("C",{}),
+    "W14-3":("P",{}),
+    "M1-1":("S",{}),
+    "M1-2":("S",{}),
+    "M1-4":("S",{}),
+}
+
+
+class _Outline:
+    # points and 1-based segment indices of a closed IfcIndexedPolyCurve
+    def __init__(self,start):
+        self.points = [start]
+        self.segments = []
+
+    def line_to(self,point):
+        self.points.append(point)
+        self.segments.append(("line",(len(self.points) - 1,len(self.points))))
+
+    def arc_to(self,mid,end):
+        self.points.extend((mid,end))
+        self.segments.append(("arc",(len(self.points) - 2,len(self.points) - 1,len(self.points))))
+
+    def close(self):
+        # the outline ends at the first point, so the last segment is changed to end at index 1
+        if len(self.points) > 1 and math.dist(self.points[-1],self.points[0]) < 1e-9:
+            self.points.pop()
+            kind, indices = self.segments[-1]
+            self.segments[-1] = (kind,indices[:-1] + (1,))
+        else:
+            self.segments.append(("line",(len(self.points),1)))
+
+    def result(self):
+        return tuple(self.points), tuple(self.segments)
+
+
+def _arc_mid(center,radius,start_angle,end_angle):
+    angle = 0.5*(start_angle + end_angle)
+    return (center[0] + radius*math.cos(angle),center[1] + radius*math.sin(angle))
+
+
+def _polygon(points):
+    outline = _Outline(points[0])
+    for point in points[1:]:
+        outline.line_to(point)
+    outline.close()
+    return outline.result()
+
+
+def _fit(points,aspect):
+    # scale and center points on a 1 x aspect bounding box
+    xs = [p[0] for p in points]
+    ys = [p[1] for p in points]
+    cx = 0.5*(min(xs) + max(xs))
+    cy = 0.5*(min(ys) + max(ys))
+    sx = 1./(max(xs) - min(xs))
+    sy = aspect/(max(ys) - min(ys))
+    return [((x - cx)*sx,(y - cy)*sy) for x, y in points]
+
+
+def _regular_polygon(sides,start_angle,aspect):
+    angle_step = 2*math.pi/sides
+    return _polygon(_fit([(math.cos(start_angle + i*angle_step),math.sin(start_angle + i*angle_step)) for i in range(sides)],aspect))
+
+
+def _rounded_rectangle(aspect,fillet):
+    w = 0.5
+    h = 0.5*aspect
+    r = fillet*min(1.,aspect)
+    # corner centers and the angle from the center to the start of the fillet, counterclockwise from the bottom right
+    corners = [((w - r,-h + r),-0.5*math.pi),((w - r,h - r),0.),((-w + r,h - r),0.5*math.pi),((-w + r,-h + r),math.pi)]
+    outline = _Outline((-w + r,-h))
+    for center, angle in corners:
+        start = (center[0] + r*math.cos(angle),center[1] + r*math.sin(angle))
+        end_angle = angle + 0.5*math.pi
+        end = (center[0] + r*math.cos(end_angle),center[1] + r*math.sin(end_angle))
+        outline.line_to(start)
+        outline.arc_to(_arc_mid(center,r,angle,end_angle),end)
+    outline.close()
+    return outline.result()
+
+
+def _ellipse(aspect):
+    # four three-point arcs through the ends of the axes and the points at 45 degrees (exact for a circle)
+    a = 0.5
+    b = 0.5*aspect
+    outline = _Outline((a,0.))
+    for quadrant in range(4):
+        mid_angle = (quadrant + 0.5)*0.5*math.pi
+        end_angle = (quadrant + 1)*0.5*math.pi
+        outline.arc_to((a*math.cos(mid_angle),b*math.sin(mid_angle)),(a*math.cos(end_angle),b*math.sin(end_angle)))
+    outline.close()
+    return outline.result()
+
+
+def _crossbuck(aspect,blade):
+    # two crossed blades at 90 degrees, the outline of a plus sign rotated 45 degrees
+    l = 0.5
+    b = 0.5*blade
+    plus = [(l,b),(b,b),(b,l),(-b,l),(-b,b),(-l,b),(-l,-b),(-b,-b),(-b,-l),(b,-l),(b,-b),(l,-b)]
+    c = math.cos(math.pi/4)
+    return _polygon(_fit([(c*(x - y),c*(x + y)) for x, y in plus],aspect))
+
+
+def _shield(aspect,fillet):
+    # vertical sides for the top 55% of the height, then arcs tangent to the sides that meet at the bottom point
+    w = 0.5
+    h = 0.5*aspect
+    r = fillet*min(1.,aspect)
+    side_bottom = h - 0.55*aspect
+    depth = side_bottom + h # height of the pointed part
+    radius = (w*w + depth*depth)/(2.*w)
+    outline = _Outline((0.,-h))
+    # right bottom arc from the point to the side, center at (w - radius, side_bottom)
+    center = (w - radius,side_bottom)
+    start_angle = math.atan2(-h - center[1],0. - center[0])
+    outline.arc_to(_arc_mid(center,radius,start_angle,0.),(w,side_bottom))
+    outline.line_to((w,h - r))
+    if r > 0.:
+        outline.arc_to(_arc_mid((w - r,h - r),r,0.,0.5*math.pi),(w - r,h))
+    outline.line_to((-w + r,h))
+    if r > 0.:
+        outline.arc_to(_arc_mid((-w + r,h - r),r,0.5*math.pi,math.pi),(-w,h - r))
+    outline.line_to((-w,side_bottom))
+    # left bottom arc from the side to the point, center at (-w + radius, side_bottom)
+    center = (-w + radius,side_bottom)
+    end_angle = math.atan2(-h - center[1],0. - center[0]) % (2.*math.pi)
+    outline.arc_to(_arc_mid(center,radius,math.pi,end_angle),(0.,-h))
+    outline.close()
+    return outline.result()
+
+
+@functools.lru_cache(maxsize=None)
+def unit_outline(shape,aspect,fillet=0.,blade=CROSSBUCK_BLADE):
+    # (points, segments) of a profile with a width of 1 and a height of aspect
+    # segments are ("line",(i,j)) or ("arc",(i,j,k)) with 1-based point indices
+    if shape == "O":
+        return _regular_polygon(8,math.pi/8,aspect)
+    if shape == "R":
+        if fillet > 0.:
+            return _rounded_rectangle(aspect,fillet)
+        return _regular_polygon(4,math.pi/4,aspect)
+    if shape == "D":
+        return _regular_polygon(4,0.,aspect)
+    if shape == "T":
+        return _regular_polygon(3,math.pi/6,aspect)
+    if shape == "P":
+        return _regular_polygon(3,0.,aspect)
+    if shape == "C":
+        return _ellipse(aspect)
+    if shape == "X":
+        return _crossbuck(aspect,blade)
+    if shape == "S":
+        return _shield(aspect,fillet if fillet > 0. else 0.1)
+    raise ValueError(f"Unknown sign shape {shape}")
+
+
+def _check_size(width,height):
+    # NaN fails the comparison too
+    if not (width > 0. and height > 0.):
+        raise ValueError(f"sign size {width} x {height} is not positive")
+
+
+def outline(shape,width,height,fillet=0.,blade=CROSSBUCK_BLADE):
+    # (points, segments) of a profile with a width x height bounding box
+    # the aspect ratio is rounded so nearly identical sizes share an outline. y is scaled by height/aspect rather
+    # than width so the bounding box is exact (the difference from a uniform scale is less than 1e-6)
+    _check_size(width,height)
+    aspect = round(height/width,6)
+    points, segments = unit_outline(shape,aspect,fillet,blade)
+    sy = height/aspect
+    return [(width*x,sy*y) for x, y in points], segments
+
+
+def _ear_clip(points):
+    # 0-based triangles of a simple counterclockwise polygon
+    remaining = list(range(len(points)))
+    triangles = []
+    while len(remaining) > 3:
+        count = len(remaining)
+        for k in range(count):
+            i, j, l = remaining[k - 1], remaining[k], remaining[(k + 1) % count]
+            a, b, c = points[i], points[j], points[l]
+            cross = (b[0] - a[0])*(c[1] - a[1]) - (b[1] - a[1])*(c[0] - a[0])
+            if abs(cross) < 1e-12:
+                # collinear, the vertex is dropped without a triangle
+                remaining.pop(k)
+                break
+            if cross < 0.:
+                continue
+            # an ear doesn't have any other vertex inside it
+            inside = False
+            for m in remaining:
+                if m in (i,j,l):
+                    continue
+                p = points[m]
+                if ((b[0] - a[0])*(p[1] - a[1]) - (b[1] - a[1])*(p[0] - a[0]) >= 0. and
+                    (c[0] - b[0])*(p[1] - b[1]) - (c[1] - b[1])*(p[0] - b[0]) >= 0. and
+                    (a[0] - c[0])*(p[1] - c[1]) - (a[1] - c[1])*(p[0] - c[0]) >= 0.):
+                    inside = True
+                    break
+            if not inside:
+                triangles.append((i,j,l))
+                remaining.pop(k)
+                break
+        else:
+            raise ValueError("the outline is not a simple polygon")
+    triangles.append(tuple(remaining))
+    return triangles
+
+
+@functools.lru_cache(maxsize=None)
+def unit_prism(shape,aspect,fillet=0.,blade=CROSSBUCK_BLADE):
+    # (points, triangles) of a closed prism of depth 1 over the outline with a width of 1 and a height of aspect
+    # the arcs of the outline are replaced by the chords through their mid points. triangles have 1-based indices to
+    # the bottom points (z = 0) followed by the top points (z = 1) and face outward
+    points = list(unit_outline(shape,aspect,fillet,blade)[0])
+    area = sum(points[i - 1][0]*points[i][1] - points[i][0]*points[i - 1][1] for i in range(len(points)))
+    if area < 0.:
+        points.reverse()
+    count = len(points)
+    triangles = []
+    for i, j, k in _ear_clip(points):
+        triangles.append((k + 1,j + 1,i + 1))
+        triangles.append((i + 1 + count,j + 1 + count,k + 1 + count))
+    for i in range(count):
+        j = (i + 1) % count
+        triangles.append((i + 1,j + 1,j + 1 + count))
+        triangles.append((i + 1,j + 1 + count,i + 1 + count))
+    return tuple(points), tuple(triangles)
+
+
+def prism(shape,width,height,depth,fillet=0.,blade=CROSSBUCK_BLADE):
+    # (points, triangles) of the low level of detail sign panel, a width x height bounding box extruded depth along +Z
+    _check_size(width,height)
+    aspect = round(height/width,6)
+    points, triangles = unit_prism(shape,aspect,fillet,blade)
+    sy = height/aspect
+    return [(width*x,sy*y,z) for z in (0.,depth) for x, y in points], triangles
+
+
+def bounding_size(shape,dimensions):
+    # width and height of the bounding box of a sign from its MUTCD size, e.g. [36,36] for "36 x 36"
+    # diamond sizes are the length of a side, triangle sizes are the sides of an equilateral triangle, and pennant
+    # sizes are the two long sides and the base
+    w = dimensions[0]
+    h = dimensions[1] if len(dimensions) > 1 else w
+    if shape == "O" or shape == "C":
+        return (w,w)
+    if shape == "D":
+        return (w*math.sqrt(2.),h*math.sqrt(2.))
+    if shape == "T":
+        return (w,w*math.sqrt(3.)/2.)
+    if shape == "P":
+        base = dimensions[-1]
+        return (math.sqrt(w*w - 0.25*base*base),base)
+    if shape == "X":
+        extent = (w + h)/math.sqrt(2.)
+        return (extent,extent)
+    return (w,h)
+
+
+def shape_for_mutcd(mutcd):
+    # (shape code, parameters) for a MUTCD code
+    if mutcd in MUTCD_SHAPES:
+        return MUTCD_SHAPES[mutcd]
+    if mutcd.startswith("W") and not mutcd.endswith("P") and not mutcd.startswith(("W1-6","W1-7","W1-8")):
+        return ("D",{})
+    if mutcd.startswith(("D","I","M")):
+        # guide signs have rounded corners
+        return ("R",{"fillet":GUIDE_SIGN_FILLET})
+    return ("R",{})
+
+
+class SignShapes:
+    def __init__(self,model,depth=1.):
+        self.model = model
+        self.depth = depth
+        self.curves = {}
+        self.face_sets = {}
+        self.boxes = {}
+        self.extrusion_direction = None
+
+    def curve(self,shape,width,height,fillet=0.,blade=CROSSBUCK_BLADE):
+        # IfcIndexedPolyCurve shared by every profile of this shape and size
+        key = (shape,width,height,fillet,blade)
+        curve = self.curves.get(key)
+        if curve is None:
+            points, segments = outline(shape,width,height,fillet,blade)
+            point_list = self.model.createIfcCartesianPointList2D(CoordList=points)
+            segments = [self.model.createIfcLineIndex(indices) if kind == "line" else self.model.createIfcArcIndex(indices) for kind, indices in segments]
+            curve = self.model.createIfcIndexedPolyCurve(Points=point_list,Segments=segments)
+            self.curves[key] = curve
+        return curve
+
+    def profile(self,name,shape,width,height,fillet=0.,blade=CROSSBUCK_BLADE):
+        return self.model.createIfcArbitraryClosedProfileDef(ProfileName=name,ProfileType="AREA",OuterCurve=self.curve(shape,width,height,fillet,blade))
+
+    def representation(self,name,context,shape,width,height,fillet=0.,blade=CROSSBUCK_BLADE):
+        # swept solid representation of a sign panel, extruded depth along +Z
+        if self.extrusion_direction is None:
+            self.extrusion_direction = self.model.createIfcDirection((0.,0.,1.))
+        profile = self.profile(name,shape,width,height,fillet,blade)
+        solid = self.model.createIfcExtrudedAreaSolid(SweptArea=profile,ExtrudedDirection=self.extrusion_direction,Depth=self.depth)
+        return self.model.createIfcShapeRepresentation(ContextOfItems=context,RepresentationIdentifier="Body",RepresentationType="SweptSolid",Items=[solid])
+
+    def tessellation(self,context,shape,width,height,fillet=0.,blade=CROSSBUCK_BLADE):
+        # low level of detail representation of a sign panel, IfcTriangulatedFaceSet shared by every panel of this shape and size
+        key = (shape,width,height,fillet,blade)
+        face_set = self.face_sets.get(key)
+        if face_set is None:
+            points, triangles = prism(shape,width,height,self.depth,fillet,blade)
+            face_set = self.model.createIfcTriangulatedFaceSet(Coordinates=self.model.createIfcCartesianPointList3D(CoordList=points),Closed=True,CoordIndex=triangles)
+            self.face_sets[key] = face_set
+        return self.model.createIfcShapeRepresentation(ContextOfItems=context,RepresentationIdentifier="Body-Fallback",RepresentationType="Tessellation",Items=[face_set])
+
+    def box(self,context,width,height):
+        # bounding box representation of a sign panel
+        _check_size(width,height)
+        key = (width,height)
+        box = self.boxes.get(key)
+        if box is None:
+            corner = self.model.createIfcCartesianPoint((-0.5*width,-0.5*height,0.))
+            box = self.model.createIfcBoundingBox(Corner=corner,XDim=width,YDim=height,ZDim=self.depth)
+            self.boxes[key] = box
+        return self.model.createIfcShapeRepresentation(ContextOfItems=context,RepresentationIdentifier="Box",RepresentationType="BoundingBox",Items=[box])
+
+    def representations(self,name,contexts,shape,width,height,fillet=0.,blade=CROSSBUCK_BLADE):
+        # representations of a sign panel for each level of detail, contexts is {context identifier:context}
+        representations = []
+        for identifier, context in contexts.items():
+            if identifier == "Body":
+                representations.append(self.representation(name,context,shape,width,height,fillet,blade))
+            elif identifier == "Box":
+                representations.append(self.box(context,width,height))
+            elif identifier == "Body-Fallback":
+                representations.append(self.tessellation(context,shape,width,height,fillet,blade))
+        return representations
@@ -0,0 +1,302 @@
+"""
+Annual solar exposure of sign faces
+
+Richard Brice, PE
+WSDOT Bridge and Structures Office
+
+The "better informed sign maintenance" use case in ReadMe.md suggests predicting the degradation of sign faces from
+UV exposure based on the sign's location and orientation. This script estimates the annual clear sky solar exposure
+on the face of every sign in an inventory.
+
+1) Latitude and longitude - the state plane coordinates of the signs (Sign_Face.csv, or the map coordinates of an IFC
+   sign model) are converted to latitude and longitude. Build_Geolocated_Sign.py georeferences the signs with
+   EPSG:2927 (NAD83(HARN) Washington South, US survey feet). The inverse Lambert Conformal Conic projection for the
+   Washington zones is built in. pyproj is used for other coordinate systems, if it is installed.
+2) Location clusters - signs are grouped into cells of cluster_size degrees. The sun position is practically the same
+   for every sign in a cell, so it is computed once per cell at the cell center.
+3) Sun position - the solar declination and equation of time (NOAA general solar position equations) are computed
+   once for the timesteps of the year. The hour angle, sun direction (east, north, up), and clear sky irradiance are
+   computed for each cluster and only the daylight timesteps are kept.
+4) Exposure - the sun direction of each timestep is scaled by the direct normal irradiance, so the direct irradiance
+   on every face for every timestep is one matrix product of the face normals (signs x 3) and the weighted sun
+   directions (3 x timesteps). Negative values (sun behind the face) are clipped to zero and the rows are summed.
+   Sky diffuse irradiance is added with the isotropic sky view factor of the face.
+
+The sign face normal is the placement Axis of Build_Test_Corridor_Signs.py, (sin(Orientation), -cos(Orientation), 0).
+
+The exposure is a clear sky estimate in kWh/m^2 per year. Cloud cover and shading by terrain and vegetation are not
+considered (see sign_visibility.py for obstructions). SunHours is the number of hours the sun is in front of the face.
+
+Usage:
+python sign_solar.py [--signs Sign_Face.csv] [--year 2025] [--step 60] [--report sign_solar_exposure.csv]
+python sign_solar.py --signs Test_Corridor_Signs.ifc --output Test_Corridor_Signs_Solar.ifc
+
+Run this script with --benchmark to time the exposure calculation for 1,000,000 signs.
+"""
+
+import argparse
+import csv
+import datetime
+import math
+import numpy as np
+import time
+from sign_records import SignRecordStore
+
+
+US_SURVEY_FOOT = 1200./3937.
+
+# Lambert Conformal Conic 2SP parameters (standard parallel 1, standard parallel 2, latitude of origin, central
+# meridian, false easting (m), false northing (m)) of the NAD83(HARN) Washington zones in US survey feet
+PROJECTIONS = {
+    "EPSG:2926":(48.+44./60.,47.+30./60.,47.,-(120.+50./60.),500000.0001016001,0.),
+    "EPSG:2927":(47.+20./60.,45.+50./60.,45.+20./60.,-120.5,500000.0001016001,0.),
+}
+
+SOLAR_CONSTANT = 1353. # W/m^2
+
+PSET_NAME = "SignSolarExposure"
+
+
+class LambertConformalConic:
+    # inverse projection on the GRS 1980 ellipsoid (Snyder, Map Projections - A Working Manual, equations 15-1 to 15-11)
+    def __init__(self,lat_1,lat_2,lat_0,lon_0,false_easting,false_northing,unit=US_SURVEY_FOOT):
+        self.a = 6378137.
+        f = 1./298.257222101
+        self.e = math.sqrt(f*(2. - f))
+        self.lon_0 = math.radians(lon_0)
+        self.false_easting = false_easting
+        self.false_northing = false_northing
+        self.unit = unit
+        phi_1, phi_2, phi_0 = (math.radians(v) for v in (lat_1,lat_2,lat_0))
+        m_1 = self._m(phi_1)
+        m_2 = self._m(phi_2)
+        t_1 = self._t(phi_1)
+        t_2 = self._t(phi_2)
+        self.n = (math.log(m_1) - math.log(m_2))/(math.log(t_1) - math.log(t_2))
+        self.F = m_1/(self.n*t_1**self.n)
+        self.rho_0 = self.a*self.F*self._t(phi_0)**self.n
+
+    def _m(self,phi):
+        return math.cos(phi)/math.sqrt(1. - (self.e*math.sin(phi))**2)
+
+    def _t(self,phi):
+        e_sin = self.e*math.sin(phi)
+        return math.tan(math.pi/4. - phi/2.)/((1. - e_sin)/(1. + e_sin))**(self.e/2.)
+
+    def to_geographic(self,easting,northing,iterations=5):
+        # latitude and longitude (degrees) of map coordinates
+        x = np.asarray(easting,dtype=np.float64)*self.unit - self.false_easting
+        y = self.rho_0 - (np.asarray(northing,dtype=np.float64)*self.unit - self.false_northing)
+        rho = np.sign(self.n)*np.hypot(x,y)
+        theta = np.arctan2(np.sign(self.n)*x,np.sign(self.n)*y)
+        t = (rho/(self.a*self.F))**(1./self.n)
+        phi = np.pi/2. - 2.*np.arctan(t)
+        for i in range(iterations):
+            e_sin = self.e*np.sin(phi)
+            phi = np.pi/2. - 2.*np.arctan(t*((1. - e_sin)/(1. + e_sin))**(self.e/2.))
+        return np.degrees(phi), np.degrees(theta/self.n + self.lon_0)
+
+
+def to_geographic(easting,northing,crs="EPSG:2927"):
+    if crs in PROJECTIONS:
+        return LambertConformalConic(*PROJECTIONS[crs]).to_geographic(easting,northing)
+    try:
+        import pyproj
+    except ImportError:
+        print(f"{crs} is not built in and pyproj is not installed, latitude and longitude can't be computed")
+        return None
+    transformer = pyproj.Transformer.from_crs(crs,"EPSG:4326",always_xy=True)
+    lon, lat = transformer.transform(np.asarray(easting),np.asarray(northing))
+    return np.asarray(lat), np.asarray(lon)
+
+
+def face_normals(orientation):
+    # unit normals of sign faces from Sign_Face.csv Orientation (degrees), see Build_Test_Corridor_Signs.py
+    theta = np.radians(np.asarray(orientation,dtype=np.float64))
+    return np.column_stack((np.sin(theta),-np.cos(theta),np.zeros(len(theta))))
+
+
+class SolarYear:
+    # timesteps of a year (UTC) and the parts of the sun position that don't depend on location
+    def __init__(self,year=2025,step_minutes=60.):
+        start = datetime.datetime(year,1,1)
+        days = (datetime.datetime(year + 1,1,1) - start).days
+        minutes = np.arange(0.,days*24.*60.,step_minutes) + step_minutes/2. # middle of each timestep
+        self.step_hours = step_minutes/60.
+        self.minute_of_day = minutes % 1440.
+        day = minutes//1440.
+        gamma = 2.*np.pi/days*(day + (self.minute_of_day/60. - 12.)/24.)
+        # NOAA general solar position equations
+        self.equation_of_time = 229.18*(0.000075 + 0.001868*np.cos(gamma) - 0.032077*np.sin(gamma) - 0.014615*np.cos(2.*gamma) - 0.040849*np.sin(2.*gamma))
+        self.declination = (0.006918 - 0.399912*np.cos(gamma) + 0.070257*np.sin(gamma) - 0.006758*np.cos(2.*gamma) + 0.000907*np.sin(2.*gamma)
+                            - 0.002697*np.cos(3.*gamma) + 0.00148*np.sin(3.*gamma))
+        self.sin_declination = np.sin(self.declination)
+        self.cos_declination = np.cos(self.declination)
+        # hour angle at longitude 0. the hour angle at a longitude is this angle plus the longitude, so the sine and
+        # cosine at a location are found with the angle sum identities instead of evaluating them for every timestep
+        hour_angle = np.radians((self.minute_of_day + self.equation_of_time)/4. - 180.)
+        self.sin_hour_angle = np.sin(hour_angle)
+        self.cos_hour_angle = np.cos(hour_angle)
+        # sun-earth distance correction of the extraterrestrial irradiance
+        self.extraterrestrial = SOLAR_CONSTANT*(1.00011 + 0.034221*np.cos(gamma) + 0.00128*np.sin(gamma) + 0.000719*np.cos(2.*gamma) + 0.000077*np.sin(2.*gamma))
+        # clear sky transmittance (Meinel) with the Kasten and Young air mass, tabulated by the sine of the sun elevation
+        self.table_up = np.linspace(0.,1.,2001)
+        zenith = np.degrees(np.arccos(self.table_up))
+        air_mass = 1./(self.table_up + 0.50572*(96.07995 - zenith)**-1.6364)
+        self.table_transmittance = 0.7**(air_mass**0.678)
+
+    def sun(self,latitude,longitude):
+        # direction to the sun (east, north, up) weighted by the clear sky direct normal irradiance (W/m^2),
+        # and the diffuse horizontal irradiance, for the daylight timesteps at a location
+        lat = math.radians(latitude)
+        lon = math.radians(longitude)
+        cos_hour_angle = self.cos_hour_angle*math.cos(lon) - self.sin_hour_angle*math.sin(lon)
+        up = math.sin(lat)*self.sin_declination + math.cos(lat)*self.cos_declination*cos_hour_angle
+        day = up > 0.
+        up = up[day]
+        cos_hour_angle = cos_hour_angle[day]
+        sin_hour_angle = self.sin_hour_angle[day]*math.cos(lon) + self.cos_hour_angle[day]*math.sin(lon)
+        east = -self.cos_declination[day]*sin_hour_angle
+        north = math.cos(lat)*self.sin_declination[day] - math.sin(lat)*self.cos_declination[day]*cos_hour_angle
+        # linear interpolation in the uniformly spaced table
+        position = up*(len(self.table_up) - 1)
+        index = np.minimum(position.astype(np.int64),len(self.table_up) - 2)
+        fraction = position - index
+        transmittance = self.table_transmittance[index]*(1. - fraction) + self.table_transmittance[index + 1]*fraction
+        direct = self.extraterrestrial[day]*transmittance
+        # diffuse horizontal irradiance taken as 10% of the direct normal irradiance
+        diffuse = 0.1*direct
+        return np.stack((east*direct,north*direct,up*direct)), diffuse
+
+
+def location_clusters(latitude,longitude,cluster_size=0.05):
+    # cluster index of each sign and the (latitude, longitude) center of each cluster
+    cells = np.column_stack((np.floor(latitude/cluster_size),np.floor(longitude/cluster_size))).astype(np.int64)
+    keys, inverse = np.unique(cells,axis=0,return_inverse=True)
+    return inverse.ravel(), (keys + 0.5)*cluster_size
+
+
+def annual_exposure(latitude,longitude,normals,year=2025,step_minutes=60.,cluster_size=0.05,max_elements=1 << 22):
+    # annual solar exposure (kWh/m^2) and sun hours of each sign face
+    # max_elements limits the size of the signs x timesteps arrays
+    normals = np.asarray(normals,dtype=np.float64)
+    solar_year = SolarYear(year,step_minutes)
+    exposure = np.full(len(normals),np.nan)
+    sun_hours = np.full(len(normals),np.nan)
+    valid = np.isfinite(latitude) & np.isfinite(longitude) & np.isfinite(normals).all(axis=1)
+    valid_indices = np.flatnonzero(valid)
+    clusters, centers = location_clusters(np.asarray(latitude)[valid],np.asarray(longitude)[valid],cluster_size)
+    order = np.argsort(clusters,kind="stable")
+    bounds = np.searchsorted(clusters[order],np.arange(len(centers) + 1))
+    for cluster, (lat, lon) in enumerate(centers):
+        indices = valid_indices[order[bounds[cluster]:bounds[cluster + 1]]]
+        sun, diffuse = solar_year.sun(lat,lon)
+        sun = sun.astype(np.float32)
+        # isotropic sky diffuse irradiance on a face is the diffuse horizontal irradiance times the view factor (1 + nz)/2
+        diffuse_total = diffuse.sum()
+        chunk_size = max(1,max_elements//max(1,sun.shape[1]))
+        for first in range(0,len(indices),chunk_size):
+            chunk = indices[first:first + chunk_size]
+            direct = normals[chunk].astype(np.float32) @ sun # (signs, timesteps) direct irradiance on the faces
+            np.maximum(direct,0.,out=direct)
+            exposure[chunk] = (direct.sum(axis=1,dtype=np.float64) + diffuse_total*(1. + normals[chunk,2])/2.)*solar_year.step_hours/1000.
+            sun_hours[chunk] = np.count_nonzero(direct,axis=1)*solar_year.step_hours
+    return exposure, sun_hours
+
+
+def records_exposure(store,crs="EPSG:2927",**kwargs):
+    # latitude, longitude, exposure, and sun hours of the signs in a SignRecordStore (Sign_Face.csv)
+    latitude, longitude = to_geographic(store.x,store.y,crs)
+    exposure, sun_hours = annual_exposure(latitude,longitude,face_normals(store.orientation),**kwargs)
+    return latitude, longitude, exposure, sun_hours
+
+
+def write_report(store,latitude,longitude,exposure,sun_hours,file_path):
+    mutcd = store.mutcd.values
+    with open(file_path,mode='w',newline='',encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(["OBJECTID","MUTCD","Orientation","Latitude","Longitude","AnnualExposure","SunHours"])
+        for row in zip(store.object_id.tolist(),(mutcd[code] for code in store.mutcd.codes),store.orientation.tolist(),latitude.tolist(),longitude.tolist(),exposure.tolist(),sun_hours.tolist()):
+            writer.writerow(row)
+
+
+def model_crs(model):
+    crs = model.by_type("IfcProjectedCRS")
+    return crs[0].Name if crs and crs[0].Name else "EPSG:2927"
+
+
+def add_exposure_psets(model,output_file,**kwargs):
+    # adds SignSolarExposure property sets to the signs of an IFC model
+    import ifcopenshell.util.unit
+    from sign_export import SignExporter
+    from sign_properties import PropertyWriter
+    exporter = SignExporter(model)
+    global_ids = []
+    map_xy = []
+    normals = []
+    for batch in exporter.batches():
+        global_ids.extend(batch["GlobalId"])
+        map_xy.append(np.column_stack((batch["Easting"],batch["Northing"])))
+        normals.append(np.column_stack((batch["NormalX"],batch["NormalY"],batch["NormalZ"])))
+    if not global_ids:
+        print("The model doesn't have any signs")
+        return None
+    map_xy = np.concatenate(map_xy)
+    normals = np.concatenate(normals)
+
+    # map coordinates are in model units scaled by the map conversion, the built in projections are in US survey feet
+    crs = model_crs(model)
+    if crs in PROJECTIONS:
+        map_xy = map_xy*ifcopenshell.util.unit.calculate_unit_scale(model)/US_SURVEY_FOOT
+    latitude, longitude = to_geographic(map_xy[:,0],map_xy[:,1],crs)
+    exposure, sun_hours = annual_exposure(latitude,longitude,normals,**kwargs)
+
+    signs = [model.by_guid(global_id) for global_id in global_ids]
+    property_writer = PropertyWriter(model)
+    property_writer.add_psets(signs,PSET_NAME,{
+        "AnnualExposure":[None if math.isnan(v) else round(v,1) for v in exposure.tolist()],
+        "SunHours":[None if math.isnan(v) else v for v in sun_hours.tolist()],
+    })
+    property_writer.flush()
+    model.write(output_file)
+    return exposure
+
+
+def benchmark(count=1000000):
+    store = SignRecordStore.from_csv("Sign_Face.csv")
+    index = np.arange(count) % len(store)
+    rng = np.random.default_rng(0)
+    # signs spread over the state plane zone
+    easting = rng.uniform(800000.,2400000.,count)
+    northing = rng.uniform(100000.,900000.,count)
+    normals = face_normals(store.orientation[index])
+    start = time.perf_counter()
+    latitude, longitude = to_geographic(easting,northing)
+    exposure, sun_hours = annual_exposure(latitude,longitude,normals)
+    print(f"annual exposure of {count} signs in {time.perf_counter() - start:.2f} s, mean {np.nanmean(exposure):.0f} kWh/m^2, {np.nanmean(sun_hours):.0f} sun hours")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Estimate the annual solar exposure of sign faces")
+    parser.add_argument("--signs",default="Sign_Face.csv",help="Sign_Face.csv or an IFC sign model")
+    parser.add_argument("--crs",default="EPSG:2927",help="coordinate system of Sign_Face.csv")
+    parser.add_argument("--year",type=int,default=2025)
+    parser.add_argument("--step",type=float,default=60.,help="timestep, minutes")
+    parser.add_argument("--report",default="sign_solar_exposure.csv")
+    parser.add_argument("--output",default=None,help="IFC file with SignSolarExposure property sets")
+    parser.add_argument("--benchmark",action="store_true")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        benchmark()
+    elif args.signs.lower().endswith(".ifc"):
+        import ifcopenshell
+        model = ifcopenshell.open(args.signs)
+        add_exposure_psets(model,args.output if args.output else args.signs.replace(".ifc","_Solar.ifc"),year=args.year,step_minutes=args.step)
+    else:
+        store = SignRecordStore.from_csv(args.signs)
+        start = time.perf_counter()
+        latitude, longitude, exposure, sun_hours = records_exposure(store,args.crs,year=args.year,step_minutes=args.step)
+        print(f"annual exposure of {len(store)} signs in {time.perf_counter() - start:.2f} s")
+        write_report(store,latitude,longitude,exposure,sun_hours,args.report)
+    print("Done")
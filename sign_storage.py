@@ -0,0 +1,132 @@
+"""
+Storage formats for sign models
+
+Richard Brice, PE
+WSDOT Bridge and Structures Office
+
+The builders write plain STEP physical files (.ifc) and every downstream use parses the whole file again, such as each
+builder opening MUTCD_Sign_Library.ifc. The format of a model is chosen by the extension of its file name
+1) .ifc - STEP physical file. open_model indexes the file with one quick pass and parses instances as they are read
+   (ifcopenshell lazy loading) rather than parsing the whole file up front
+2) .ifcZIP - STEP physical file compressed with zip. Smallest on disk, but it has to be unzipped and parsed to be read
+3) .rdb - RocksDB key-value store (a folder) written by ifcopenshell's RocksDbSerializer. Instances are read from the
+   store when they are used so the store opens in a few milliseconds regardless of the model size. The serializer
+   reads a STEP file, so the model is written as a temporary .ifc first.
+
+ifcopenshell can read IFC-SQLite databases but writing them requires ifcpatch, and the ifcopenshell builds used here
+don't include HDF5, so neither is offered.
+
+python sign_storage.py --benchmark MUTCD_Sign_Library.ifc Test_Corridor_Signs.ifc
+
+writes each model in every format and reports the write time, size, time to open, and time to the first query.
+"""
+
+import ifcopenshell
+import ifcopenshell.ifcopenshell_wrapper
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+
+FORMATS = {"ifc":".ifc","ifczip":".ifcZIP","rocksdb":".rdb"}
+
+
+def model_format(file_name):
+    suffix = os.path.splitext(file_name)[1].lower()
+    for name, extension in FORMATS.items():
+        if suffix == extension.lower():
+            return name
+    return "ifc"
+
+
+def format_file_name(file_name,format):
+    # file name with the extension of the format, e.g. Test_Corridor_Signs.ifc -> Test_Corridor_Signs.rdb
+    return os.path.splitext(file_name)[0] + FORMATS[format]
+
+
+def write_model(model,file_name):
+    format = model_format(file_name)
+    if format == "rocksdb":
+        # RocksDbSerializer converts a STEP file, and an existing store would be merged with the new one
+        with tempfile.TemporaryDirectory() as folder:
+            spf_file = os.path.join(folder,"model.ifc")
+            model.write(spf_file)
+            if os.path.isdir(file_name):
+                shutil.rmtree(file_name)
+            serializer = ifcopenshell.ifcopenshell_wrapper.RocksDbSerializer(spf_file,file_name)
+            serializer.finalize()
+            del serializer
+    else:
+        model.write(file_name)
+
+
+def open_model(file_name,lazy=True):
+    # lazy applies to .ifc files, .rdb stores are always read on demand
+    if not os.path.exists(file_name):
+        print(f"Error: File '{file_name}' not found.")
+        return None
+    format = model_format(file_name)
+    if format == "ifc" and lazy:
+        return ifcopenshell.open(file_name,lazy=True)
+    return ifcopenshell.open(file_name)
+
+
+def storage_size(file_name):
+    # bytes on disk of a file or a store folder
+    if os.path.isdir(file_name):
+        return sum(os.path.getsize(os.path.join(path,name)) for path, folders, names in os.walk(file_name) for name in names)
+    return os.path.getsize(file_name)
+
+
+def first_query(model):
+    # a typical first use of a model - the signs of a sign model, or the Stop sign type of the library
+    signs = model.by_type("IfcSign")
+    if signs:
+        return f"{len(signs)} signs, first is {signs[0].Name}"
+    sign_types = [sign_type for sign_type in model.by_type("IfcSignType") if sign_type.Name == "R1-1"]
+    return f"R1-1 has {len(sign_types[0].HasPropertySets or [])} property sets" if sign_types else "no signs"
+
+
+def benchmark(file_names,folder=None):
+    folder = folder if folder else tempfile.mkdtemp(prefix="sign_storage_")
+    print(f"{'Model':<28}{'Format':<10}{'Write s':>9}{'Size MB':>10}{'Open s':>9}{'Query s':>9}  First query")
+    for file_name in file_names:
+        model = ifcopenshell.open(file_name)
+        base_name = os.path.join(folder,os.path.basename(file_name))
+        cases = [(format,False) for format in FORMATS] + [("ifc",True)]
+        for format, lazy in cases:
+            output = format_file_name(base_name,format)
+            start = time.perf_counter()
+            write_model(model,output)
+            write_time = time.perf_counter() - start
+
+            start = time.perf_counter()
+            reopened = open_model(output,lazy=lazy)
+            open_time = time.perf_counter() - start
+            start = time.perf_counter()
+            result = first_query(reopened)
+            query_time = time.perf_counter() - start
+
+            name = f"{format} lazy" if lazy else format
+            print(f"{os.path.basename(file_name):<28}{name:<10}{write_time:>9.3f}{storage_size(output)/1.e6:>10.2f}{open_time:>9.3f}{query_time:>9.3f}  {result}")
+            del reopened
+    return folder
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write sign models in other storage formats")
+    parser.add_argument("models",nargs="+",help="IFC files")
+    parser.add_argument("--format",choices=list(FORMATS.keys()),default=None,help="write the models in this format next to the originals")
+    parser.add_argument("--benchmark",action="store_true",help="compare write time, size, and time to first query of the formats")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        folder = benchmark(args.models)
+        shutil.rmtree(folder)
+    if args.format:
+        for file_name in args.models:
+            output = format_file_name(file_name,args.format)
+            write_model(ifcopenshell.open(file_name),output)
+            print(f"{file_name} -> {output}")
@@ -0,0 +1,305 @@
+"""
+Shared sign face textures and surface styles
+
+Richard Brice, PE
+WSDOT Bridge and Structures Office
+
+Build_Geolocated_Sign.py originally attached an IfcImageTexture, IfcSurfaceStyleRendering, IfcSurfaceStyleWithTextures
+and IfcSurfaceStyle to a single sign panel. Repeating that for every sign in a corridor creates a copy of the texture
+and style for each sign. Here the texture and style are defined once per MUTCD code and attached to the geometry of the
+IfcSignType. Every IfcSign maps the type geometry with IfcMappedItem so it picks up the same style without any
+additional entities.
+
+The Body of the library sign types is an IfcExtrudedAreaSolid and their Body-Fallback is an IfcTriangulatedFaceSet (see
+sign_lod.py). Face sets get the texture and texture coordinates, swept solids get the surface style. Library sign types
+with the same shape share their representation maps, so a type gets its own copy of a shared map before it is styled
+(and before its signs map it).
+Build_Sign_Library.py --faces and Build_Test_Corridor_Signs.py --faces style the sign types that have a face image,
+<folder>/<MUTCD code>.png (sign_face_url).
+
+Optionally, the sign faces can be packed into a single texture atlas. One IfcImageTexture and one IfcSurfaceStyle
+are shared by all sign types and each type gets its own texture coordinates (UV offsets) into the atlas.
+
+Run this script directly to compare file size and load time of per-instance styles and shared styles.
+"""
+
+import ifcopenshell
+import ifcopenshell.api.context
+import ifcopenshell.api.unit
+import ifcopenshell.api.aggregate
+import ifcopenshell.api.spatial
+import json
+import os
+import tempfile
+import ifcopenshell.util.element
+import time
+
+
+def sign_face_url(folder,mutcd):
+    # <folder>/<MUTCD code>.png if the image exists, otherwise None
+    if not folder or not mutcd:
+        return None
+    url = os.path.join(folder,f"{mutcd}.png")
+    return url if os.path.exists(url) else None
+
+
+class SignFaceAtlas:
+    # Packs sign face images into a single texture atlas using simple shelf packing.
+    # Each sign face is identified by its MUTCD code. The atlas layout (pixel rectangle and UV rectangle for each code)
+    # is computed once and can be saved as JSON next to the atlas image.
+    def __init__(self,url,width=4096,padding=2):
+        self.url = url
+        self.width = width
+        self.height = 0
+        self.padding = padding
+        self.faces = {} # mutcd -> (image file, width px, height px)
+        self.rects = {} # mutcd -> (x,y,w,h) in pixels
+
+    def add_face(self,mutcd,image_file,width_px,height_px):
+        if mutcd in self.faces:
+            return
+        self.faces[mutcd] = (image_file,int(width_px),int(height_px))
+        self.rects.clear()
+
+    def pack(self):
+        if self.rects:
+            return self.rects
+
+        # tallest faces first, filling rows (shelves) left to right
+        order = sorted(self.faces.items(),key=lambda item: (-item[1][2],-item[1][1],item[0]))
+        x = 0
+        y = 0
+        shelf_height = 0
+        for mutcd, (image_file,w,h) in order:
+            if self.width < w + 2*self.padding:
+                raise ValueError(f"{mutcd} face is wider than the atlas")
+            if self.width < x + w + 2*self.padding:
+                x = 0
+                y += shelf_height
+                shelf_height = 0
+            self.rects[mutcd] = (x + self.padding,y + self.padding,w,h)
+            x += w + 2*self.padding
+            shelf_height = max(shelf_height,h + 2*self.padding)
+
+        self.height = y + shelf_height
+        return self.rects
+
+    def uv_rect(self,mutcd):
+        # returns (u0,v0,u1,v1) with v measured from the bottom of the image
+        rects = self.pack()
+        x, y, w, h = rects[mutcd]
+        return (x/self.width,1. - (y + h)/self.height,(x + w)/self.width,1. - y/self.height)
+
+    def save_layout(self,file_path):
+        self.pack()
+        layout = {
+            "url":self.url,
+            "width":self.width,
+            "height":self.height,
+            "faces":{mutcd:{"image":self.faces[mutcd][0],"rect":list(rect)} for mutcd, rect in self.rects.items()}
+        }
+        with open(file_path,mode='w',encoding='utf-8') as f:
+            json.dump(layout,f,indent=1)
+
+    @staticmethod
+    def load_layout(file_path):
+        with open(file_path,mode='r',encoding='utf-8') as f:
+            layout = json.load(f)
+        atlas = SignFaceAtlas(layout["url"],layout["width"])
+        for mutcd, face in layout["faces"].items():
+            x, y, w, h = face["rect"]
+            atlas.faces[mutcd] = (face["image"],w,h)
+            atlas.rects[mutcd] = (x,y,w,h)
+        atlas.height = layout["height"]
+        return atlas
+
+    def compose(self,file_path):
+        # composing the atlas image requires Pillow. The IFC model only needs the layout so this is optional.
+        try:
+            from PIL import Image
+        except ImportError:
+            print("Pillow is not installed - atlas image not composed")
+            return False
+
+        self.pack()
+        atlas_image = Image.new("RGBA",(self.width,self.height),(0,0,0,0))
+        for mutcd, (x,y,w,h) in self.rects.items():
+            with Image.open(self.faces[mutcd][0]) as face:
+                atlas_image.paste(face.convert("RGBA").resize((w,h)),(x,y))
+        atlas_image.save(file_path)
+        return True
+
+
+class SignFaceStyles:
+    # Interns sign face textures and styles for a model.
+    # Textures are keyed by image URL, styles by MUTCD code (or by the atlas URL when an atlas is used)
+    def __init__(self,model,atlas=None):
+        self.model = model
+        self.atlas = atlas
+        self.textures = {}
+        self.styles = {}
+        self.shading = None
+        self.styled_items = {} # id of geometric item -> IfcStyledItem
+
+    def get_texture(self,url):
+        texture = self.textures.get(url)
+        if texture is None:
+            texture = self.model.createIfcImageTexture(RepeatS=False,RepeatT=False,Mode="DIFFUSE",URLReference=url)
+            self.textures[url] = texture
+        return texture
+
+    def get_style(self,mutcd,url=None):
+        key = self.atlas.url if self.atlas else mutcd
+        style = self.styles.get(key)
+        if style is None:
+            if self.shading is None:
+                self.shading = self.model.createIfcSurfaceStyleRendering(SurfaceColour=self.model.createIfcColourRgb(Red=0.,Green=0.,Blue=0.),ReflectanceMethod="NOTDEFINED")
+
+            texture = self.get_texture(self.atlas.url if self.atlas else url)
+            surface_with_texture = self.model.createIfcSurfaceStyleWithTextures(Textures=[texture])
+            style = self.model.createIfcSurfaceStyle(Name=key,Side="POSITIVE",Styles=[self.shading,surface_with_texture])
+            self.styles[key] = style
+        return style
+
+    def style_sign_face(self,mutcd,face_set,url=None):
+        # style a tessellated sign face of an IfcSignType representation
+        # the same face set is shared by all instances through IfcRepresentationMap/IfcMappedItem so this is done once per type
+        styled_item = self.styled_items.get(face_set.id())
+        if styled_item:
+            return styled_item
+
+        style = self.get_style(mutcd,url)
+        styled_item = self.model.createIfcStyledItem(Item=face_set,Styles=[style])
+        self.styled_items[face_set.id()] = styled_item
+
+        # map the face extents to the texture, or the portion of the texture atlas for this sign
+        u0, v0, u1, v1 = self.atlas.uv_rect(mutcd) if self.atlas else (0.,0.,1.,1.)
+        coords = face_set.Coordinates.CoordList
+        xmin = min(c[0] for c in coords)
+        xmax = max(c[0] for c in coords)
+        ymin = min(c[1] for c in coords)
+        ymax = max(c[1] for c in coords)
+        dx = (xmax - xmin) if xmin < xmax else 1.
+        dy = (ymax - ymin) if ymin < ymax else 1.
+        tex_coords = [(u0 + (u1 - u0)*(c[0] - xmin)/dx,v0 + (v1 - v0)*(c[1] - ymin)/dy) for c in coords]
+
+        texture = style.Styles[1].Textures[0]
+        vertex_list = self.model.createIfcTextureVertexList(TexCoordsList=tex_coords)
+        self.model.createIfcIndexedTriangleTextureMap(Maps=[texture],MappedTo=face_set,TexCoords=vertex_list,TexCoordIndex=face_set.CoordIndex)
+
+        return styled_item
+
+    def style_sign_solid(self,mutcd,solid,url=None):
+        # style a swept solid of an IfcSignType representation. a swept solid doesn't have texture coordinates so it only
+        # gets the surface style
+        styled_item = self.styled_items.get(solid.id())
+        if styled_item is None:
+            styled_item = self.model.createIfcStyledItem(Item=solid,Styles=[self.get_style(mutcd,url)])
+            self.styled_items[solid.id()] = styled_item
+        return styled_item
+
+    def _own_representation_map(self,sign_type,rep_map):
+        # rep_map, or a copy of it for sign_type alone if other types share it or its items, so its items can be styled
+        # for this type. the items are copied (not the points, profiles and curves they reference) and the copy replaces
+        # rep_map
+        representation = rep_map.MappedRepresentation
+        shared_map = any(other.is_a("IfcTypeProduct") and other != sign_type for other in self.model.get_inverse(rep_map))
+        shared_items = any(len([other for other in self.model.get_inverse(item) if other.is_a("IfcShapeRepresentation")]) > 1 for item in representation.Items)
+        if not (shared_map or shared_items):
+            return rep_map
+        items = [ifcopenshell.util.element.copy(self.model,item) for item in representation.Items]
+        own_representation = self.model.createIfcShapeRepresentation(ContextOfItems=representation.ContextOfItems,RepresentationIdentifier=representation.RepresentationIdentifier,RepresentationType=representation.RepresentationType,Items=items)
+        own_map = self.model.createIfcRepresentationMap(MappingOrigin=rep_map.MappingOrigin,MappedRepresentation=own_representation)
+        sign_type.RepresentationMaps = [own_map if other == rep_map else other for other in sign_type.RepresentationMaps]
+        return own_map
+
+    def style_sign_type(self,sign_type,url=None,mutcd=None):
+        # style the tessellated items (texture) and swept solids (surface style) of the type representation maps
+        # library sign types are named with their MUTCD code. style a type before its signs map it, a shared
+        # representation map is replaced by a copy. returns the number of styled items
+        mutcd = mutcd if mutcd else sign_type.Name
+        count = 0
+        for rep_map in list(sign_type.RepresentationMaps or []):
+            items = rep_map.MappedRepresentation.Items
+            if not any(item.is_a("IfcTriangulatedFaceSet") or item.is_a("IfcSweptAreaSolid") for item in items):
+                continue
+            for item in self._own_representation_map(sign_type,rep_map).MappedRepresentation.Items:
+                if item.is_a("IfcTriangulatedFaceSet"):
+                    self.style_sign_face(mutcd,item,url)
+                    count += 1
+                elif item.is_a("IfcSweptAreaSolid"):
+                    self.style_sign_solid(mutcd,item,url)
+                    count += 1
+        if count == 0:
+            print(f"Warning: {sign_type.Name} has no tessellated or swept solid geometry to style")
+        return count
+
+
+def create_sign_face(model,context,width,height):
+    # flat sign panel in the X-Y plane with (0,0) at the bottom center
+    points = model.createIfcCartesianPointList3D(CoordList=[(0.,0.,0.),(0.5*width,0.,0.),(0.5*width,height,0.),(-0.5*width,height,0.),(-0.5*width,0.,0.)])
+    indicies = [(1,2,3),(3,4,1),(4,5,1)]
+    face_set = model.createIfcTriangulatedFaceSet(Coordinates=points,CoordIndex=indicies)
+    return face_set, model.createIfcShapeRepresentation(ContextOfItems=context,RepresentationIdentifier="Body",RepresentationType="Tessellation",Items=[face_set])
+
+
+def _build_benchmark_model(sign_count,type_count,shared):
+    model = ifcopenshell.file(schema="IFC4X3")
+    project = model.createIfcProject(GlobalId=ifcopenshell.guid.new(),Name="Sign Face Style Benchmark")
+    site = model.createIfcSite(GlobalId=ifcopenshell.guid.new(),Name="Test Site")
+    ifcopenshell.api.aggregate.assign_object(model,relating_object=project,products=[site])
+    length_unit = ifcopenshell.api.unit.add_conversion_based_unit(model,name="foot")
+    ifcopenshell.api.unit.assign_unit(model,units=[length_unit])
+    geometric_representation_context = ifcopenshell.api.context.add_context(model,context_type="Model")
+    body_model_context = ifcopenshell.api.context.add_context(model,context_type="Model",context_identifier="Body",target_view="MODEL_VIEW",parent=geometric_representation_context)
+
+    origin = model.createIfcAxis2Placement3D(Location=model.createIfcCartesianPoint((0.,0.,0.)))
+    mapping_target = model.createIfcCartesianTransformationOperator3D(LocalOrigin=model.createIfcCartesianPoint((0.,0.,0.)))
+    styles = SignFaceStyles(model)
+
+    sign_types = []
+    for i in range(type_count):
+        face_set, rep = create_sign_face(model,body_model_context,2.5,3.)
+        rep_map = model.createIfcRepresentationMap(MappingOrigin=origin,MappedRepresentation=rep)
+        sign_type = model.createIfcSignType(GlobalId=ifcopenshell.guid.new(),Name=f"R{i}-1",PredefinedType="PICTORAL",RepresentationMaps=[rep_map])
+        if shared:
+            styles.style_sign_type(sign_type,f"R{i}-1.png")
+        sign_types.append(sign_type)
+
+    signs = []
+    for i in range(sign_count):
+        sign_type = sign_types[i % type_count]
+        if shared:
+            mapped_item = model.createIfcMappedItem(MappingSource=sign_type.RepresentationMaps[0],MappingTarget=mapping_target)
+            items = [mapped_item]
+            rep_type = "MappedRepresentation"
+        else:
+            # the original pattern - each sign carries its own panel, texture and style
+            face_set, rep = create_sign_face(model,body_model_context,2.5,3.)
+            SignFaceStyles(model).style_sign_face(sign_type.Name,face_set,f"{sign_type.Name}.png")
+            items = [face_set]
+            rep_type = "Tessellation"
+        rep = model.createIfcShapeRepresentation(ContextOfItems=body_model_context,RepresentationIdentifier="Body",RepresentationType=rep_type,Items=items)
+        placement = model.createIfcLocalPlacement(RelativePlacement=model.createIfcAxis2Placement3D(Location=model.createIfcCartesianPoint((float(i),0.,0.))))
+        signs.append(model.createIfcSign(GlobalId=ifcopenshell.guid.new(),Name=f"Sign {i}",ObjectPlacement=placement,Representation=model.createIfcProductDefinitionShape(Representations=[rep])))
+
+    ifcopenshell.api.spatial.assign_container(model,relating_structure=site,products=signs)
+    return model
+
+
+def benchmark(sign_count=5000,type_count=50):
+    with tempfile.TemporaryDirectory() as folder:
+        for shared in (False,True):
+            label = "shared type styles" if shared else "per-instance styles"
+            file_path = os.path.join(folder,f"{'shared' if shared else 'instance'}.ifc")
+            model = _build_benchmark_model(sign_count,type_count,shared)
+            model.write(file_path)
+            start = time.perf_counter()
+            ifcopenshell.open(file_path)
+            load_time = time.perf_counter() - start
+            print(f"{label}: {len(model.by_type('IfcSurfaceStyle'))} styles, {len(model.by_type('IfcImageTexture'))} textures, {os.path.getsize(file_path)/1024.:.0f} KB, load {load_time:.3f} s")
+
+
+if __name__ == "__main__":
+    benchmark()
+    print("Done")
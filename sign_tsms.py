@@ -0,0 +1,331 @@
+"""
+TSMS sign inventory
+
+Richard Brice, PE
+WSDOT Bridge and Structures Office
+
+SR104TSMSSigns.svc.xlsx is an export of the WSDOT Traffic Sign Management System (TSMS) inventory for SR 104. The test
+corridor is modeled from Sign_Face.csv (signs detected in LiDAR data), which has the location, size, and MUTCD code of
+each sign but none of the inventory attributes such as the support, sheeting, status, and installation date.
+
+read_tsms streams the worksheet XML out of the workbook with ElementTree.iterparse and yields chunks of rows, so a
+statewide workbook is never held in memory. Only the values of the columns that are used are converted. This is about
+7 times faster than reading the rows with openpyxl in read-only mode, which converts every cell. join_tsms matches the
+inventory signs to the detections
+1) The detections are put in a hash grid with cells the size of the match distance
+2) For each chunk of inventory rows, the detections in the neighboring cells within the match distance and with the
+   same MUTCD code (ignoring case and trailing blanks, TSMS has R3-9A for R3-9a) are candidates. Only the attributes of
+   inventory signs that have candidates are kept.
+3) After all of the chunks are read, the candidates are matched one to one, closest first
+
+TSMS locations are derived from mileposts and are typically 40 to 90 ft from the detected sign, so the default match
+distance is 100 ft. Archived and inactive inventory signs are skipped.
+
+python sign_tsms.py --output Sign_Face_TSMS.csv
+
+writes the merged attributes for each matched detection. Build_Test_Corridor_Signs.py --tsms SR104TSMSSigns.svc.xlsx
+adds them to the signs as the WSDOT_TSMS property set.
+"""
+
+import argparse
+import csv
+import datetime
+import numpy as np
+import posixpath
+import re
+import time
+import xml.etree.ElementTree as ET
+import zipfile
+from sign_records import SignRecordStore
+
+
+PSET_NAME = "WSDOT_TSMS"
+
+# TSMS column -> property name
+TSMS_PROPERTIES = {
+    "Sign_SequenceNumber":"SequenceNumber",
+    "AssetId":"AssetId",
+    "Sign_ManualonUniformTrafficControlDevices":"MUTCD",
+    "fab_desc":"Description",
+    "Sign_StateRouteNumber":"StateRoute",
+    "Sign_LinearRefrencingMethod":"Milepost", # (sic) the state route milepost of the sign
+    "trf_dir_desc":"TrafficDirection",
+    "side_desc":"SideOfRoad",
+    "dir_desc":"Facing",
+    "clr_desc":"Color",
+    "sheet_desc":"Sheeting",
+    "supp_typ_desc":"SupportType",
+    "sup_siz_desc":"SupportSize",
+    "bm_desc":"BackingMaterial",
+    "Sign_NumberofPosts":"NumberOfPosts",
+    "type_desc":"SignClass",
+    "light_desc":"Illumination",
+    "stat_desc":"Status",
+    "Sign_Height":"Height",
+    "Sign_Width":"Width",
+    "Sign_TextDisplay":"TextDisplay",
+    "Sign_InstallationDate":"InstallationDate",
+    "Sign_LastUpdate":"LastUpdate",
+}
+
+# properties of the WSDOT_TSMS property set
+PROPERTY_NAMES = list(TSMS_PROPERTIES.values()) + ["MatchDistance"]
+
+# sign_inactive_ind values of signs that are no longer in the field
+INACTIVE_STATUS = {1,2} # 1 Inactive, 2 Archived
+
+# dates are stored as day numbers, the style of the cell makes them dates in Excel
+DATE_COLUMNS = {"Sign_InstallationDate","Sign_LastUpdate"}
+EXCEL_EPOCH = datetime.datetime(1899,12,30)
+
+NULL_VALUES = {"","NULL"}
+
+MAIN_NS = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+RELATIONSHIP_NS = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+PACKAGE_RELATIONSHIP_NS = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+CELL_REFERENCE = re.compile(r"[A-Z]+")
+
+
+def normalize_mutcd(code):
+    return code.strip().upper() if code else ""
+
+
+def _value(column,value):
+    # TSMS values as property values - blanks and NULL are no value, dates are ISO dates and sizes of 0 are unknown
+    if isinstance(value,str):
+        value = value.strip()
+        return None if value in NULL_VALUES else value
+    if column in DATE_COLUMNS and isinstance(value,(int,float)):
+        return (EXCEL_EPOCH + datetime.timedelta(days=value)).date().isoformat()
+    if column in ("Sign_Height","Sign_Width") and not value:
+        return None
+    return value
+
+
+class TsmsChunk:
+    def __init__(self,first_row,rows,columns):
+        # rows - list of row tuples, columns - column name -> index
+        self.first_row = first_row
+        self.rows = rows
+        self.x = np.array([_to_float(row[columns["X"]]) for row in rows],dtype=np.float64)
+        self.y = np.array([_to_float(row[columns["Y"]]) for row in rows],dtype=np.float64)
+        self.mutcd = [normalize_mutcd(row[columns["Sign_ManualonUniformTrafficControlDevices"]]) for row in rows]
+        status = columns.get("sign_inactive_ind")
+        self.active = np.array([status is None or row[status] not in INACTIVE_STATUS for row in rows],dtype=bool)
+        self.columns = columns
+
+    def attributes(self,index):
+        row = self.rows[index]
+        attributes = {}
+        for column, name in TSMS_PROPERTIES.items():
+            i = self.columns.get(column)
+            value = _value(column,row[i]) if i is not None else None
+            if value is not None:
+                attributes[name] = value
+        return attributes
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError,ValueError):
+        return np.nan
+
+
+def _column_index(reference):
+    # "AB12" -> 27
+    index = 0
+    for letter in CELL_REFERENCE.match(reference).group(0):
+        index = index*26 + ord(letter) - 64
+    return index - 1
+
+
+def _sheet_path(workbook,sheet_name):
+    # path in the package of the named worksheet, or the first worksheet
+    sheets = ET.fromstring(workbook.read("xl/workbook.xml")).find(f"{MAIN_NS}sheets")
+    sheet = next((sheet for sheet in sheets if sheet_name is None or sheet.get("name") == sheet_name),None)
+    if sheet is None:
+        return None
+    relationships = ET.fromstring(workbook.read("xl/_rels/workbook.xml.rels"))
+    target = next(rel.get("Target") for rel in relationships.iter(f"{PACKAGE_RELATIONSHIP_NS}Relationship") if rel.get("Id") == sheet.get(f"{RELATIONSHIP_NS}id"))
+    return target.lstrip("/") if target.startswith("/") else posixpath.normpath(posixpath.join("xl",target))
+
+
+def _shared_strings(workbook):
+    if "xl/sharedStrings.xml" not in workbook.namelist():
+        return []
+    strings = []
+    with workbook.open("xl/sharedStrings.xml") as f:
+        for event, element in ET.iterparse(f):
+            if element.tag == f"{MAIN_NS}si":
+                strings.append("".join(text.text or "" for text in element.iter(f"{MAIN_NS}t")))
+                element.clear()
+    return strings
+
+
+def _cell_value(cell,strings):
+    cell_type = cell.get("t","n")
+    if cell_type == "inlineStr":
+        return "".join(text.text or "" for text in cell.iter(f"{MAIN_NS}t"))
+    value = cell.find(f"{MAIN_NS}v")
+    if value is None or value.text is None:
+        return None
+    text = value.text
+    if cell_type == "s":
+        return strings[int(text)]
+    if cell_type == "n":
+        return float(text) if "." in text or "E" in text or "e" in text else int(text)
+    if cell_type == "b":
+        return text == "1"
+    return text
+
+
+def iter_sheet_rows(file_path,sheet_name=None,columns=None):
+    # yields the rows of a worksheet as lists of values. the first row is the header
+    # columns is a set of header names, the other columns are None
+    with zipfile.ZipFile(file_path) as workbook:
+        sheet_path = _sheet_path(workbook,sheet_name)
+        if sheet_path is None:
+            print(f"Error: {file_path} does not have the worksheet {sheet_name}")
+            return
+        strings = _shared_strings(workbook)
+        wanted = None
+        with workbook.open(sheet_path) as f:
+            for event, element in ET.iterparse(f):
+                if element.tag != f"{MAIN_NS}row":
+                    continue
+                row = []
+                for position, cell in enumerate(element.iter(f"{MAIN_NS}c")):
+                    reference = cell.get("r")
+                    index = _column_index(reference) if reference else position
+                    if wanted is not None and index not in wanted:
+                        continue
+                    if index >= len(row):
+                        row.extend([None]*(index + 1 - len(row)))
+                    row[index] = _cell_value(cell,strings)
+                element.clear()
+                if wanted is None and columns is not None:
+                    wanted = {i for i, name in enumerate(row) if name in columns}
+                yield row
+
+
+def read_tsms(file_path="SR104TSMSSigns.svc.xlsx",chunk_size=10000,sheet_name=None):
+    # yields TsmsChunk of up to chunk_size rows
+    used = set(TSMS_PROPERTIES) | {"X","Y","Sign_ManualonUniformTrafficControlDevices","sign_inactive_ind"}
+    rows = iter_sheet_rows(file_path,sheet_name,used)
+    header = next(rows,None)
+    if header is None:
+        return
+    columns = {name:i for i, name in enumerate(header) if name in used}
+    missing = [name for name in ("X","Y","Sign_ManualonUniformTrafficControlDevices") if name not in columns]
+    if missing:
+        print(f"Error: {file_path} does not have the columns {missing}")
+        return
+
+    width = max(columns.values()) + 1
+    chunk = []
+    first_row = 1
+    for row in rows:
+        if len(row) < width:
+            row.extend([None]*(width - len(row)))
+        chunk.append(row)
+        if len(chunk) == chunk_size:
+            yield TsmsChunk(first_row,chunk,columns)
+            first_row += len(chunk)
+            chunk = []
+    if chunk:
+        yield TsmsChunk(first_row,chunk,columns)
+
+
+class TsmsJoin:
+    def __init__(self):
+        self.matches = {} # Sign_Face OBJECTID -> TSMS attributes, including MatchDistance
+        self.rows_read = 0
+        self.inactive = 0
+        self.no_location = 0
+        self.unmatched = 0
+
+    def summary(self):
+        return {
+            "TSMS rows":self.rows_read,
+            "inactive or archived":self.inactive,
+            "without location":self.no_location,
+            "matched":len(self.matches),
+            "unmatched":self.unmatched,
+        }
+
+
+def join_tsms(records,file_path="SR104TSMSSigns.svc.xlsx",distance=100.,chunk_size=10000):
+    # match TSMS inventory signs to the sign records (SignRecordStore) by location and MUTCD code
+    join = TsmsJoin()
+
+    # detections in a hash grid with cells the size of the match distance
+    located = np.flatnonzero(~(np.isnan(records.x) | np.isnan(records.y)))
+    cells = np.floor(np.column_stack((records.x[located],records.y[located]))/distance).astype(np.int64)
+    grid = {}
+    for index, cell in zip(located.tolist(),map(tuple,cells.tolist())):
+        grid.setdefault(cell,[]).append(index)
+    codes = [normalize_mutcd(records.mutcd[i]) for i in range(len(records))]
+    neighbors = [(i,j) for i in (-1,0,1) for j in (-1,0,1)]
+
+    candidates = [] # (distance, TSMS row, detection index)
+    attributes = {} # TSMS row -> attributes of the inventory signs that have candidates
+    for chunk in read_tsms(file_path,chunk_size):
+        join.rows_read += len(chunk.rows)
+        join.inactive += int(np.count_nonzero(~chunk.active))
+        has_location = ~(np.isnan(chunk.x) | np.isnan(chunk.y))
+        join.no_location += int(np.count_nonzero(chunk.active & ~has_location))
+        for i in np.flatnonzero(chunk.active & has_location).tolist():
+            x, y, code = chunk.x[i], chunk.y[i], chunk.mutcd[i]
+            ci, cj = int(np.floor(x/distance)), int(np.floor(y/distance))
+            row = chunk.first_row + i
+            for di, dj in neighbors:
+                for index in grid.get((ci + di,cj + dj),()):
+                    if codes[index] != code:
+                        continue
+                    d = float(np.hypot(records.x[index] - x,records.y[index] - y))
+                    if d <= distance:
+                        candidates.append((d,row,index))
+                        if row not in attributes:
+                            attributes[row] = chunk.attributes(i)
+
+    # one to one, closest first
+    candidates.sort()
+    matched_rows = set()
+    matched_signs = set()
+    for d, row, index in candidates:
+        if row in matched_rows or index in matched_signs:
+            continue
+        matched_rows.add(row)
+        matched_signs.add(index)
+        join.matches[int(records.object_id[index])] = dict(attributes[row],MatchDistance=round(d,2))
+
+    join.unmatched = join.rows_read - join.inactive - join.no_location - len(matched_rows)
+    return join
+
+
+def write_matches(join,file_path):
+    names = ["OBJECTID"] + PROPERTY_NAMES
+    with open(file_path,mode='w',newline='',encoding='utf-8') as f:
+        writer = csv.DictWriter(f,fieldnames=names)
+        writer.writeheader()
+        for object_id, attributes in sorted(join.matches.items()):
+            writer.writerow(dict(attributes,OBJECTID=object_id))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Join the TSMS sign inventory to the LiDAR sign detections")
+    parser.add_argument("--tsms",default="SR104TSMSSigns.svc.xlsx",help="TSMS inventory workbook")
+    parser.add_argument("--signs",default="Sign_Face.csv",help="sign detections")
+    parser.add_argument("--distance",type=float,default=100.,help="match distance (ft)")
+    parser.add_argument("--chunk-size",type=int,default=10000,help="TSMS rows read at a time")
+    parser.add_argument("--output",default=None,help="CSV file of the merged attributes")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    join = join_tsms(SignRecordStore.from_csv(args.signs),args.tsms,args.distance,args.chunk_size)
+    for name, count in join.summary().items():
+        print(f"{name}: {count}")
+    print(f"Joined in {time.perf_counter() - start:.2f} s")
+    if args.output:
+        write_matches(join,args.output)
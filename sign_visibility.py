@@ -0,0 +1,442 @@
+"""
+Sign visibility and obstruction analysis
+
+Richard Brice, PE
+WSDOT Bridge and Structures Office
+
+The sign maintenance use case (see ReadMe.md) asks which signs are obscured from the driver's point of view. This
+script answers that question for a path of driver eye points along an alignment.
+
+1) Driver eye points are sampled along the horizontal alignment (for example the SR 104 or SR 99 alignments created by
+   Alignments/Sign_Project_Alignments.py) at a fixed spacing and eye height. The alignments are not georeferenced, so
+   an origin and rotation can be given to place the alignment in the coordinate system of the sign model.
+2) The sign faces are tessellated with the ifcopenshell geometry iterator. The center of the front face and four points
+   near its corners are the targets for the sight lines.
+3) Occluders are triangle meshes - the tessellated products of any IFC model (vegetation, structures, terrain) or
+   triangles from another source. The occluder triangles are stored in a bounding volume hierarchy (BVH). All of the
+   sight lines to a sign traverse the hierarchy together, so the lines that miss a node's bounds are dropped with one
+   vectorized test, and the lines that reach a leaf are tested against its triangles in batch (Moller-Trumbore).
+4) A sign can be seen from an eye point if it is within the sight distance, within the driver's field of view, facing
+   the driver, and at least min_visible_fraction of the sight lines to its face are not blocked.
+5) The signs are split among a pool of processes. Each process gets the eye points and the BVH once.
+
+For each sign the report has the distance along the path from which the sign is visible (and the time at the design
+speed) and the first sight distance - the distance along the path from the first eye point from which the sign is seen
+to the point on the path nearest the sign.
+
+Usage:
+python sign_visibility.py signs.ifc alignment.ifc "C Line" [--origin X Y] [--rotation DEG] [--occluders model.ifc] [--report visibility.csv]
+
+Run this script without arguments for a benchmark with a synthetic corridor.
+"""
+
+import argparse
+import concurrent.futures
+import csv
+import ifcopenshell
+import ifcopenshell.geom
+import ifcopenshell.util.unit
+import math
+import multiprocessing
+import numpy as np
+import os
+import time
+from ifcopenshell import ifcopenshell_wrapper
+from sign_export import PlacementResolver
+from sign_lod import body_context_ids
+
+
+class VisibilitySettings:
+    def __init__(self,sight_distance=1000.,field_of_view=30.,max_view_angle=75.,min_visible_fraction=0.5,speed=88.):
+        self.sight_distance = sight_distance # model units
+        self.field_of_view = field_of_view # half angle from the direction of travel, degrees
+        self.max_view_angle = max_view_angle # largest angle between the sign face normal and the sight line, degrees
+        self.min_visible_fraction = min_visible_fraction # fraction of sight lines to the face that must be clear
+        self.speed = speed # model units per second, 88 ft/s = 60 mph
+
+
+class DriverPath:
+    # eye points (n,3), unit direction of travel (n,3), and distance along the path (n) of each eye point
+    def __init__(self,points,directions,distances,stations=None):
+        self.points = np.asarray(points,dtype=np.float64)
+        self.directions = np.asarray(directions,dtype=np.float64)
+        self.distances = np.asarray(distances,dtype=np.float64)
+        self.stations = self.distances if stations is None else np.asarray(stations,dtype=np.float64)
+
+    def __len__(self):
+        return len(self.points)
+
+    @staticmethod
+    def from_polyline(vertices,spacing=10.,eye_height=3.5):
+        # eye points at a fixed spacing along a polyline of (x,y) or (x,y,z) ground points
+        vertices = np.asarray(vertices,dtype=np.float64)
+        if vertices.shape[1] == 2:
+            vertices = np.column_stack((vertices,np.zeros(len(vertices))))
+        lengths = np.linalg.norm(np.diff(vertices,axis=0),axis=1)
+        cumulative = np.concatenate(([0.],np.cumsum(lengths)))
+        distances = np.arange(0.,cumulative[-1],spacing)
+        segment = np.clip(np.searchsorted(cumulative,distances,side="right") - 1,0,len(lengths) - 1)
+        t = (distances - cumulative[segment])/lengths[segment]
+        points = vertices[segment] + t[:,np.newaxis]*(vertices[segment + 1] - vertices[segment])
+        points[:,2] += eye_height
+        directions = (vertices[segment + 1] - vertices[segment])/lengths[segment][:,np.newaxis]
+        return DriverPath(points,directions,distances)
+
+    @staticmethod
+    def from_alignment(file_path,name,spacing=10.,eye_height=3.5,origin=(0.,0.),rotation=0.):
+        # eye points along the horizontal alignment of an IfcAlignment, in the length unit of the alignment model
+        # origin and rotation (degrees, counterclockwise) place the alignment in the coordinate system of the signs
+        model = ifcopenshell.open(file_path)
+        unit_scale = ifcopenshell.util.unit.calculate_unit_scale(model)
+        alignments = [alignment for alignment in model.by_type("IfcAlignment") if alignment.Name == name]
+        if not alignments:
+            raise ValueError(f"Alignment '{name}' not found in {file_path}")
+        curve = alignments[0].Representation.Representations[0].Items[0]
+
+        # the curve is evaluated by the geometry kernel in meters
+        settings = ifcopenshell.geom.settings()
+        # (older versions of ifcopenshell wrap the entity in wrapped_data)
+        function_item = ifcopenshell_wrapper.map_shape(settings,getattr(curve,"wrapped_data",curve))
+        evaluator = ifcopenshell_wrapper.function_item_evaluator(settings,function_item)
+        parameters = np.arange(function_item.start(),function_item.end(),spacing*unit_scale)
+        matrices = np.array([evaluator.evaluate(u) for u in parameters])
+
+        angle = math.radians(rotation)
+        rotate = np.array([[math.cos(angle),-math.sin(angle)],[math.sin(angle),math.cos(angle)]])
+        points = np.zeros((len(parameters),3))
+        points[:,:2] = (matrices[:,:2,3]/unit_scale) @ rotate.T + np.asarray(origin)
+        points[:,2] = matrices[:,2,3]/unit_scale + eye_height
+        directions = np.zeros((len(parameters),3))
+        directions[:,:2] = matrices[:,:2,0] @ rotate.T
+        distances = (parameters - function_item.start())/unit_scale
+
+        # stations from the IfcReferent at the start of the alignment, if there is one
+        start_station = 0.
+        for rel in alignments[0].IsNestedBy:
+            for referent in rel.RelatedObjects:
+                if referent.is_a("IfcReferent"):
+                    for pset in referent.IsDefinedBy:
+                        definition = pset.RelatingPropertyDefinition
+                        if definition.Name == "Pset_Stationing":
+                            for prop in definition.HasProperties:
+                                if prop.Name == "Station":
+                                    start_station = prop.NominalValue.wrappedValue
+        return DriverPath(points,directions,distances,distances + start_station)
+
+
+class TriangleBVH:
+    # bounding volume hierarchy of triangles (n,3,3) stored in flat arrays
+    def __init__(self,triangles,leaf_size=16):
+        triangles = np.asarray(triangles,dtype=np.float64).reshape(-1,3,3)
+        centroids = triangles.mean(axis=1)
+        order = np.arange(len(triangles))
+        node_min = []
+        node_max = []
+        node_children = [] # (left, right), -1 for leaves
+        node_range = [] # (start, end) in order, for leaves
+
+        stack = [(0,len(triangles),-1,0)] # start, end, parent, child slot
+        while stack:
+            start, end, parent, slot = stack.pop()
+            node = len(node_min)
+            if parent >= 0:
+                node_children[parent][slot] = node
+            indices = order[start:end]
+            node_min.append(triangles[indices].min(axis=(0,1)) if len(indices) else np.zeros(3))
+            node_max.append(triangles[indices].max(axis=(0,1)) if len(indices) else np.zeros(3))
+            node_children.append([-1,-1])
+            node_range.append((start,end))
+            if end - start <= leaf_size:
+                continue
+            # split at the median centroid along the longest axis
+            extent = centroids[indices].max(axis=0) - centroids[indices].min(axis=0)
+            axis = int(np.argmax(extent))
+            middle = (end - start)//2
+            partition = np.argpartition(centroids[indices,axis],middle)
+            order[start:end] = indices[partition]
+            stack.append((start + middle,end,node,1))
+            stack.append((start,start + middle,node,0))
+
+        self.triangles = triangles[order]
+        self.node_min = np.array(node_min).reshape(-1,3)
+        self.node_max = np.array(node_max).reshape(-1,3)
+        self.node_children = np.array(node_children,dtype=np.int64).reshape(-1,2)
+        self.node_range = np.array(node_range,dtype=np.int64).reshape(-1,2)
+
+    def segments_blocked(self,origins,targets):
+        # True for each segment origin -> target that passes through any triangle
+        # all of the segments traverse the hierarchy together - at each node the segments that miss its bounds
+        # are dropped, and at the leaves the remaining segments are tested against the leaf triangles
+        blocked = np.zeros(len(origins),dtype=bool)
+        if not len(self.triangles) or not len(origins):
+            return blocked
+        directions = targets - origins
+        with np.errstate(divide="ignore"):
+            inverse = np.where(directions == 0.,1e300,1./np.where(directions == 0.,1.,directions))
+        stack = [(0,np.arange(len(origins)))]
+        while stack:
+            node, segments = stack.pop()
+            segments = segments[~blocked[segments]]
+            if not len(segments):
+                continue
+            # slab test of the segments (0 <= t <= 1) against the node bounds
+            t1 = (self.node_min[node] - origins[segments])*inverse[segments]
+            t2 = (self.node_max[node] - origins[segments])*inverse[segments]
+            t_near = np.maximum(np.minimum(t1,t2).max(axis=1),0.)
+            t_far = np.minimum(np.maximum(t1,t2).min(axis=1),1.)
+            segments = segments[t_near <= t_far]
+            if not len(segments):
+                continue
+            left, right = self.node_children[node]
+            if left < 0:
+                start, end = self.node_range[node]
+                blocked[segments] |= segments_blocked(origins[segments],targets[segments],self.triangles[start:end])
+            else:
+                stack.append((left,segments))
+                stack.append((right,segments))
+        return blocked
+
+
+def segments_blocked(origins,targets,triangles,max_pairs=2000000):
+    # True for each segment origin -> target that passes through any triangle (Moller-Trumbore)
+    blocked = np.zeros(len(origins),dtype=bool)
+    if not len(triangles) or not len(origins):
+        return blocked
+    directions = targets - origins
+    v0 = triangles[:,0]
+    edge1 = triangles[:,1] - v0
+    edge2 = triangles[:,2] - v0
+    chunk = max(1,max_pairs//len(origins))
+    for start in range(0,len(triangles),chunk):
+        e1 = edge1[start:start + chunk][np.newaxis]
+        e2 = edge2[start:start + chunk][np.newaxis]
+        p = np.cross(directions[:,np.newaxis],e2)
+        determinant = (e1*p).sum(axis=2)
+        valid = np.abs(determinant) > 1e-12
+        inverse = np.where(valid,1./np.where(valid,determinant,1.),0.)
+        s = origins[:,np.newaxis] - v0[start:start + chunk][np.newaxis]
+        u = (s*p).sum(axis=2)*inverse
+        q = np.cross(s,e1)
+        v = (directions[:,np.newaxis]*q).sum(axis=2)*inverse
+        t = (e2*q).sum(axis=2)*inverse
+        hit = valid & (u >= 0.) & (v >= 0.) & (u + v <= 1.) & (t > 1e-9) & (t < 1. - 1e-9)
+        blocked |= hit.any(axis=1)
+    return blocked
+
+
+class SignFace:
+    # sight line targets on the front face of a sign
+    def __init__(self,global_id,name,center,normal,targets):
+        self.global_id = global_id
+        self.name = name
+        self.center = np.asarray(center,dtype=np.float64)
+        self.normal = np.asarray(normal,dtype=np.float64)
+        self.targets = np.asarray(targets,dtype=np.float64)
+
+
+def _face_targets(vertices,matrix,inset=0.8,offset=0.01):
+    # center and corner points of the face, in the plane of the front (local +Z) face of the sign, pulled toward the center
+    local = (vertices - matrix[:3,3]) @ matrix[:3,:3]
+    low = local.min(axis=0)
+    high = local.max(axis=0)
+    center = 0.5*(low + high)
+    half = 0.5*inset*(high - low)
+    z = high[2] + offset
+    points = [(center[0],center[1],z)] + [(center[0] + sx*half[0],center[1] + sy*half[1],z) for sx in (-1.,1.) for sy in (-1.,1.)]
+    return np.array(points) @ matrix[:3,:3].T + matrix[:3,3]
+
+
+def _iterate_shapes(model,include=None,exclude=None):
+    # (element, world vertices (n,3), faces (m,3)) of the tessellated products of a model, in model units
+    settings = ifcopenshell.geom.settings()
+    settings.set("use-world-coords",True)
+    settings.set("convert-back-units",True)
+    # one shape per product when the model has levels of detail (sign_lod.py)
+    context_ids = body_context_ids(model)
+    if context_ids:
+        settings.set("context-ids",context_ids)
+    kwargs = {}
+    if include:
+        kwargs["include"] = include
+    if exclude:
+        kwargs["exclude"] = exclude
+    iterator = ifcopenshell.geom.iterator(settings,model,multiprocessing.cpu_count(),**kwargs)
+    if iterator.initialize():
+        while True:
+            shape = iterator.get()
+            geometry = shape.geometry
+            vertices = np.array(geometry.verts,dtype=np.float64).reshape(-1,3)
+            faces = np.array(geometry.faces,dtype=np.int64).reshape(-1,3)
+            yield model.by_id(shape.id), vertices, faces
+            if not iterator.next():
+                break
+
+
+def sign_faces(model):
+    signs = model.by_type("IfcSign")
+    matrices = PlacementResolver(model).resolve([sign.ObjectPlacement for sign in signs])
+    matrix_of = {sign.id():matrix for sign, matrix in zip(signs,matrices)}
+    faces = []
+    for sign, vertices, triangles in _iterate_shapes(model,include=signs):
+        matrix = matrix_of[sign.id()]
+        targets = _face_targets(vertices,matrix)
+        faces.append(SignFace(sign.GlobalId,sign.Name,targets[0],matrix[:3,2],targets))
+    return faces
+
+
+def occluder_triangles(model,exclude_signs=True):
+    triangles = []
+    exclude = model.by_type("IfcSign") if exclude_signs else None
+    for element, vertices, faces in _iterate_shapes(model,exclude=exclude):
+        if len(faces):
+            triangles.append(vertices[faces])
+    return np.concatenate(triangles) if triangles else np.zeros((0,3,3))
+
+
+# state of each worker process, set once by _init_worker
+_worker = {}
+
+
+def _init_worker(path,bvh,settings):
+    _worker["path"] = path
+    _worker["bvh"] = bvh
+    _worker["settings"] = settings
+
+
+def _analyze_sign(face,path,bvh,settings):
+    eye_to_sign = face.center - path.points
+    distance = np.linalg.norm(eye_to_sign,axis=1)
+    safe_distance = np.maximum(distance,1e-9)
+    # within the field of view (horizontal angle from the direction of travel) and facing the driver
+    horizontal = eye_to_sign[:,:2]/np.maximum(np.linalg.norm(eye_to_sign[:,:2],axis=1),1e-9)[:,np.newaxis]
+    heading = path.directions[:,:2]/np.maximum(np.linalg.norm(path.directions[:,:2],axis=1),1e-9)[:,np.newaxis]
+    in_view = (horizontal*heading).sum(axis=1) >= math.cos(math.radians(settings.field_of_view))
+    facing = -(eye_to_sign @ face.normal)/safe_distance >= math.cos(math.radians(settings.max_view_angle))
+    candidates = np.flatnonzero((distance <= settings.sight_distance) & in_view & facing)
+
+    # all of the sight lines from the candidate eye points to the face targets
+    visible = np.zeros(len(path),dtype=bool)
+    target_count = len(face.targets)
+    origins = np.repeat(path.points[candidates],target_count,axis=0)
+    targets = np.tile(face.targets,(len(candidates),1))
+    clear = ~bvh.segments_blocked(origins,targets)
+    visible[candidates] = clear.reshape(len(candidates),target_count).mean(axis=1) >= settings.min_visible_fraction
+
+    nearest = int(np.argmin(distance))
+    spacing = np.diff(path.distances,append=path.distances[-1])
+    visible_distance = float(spacing[visible].sum())
+    approach = np.flatnonzero(visible[:nearest + 1])
+    first_sight_distance = float(path.distances[nearest] - path.distances[approach[0]]) if len(approach) else 0.
+    return {
+        "GlobalId":face.global_id,
+        "Name":face.name,
+        "NearestStation":float(path.stations[nearest]),
+        "NearestDistance":float(distance[nearest]),
+        "CandidatePoints":int(len(candidates)),
+        "VisiblePoints":int(visible.sum()),
+        "VisibleDistance":visible_distance,
+        "VisibleDuration":visible_distance/settings.speed,
+        "FirstSightDistance":first_sight_distance,
+        "Obstructed":bool(len(candidates) and visible.sum() < len(candidates)),
+    }
+
+
+def _analyze_signs(faces):
+    return [_analyze_sign(face,_worker["path"],_worker["bvh"],_worker["settings"]) for face in faces]
+
+
+def analyze_visibility(faces,path,occluders,settings=None,processes=None,chunk_size=16):
+    # returns one result dictionary per sign face, in the same order as faces
+    settings = settings if settings else VisibilitySettings()
+    bvh = occluders if isinstance(occluders,TriangleBVH) else TriangleBVH(occluders)
+    chunks = [faces[i:i + chunk_size] for i in range(0,len(faces),chunk_size)]
+    if processes == 1:
+        _init_worker(path,bvh,settings)
+        return [result for chunk in chunks for result in _analyze_signs(chunk)]
+    with concurrent.futures.ProcessPoolExecutor(max_workers=processes,initializer=_init_worker,initargs=(path,bvh,settings)) as executor:
+        return [result for results in executor.map(_analyze_signs,chunks) for result in results]
+
+
+def write_report(results,file_path):
+    if not results:
+        return
+    with open(file_path,mode='w',newline='',encoding='utf-8') as f:
+        writer = csv.DictWriter(f,fieldnames=list(results[0].keys()))
+        writer.writeheader()
+        writer.writerows(results)
+
+
+def _box_triangles(center,size):
+    # 12 triangles of an axis aligned box
+    corners = np.array([(x,y,z) for x in (-0.5,0.5) for y in (-0.5,0.5) for z in (-0.5,0.5)])*size + center
+    faces = [(0,1,3),(0,3,2),(4,6,7),(4,7,5),(0,4,5),(0,5,1),(2,3,7),(2,7,6),(0,2,6),(0,6,4),(1,5,7),(1,7,3)]
+    return corners[np.array(faces)]
+
+
+def _synthetic_corridor(length=52800.,sign_count=500,tree_count=5000,seed=0):
+    # a gently curving 10 mile road with signs on the right side facing traffic and trees along both sides
+    rng = np.random.default_rng(seed)
+    s = np.linspace(0.,length,2000)
+    road = np.column_stack((s,500.*np.sin(s/5000.)))
+    path = DriverPath.from_polyline(road,spacing=10.)
+
+    faces = []
+    for i, distance in enumerate(np.linspace(500.,length - 500.,sign_count)):
+        index = int(np.searchsorted(path.distances,distance))
+        direction = path.directions[index]
+        right = np.array((direction[1],-direction[0],0.))
+        center = path.points[index] + 20.*right + np.array((0.,0.,3.5))
+        normal = -direction
+        side = np.cross(normal,(0.,0.,1.))
+        targets = [center] + [center + sx*1.2*side + (0.,0.,sy*1.2) for sx in (-1.,1.) for sy in (-1.,1.)]
+        faces.append(SignFace(f"Sign {i}",f"{i} Synthetic",center,normal,targets))
+
+    trees = []
+    for distance in rng.uniform(0.,length,tree_count):
+        index = min(int(np.searchsorted(path.distances,distance)),len(path) - 1)
+        direction = path.directions[index]
+        right = np.array((direction[1],-direction[0],0.))
+        offset = rng.choice((-1.,1.))*rng.uniform(15.,80.)
+        center = path.points[index] + offset*right + np.array((0.,0.,10. - 3.5))
+        trees.append(_box_triangles(center,np.array((12.,12.,20.))))
+    return faces, path, np.concatenate(trees)
+
+
+def benchmark():
+    faces, path, occluders = _synthetic_corridor()
+    start = time.perf_counter()
+    bvh = TriangleBVH(occluders)
+    print(f"BVH of {len(occluders)} triangles built in {time.perf_counter() - start:.2f} s")
+    for processes in (1,None):
+        start = time.perf_counter()
+        results = analyze_visibility(faces,path,bvh,processes=processes)
+        label = "1 process" if processes == 1 else f"process pool ({os.cpu_count()} CPUs)"
+        print(f"{label}: {len(faces)} signs, {len(path)} eye points in {time.perf_counter() - start:.2f} s")
+    obstructed = sum(result["Obstructed"] for result in results)
+    print(f"{obstructed} signs are obstructed from part of the path, mean first sight distance {np.mean([result['FirstSightDistance'] for result in results]):.0f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sign visibility along an alignment")
+    parser.add_argument("signs",nargs="?",help="IFC model with the signs")
+    parser.add_argument("alignment",nargs="?",help="IFC model with the alignment")
+    parser.add_argument("name",nargs="?",help="name of the alignment")
+    parser.add_argument("--origin",type=float,nargs=2,default=(0.,0.),help="location of the start of the alignment in the sign model")
+    parser.add_argument("--rotation",type=float,default=0.,help="rotation of the alignment, degrees counterclockwise")
+    parser.add_argument("--spacing",type=float,default=10.,help="distance between eye points")
+    parser.add_argument("--occluders",nargs="*",default=[],help="IFC models with occluding products")
+    parser.add_argument("--report",default="visibility.csv")
+    args = parser.parse_args()
+
+    if args.signs and args.alignment and args.name:
+        model = ifcopenshell.open(args.signs)
+        faces = sign_faces(model)
+        path = DriverPath.from_alignment(args.alignment,args.name,args.spacing,origin=args.origin,rotation=args.rotation)
+        # other signs can block the view of a sign, so the signs are occluders too
+        occluders = [occluder_triangles(model,exclude_signs=False)] + [occluder_triangles(ifcopenshell.open(file_path)) for file_path in args.occluders]
+        results = analyze_visibility(faces,path,np.concatenate(occluders))
+        write_report(results,args.report)
+        print(f"{len(results)} signs, {sum(result['VisiblePoints'] > 0 for result in results)} visible from the path")
+    else:
+        benchmark()
+    print("Done")
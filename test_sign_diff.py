@@ -0,0 +1,50 @@
+"""
+Tests of sign_diff.py
+
+Richard Brice, PE
+WSDOT Bridge and Structures Office
+
+python -m pytest test_sign_diff.py
+"""
+
+import ifcopenshell
+import ifcopenshell.api.pset
+import ifcopenshell.api.unit
+from sign_diff import SignFingerprints, diff_fingerprints
+
+
+def _model(count,tsms=None):
+    # count signs named "<OBJECTID> Sign" with a WSDOT_Sign property set, and a WSDOT_TSMS property set on the signs in
+    # tsms ({index:route})
+    model = ifcopenshell.file(schema="IFC4X3")
+    model.createIfcProject(GlobalId=ifcopenshell.guid.new(),Name="Test")
+    ifcopenshell.api.unit.assign_unit(model,units=[ifcopenshell.api.unit.add_conversion_based_unit(model,name="foot")])
+    for i in range(count):
+        placement = model.createIfcLocalPlacement(RelativePlacement=model.createIfcAxis2Placement3D(Location=model.createIfcCartesianPoint((100.*i,0.,0.))))
+        sign = model.createIfcSign(GlobalId=ifcopenshell.guid.new(),Name=f"{i} Sign",ObjectPlacement=placement)
+        pset = ifcopenshell.api.pset.add_pset(model,product=sign,name="WSDOT_Sign")
+        ifcopenshell.api.pset.edit_pset(model,pset=pset,properties={"Text":f"Sign {i}"})
+        if tsms and i in tsms:
+            pset = ifcopenshell.api.pset.add_pset(model,product=sign,name="WSDOT_TSMS")
+            ifcopenshell.api.pset.edit_pset(model,pset=pset,properties={"Route":tsms[i]})
+    return model
+
+
+def test_different_property_sets():
+    # a model built with the TSMS inventory has a property column the other model doesn't have. only the signs whose
+    # properties differ are re-attributed
+    old = SignFingerprints.from_model(_model(20))
+    new = SignFingerprints.from_model(_model(20,tsms={3:"104"}))
+    assert len(old.property_columns) < len(new.property_columns)
+    diff = diff_fingerprints(old,new)
+    assert len(diff.matched) == 20
+    assert [(old_index,new_index) for old_index, new_index, changed in diff.reattributed] == [(3,3)]
+    assert [changed for old_index, new_index, changed in diff.reattributed] == [["WSDOT_TSMS.Route"]]
+
+
+def test_same_properties():
+    old = SignFingerprints.from_model(_model(20,tsms={3:"104"}))
+    new = SignFingerprints.from_model(_model(20,tsms={3:"104"}))
+    diff = diff_fingerprints(old,new)
+    assert len(diff.matched) == 20
+    assert not diff.reattributed and not diff.moved and not diff.retyped